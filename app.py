@@ -1,15 +1,60 @@
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, Request, Response, request, jsonify, send_file, send_from_directory, stream_with_context
 import os
+import re
 import uuid
+import time
+import gzip
+import hashlib
+import html
+import io
+import multiprocessing
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import textwrap
+import threading
+import wave
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 import mimetypes
 from werkzeug.utils import secure_filename
 from openai import OpenAI
 import json
+import math
 import base64
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
+try:
+    from PIL import Image, ImageDraw, ImageFont, ImageOps
+except ImportError:  # Images are sent to the vision model unprocessed
+    Image = None
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # PDF thumbnails show a text preview instead of the rendered page
+    pdfium = None
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # PDF text is not extracted
+    PdfReader = None
+
+try:
+    from docx import Document as DocxDocument
+except ImportError:  # DOCX text is not extracted
+    DocxDocument = None
+
+try:
+    import brotli
+except ImportError:  # The frontend is served gzip-compressed only
+    brotli = None
+
 # Load environment variables for Databricks
 load_dotenv(r'C:\Users\ma913852\OneDrive - BioMarin\Documents\projects\env_audit_poc.example')  # Specify the file path
 
@@ -18,32 +63,70 @@ app = Flask(__name__)
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 AUDIO_FOLDER = 'audio_uploads'
+DATA_FOLDER = 'data'
+DATABASE_PATH = os.getenv('AUDIT_DB_PATH', os.path.join(DATA_FOLDER, 'audit_poc.db'))
 ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx'}
 ALLOWED_AUDIO_EXTENSIONS = {'webm', 'wav', 'mp3', 'ogg', 'm4a'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 MAX_AUDIO_SIZE = 50 * 1024 * 1024  # 50MB
+UPLOAD_SPOOL_MAX_BYTES = int(os.getenv('UPLOAD_SPOOL_MAX_MB', 8)) * 1024 * 1024  # Larger uploads spill to disk
+AUDIO_STREAM_CHUNK_BYTES = 3 * 64 * 1024  # Multiple of 3 so base64 chunks concatenate cleanly
 
 # Ensure upload directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(AUDIO_FOLDER, exist_ok=True)
+os.makedirs(DATA_FOLDER, exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['AUDIO_FOLDER'] = AUDIO_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_AUDIO_SIZE
 
+class HashingSpooledFile(tempfile.SpooledTemporaryFile):
+    """Spooled upload that updates a SHA-256 as the request body is written into it"""
+    
+    def __init__(self, max_size):
+        super().__init__(max_size=max_size, mode='w+b')
+        self.sha256 = hashlib.sha256()
+    
+    def write(self, s):
+        self.sha256.update(s)
+        return super().write(s)
+
+class SpooledRequest(Request):
+    """Keeps small file uploads in memory and spills larger ones to a temp file, hashing them on the way"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingSpooledFile(UPLOAD_SPOOL_MAX_BYTES)
+
+app.request_class = SpooledRequest
+
 # Databricks Configuration
 DATABRICKS_HOST = os.getenv("DATABRICKS_HOST")
 DATABRICKS_TOKEN = os.getenv("DATABRICKS_TOKEN")
 WHISPER_HOST = os.getenv("WHISPER_HOST")
+CLAUDE_MODEL = "databricks-claude-sonnet-4"  # Databricks model name
+
+# Connection pools for the Databricks endpoints; size them to the number of
+# concurrent upstream calls (request threads + job workers + segment workers)
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 16))
+HTTP_KEEPALIVE_SECONDS = int(os.getenv('HTTP_KEEPALIVE_SECONDS', 60))
 
 # Initialize OpenAI client for Databricks Claude
 client = OpenAI(
     api_key=DATABRICKS_TOKEN,
-    base_url=DATABRICKS_HOST
+    base_url=DATABRICKS_HOST,
+    http_client=httpx.Client(limits=httpx.Limits(
+        max_connections=HTTP_POOL_SIZE,
+        max_keepalive_connections=HTTP_POOL_SIZE,
+        keepalive_expiry=HTTP_KEEPALIVE_SECONDS
+    ))
 )
 
-# Note: Whisper uses direct HTTP requests with dataframe_split format
-# No separate client initialization needed
+# Whisper uses direct HTTP requests with dataframe_split format, over a shared
+# session so connections (and TLS handshakes) are reused between calls
+whisper_session = requests.Session()
+whisper_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE))
+whisper_session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE))
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
@@ -59,22 +142,769 @@ def get_file_size_mb(file_path):
     """Get file size in MB"""
     return round(os.path.getsize(file_path) / (1024 * 1024), 1)
 
-def generate_thumbnail_path(file_path):
-    """Generate thumbnail path for document preview"""
-    # In a real application, you would generate actual thumbnails
-    # For now, we'll return placeholder URLs
-    base_name = os.path.splitext(os.path.basename(file_path))[0]
-    ext = os.path.splitext(file_path)[1].lower()
-    
-    # Generate different colored placeholders based on file type
-    colors = {
-        '.pdf': '0D47A1',
-        '.doc': '2D3748', 
-        '.docx': '4A5568'
+def categorize_document(filename):
+    """Guess the document category from keywords in its filename"""
+    filename_lower = filename.lower()
+    if 'master' in filename_lower or 'site' in filename_lower:
+        return 'Site Master File'
+    elif 'sop' in filename_lower:
+        if 'gown' in filename_lower or 'asep' in filename_lower:
+            return 'Aseptic Process SOPs'
+        else:
+            return 'Quality System SOPs'
+    elif 'batch' in filename_lower or 'mbr' in filename_lower:
+        return 'Aseptic Process SOPs'
+    else:
+        return 'Other Documents'
+
+def generate_thumbnail_path(filename, sha256):
+    """Thumbnail URL for a document; serves a local placeholder until the thumbnail is rendered"""
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    return f"/api/thumbnails/{thumbnail_key(sha256)}?type={extension}"
+
+# ============================================================================
+# PERSISTENT STORAGE
+# ============================================================================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS response_cache (
+    namespace   TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    value       TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    created_at  REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS idx_response_cache_lru ON response_cache (namespace, last_access);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    payload     TEXT NOT NULL,
+    result      TEXT,
+    error       TEXT,
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+
+CREATE TABLE IF NOT EXISTS observations (
+    id                    TEXT PRIMARY KEY,
+    seq                   INTEGER NOT NULL UNIQUE,
+    linked_requirement_id TEXT,
+    compliance_status     TEXT,
+    severity              TEXT,
+    category              TEXT,
+    status_rank           INTEGER NOT NULL DEFAULT 0,
+    severity_rank         INTEGER NOT NULL DEFAULT 0,
+    data                  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_observations_requirement ON observations (linked_requirement_id);
+CREATE INDEX IF NOT EXISTS idx_observations_status ON observations (compliance_status, seq);
+CREATE INDEX IF NOT EXISTS idx_observations_severity ON observations (severity, seq);
+CREATE INDEX IF NOT EXISTS idx_observations_category ON observations (category, seq);
+
+CREATE TABLE IF NOT EXISTS observation_requirements (
+    requirement_id TEXT NOT NULL,
+    observation_id TEXT NOT NULL,
+    PRIMARY KEY (requirement_id, observation_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_observation_requirements_observation ON observation_requirements (observation_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS observation_search USING fts5(
+    observation_text,
+    audio_transcription,
+    handwritten_transcription,
+    image_description,
+    tokenize = 'porter unicode61 remove_diacritics 2'
+);
+
+CREATE TABLE IF NOT EXISTS documents (
+    id          TEXT PRIMARY KEY,
+    filename    TEXT NOT NULL UNIQUE,
+    title       TEXT NOT NULL,
+    category    TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    mtime       REAL NOT NULL,
+    sha256      TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    uploaded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_category ON documents (category, uploaded_at);
+CREATE INDEX IF NOT EXISTS idx_documents_sha256 ON documents (sha256);
+
+CREATE TABLE IF NOT EXISTS document_text (
+    sha256       TEXT PRIMARY KEY,
+    status       TEXT NOT NULL,
+    pages        INTEGER NOT NULL,
+    chars        INTEGER NOT NULL,
+    chunks       INTEGER NOT NULL,
+    error        TEXT,
+    seconds      REAL,
+    extracted_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS document_chunks (
+    sha256      TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    page        INTEGER NOT NULL,
+    text        TEXT NOT NULL,
+    PRIMARY KEY (sha256, chunk_index)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id          TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    filename    TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    chunk_size  INTEGER NOT NULL,
+    received    INTEGER NOT NULL,
+    sha256      TEXT,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS counters (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+_db_local = threading.local()
+
+def get_db():
+    """Get the SQLite connection for the current thread (opened on first use)"""
+    conn = getattr(_db_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DATABASE_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _db_local.conn = conn
+    return conn
+
+def init_db():
+    """Create tables and indexes if they don't exist yet"""
+    db = get_db()
+    db.executescript(SCHEMA)
+    # Databases created before observations were sortable by rank get the columns added
+    columns = {row['name'] for row in db.execute('PRAGMA table_info(observations)')}
+    for column in ('status_rank', 'severity_rank'):
+        if column not in columns:
+            db.execute(f'ALTER TABLE observations ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_observations_status_rank ON observations (status_rank, seq)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_observations_severity_rank ON observations (severity_rank, seq)')
+    db.commit()
+
+init_db()
+
+# ============================================================================
+# RESPONSE CACHE
+# ============================================================================
+
+REQUIREMENTS_CACHE_TTL = int(os.getenv('REQUIREMENTS_CACHE_TTL', 7 * 24 * 3600))  # 7 days
+REQUIREMENTS_CACHE_MAX_BYTES = int(os.getenv('REQUIREMENTS_CACHE_MAX_MB', 20)) * 1024 * 1024
+
+# Bump when build_requirements_prompt() changes so stale answers are not reused
+REQUIREMENTS_PROMPT_VERSION = 1
+
+class ResponseCache:
+    """
+    Persistent LRU cache with TTL and a size cap, backed by the response_cache table
+
+    Each cache instance owns one namespace, so different kinds of responses
+    are evicted and counted independently. Values must be JSON-serializable.
+    """
+
+    def __init__(self, namespace, ttl_seconds, max_bytes):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss or expired entry"""
+        db = get_db()
+        now = time.time()
+        row = db.execute(
+            'SELECT value, created_at FROM response_cache WHERE namespace = ? AND key = ?',
+            (self.namespace, key)
+        ).fetchone()
+
+        if row is not None and now - row['created_at'] > self.ttl_seconds:
+            with db:
+                db.execute('DELETE FROM response_cache WHERE namespace = ? AND key = ?',
+                           (self.namespace, key))
+            row = None
+
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with db:
+            db.execute('UPDATE response_cache SET last_access = ? WHERE namespace = ? AND key = ?',
+                       (now, self.namespace, key))
+        with self._lock:
+            self.hits += 1
+        return json.loads(row['value'])
+
+    def put(self, key, value):
+        """Store value under key, then evict expired and least recently used entries"""
+        payload = json.dumps(value)
+        size = len(payload.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        db = get_db()
+        now = time.time()
+        with db:
+            db.execute(
+                'INSERT OR REPLACE INTO response_cache (namespace, key, value, size, created_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (self.namespace, key, payload, size, now, now)
+            )
+            self._evict(db, now)
+
+    def _evict(self, db, now):
+        expired = db.execute(
+            'DELETE FROM response_cache WHERE namespace = ? AND created_at < ?',
+            (self.namespace, now - self.ttl_seconds)
+        ).rowcount
+        evicted = expired
+
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM response_cache WHERE namespace = ?',
+                           (self.namespace,)).fetchone()[0]
+        if total > self.max_bytes:
+            rows = db.execute(
+                'SELECT key, size FROM response_cache WHERE namespace = ? ORDER BY last_access ASC',
+                (self.namespace,)
+            ).fetchall()
+            for row in rows:
+                if total <= self.max_bytes:
+                    break
+                db.execute('DELETE FROM response_cache WHERE namespace = ? AND key = ?',
+                           (self.namespace, row['key']))
+                total -= row['size']
+                evicted += 1
+
+        if evicted:
+            with self._lock:
+                self.evictions += evicted
+
+    def stats(self):
+        """Hit/miss counters for this process plus current entry count and size"""
+        row = get_db().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache WHERE namespace = ?',
+            (self.namespace,)
+        ).fetchone()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': row[0],
+                'size_bytes': row[1],
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+requirements_cache = ResponseCache('requirements', REQUIREMENTS_CACHE_TTL, REQUIREMENTS_CACHE_MAX_BYTES)
+
+def requirements_cache_key(audit_scope):
+    """
+    Hash the parts of an audit scope that shape the requirements prompt
+
+    List fields are de-duplicated and sorted and whitespace is collapsed, so the
+    same scope submitted with areas in a different order hits the same entry.
+    """
+    def normalize_text(value):
+        return ' '.join(str(value).split()) if value else ''
+
+    def normalize_list(values):
+        if isinstance(values, str):
+            values = [values]
+        return sorted({normalize_text(v) for v in values or [] if normalize_text(v)})
+
+    canonical = {
+        'prompt_version': REQUIREMENTS_PROMPT_VERSION,
+        'model': CLAUDE_MODEL,
+        'facility': normalize_text(audit_scope.get('facility')),
+        'products': normalize_text(audit_scope.get('products')),
+        'time_period': normalize_text(audit_scope.get('time_period')),
+        'process_areas': normalize_list(audit_scope.get('process_areas')),
+        'key_systems': normalize_list(audit_scope.get('key_systems')),
+        'regulatory_requirements': normalize_list(audit_scope.get('regulatory_requirements'))
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode('utf-8')).hexdigest()
+
+TRANSCRIPTION_CACHE_TTL = int(os.getenv('TRANSCRIPTION_CACHE_TTL', 30 * 24 * 3600))  # 30 days
+TRANSCRIPTION_CACHE_MAX_BYTES = int(os.getenv('TRANSCRIPTION_CACHE_MAX_MB', 10)) * 1024 * 1024
+
+# Bump when the Whisper request/segmentation or HANDWRITING_PROMPT changes
+AUDIO_TRANSCRIPTION_VERSION = 1
+HANDWRITING_PROMPT_VERSION = 1
+
+audio_transcription_cache = ResponseCache('audio_transcriptions', TRANSCRIPTION_CACHE_TTL,
+                                          TRANSCRIPTION_CACHE_MAX_BYTES)
+handwriting_transcription_cache = ResponseCache('handwriting_transcriptions', TRANSCRIPTION_CACHE_TTL,
+                                                TRANSCRIPTION_CACHE_MAX_BYTES)
+
+def transcription_cache_key(content_sha256, *model_settings):
+    """Key a transcription by the SHA-256 of the raw media bytes and the settings that shape the output"""
+    canonical = json.dumps([content_sha256, *model_settings])
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def sha256_stream(stream, chunk_size=1024 * 1024):
+    """SHA-256 of a seekable binary stream, read in chunks; the stream is rewound afterwards"""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def upload_sha256(stream):
+    """SHA-256 of an uploaded file: the digest kept while it was spooled, or read from the stream"""
+    digest = getattr(stream, 'sha256', None)
+    return digest.hexdigest() if digest is not None else sha256_stream(stream)
+
+def sha256_base64_image(image_base64):
+    """SHA-256 of the decoded image bytes, so a data URI and bare base64 of one image match"""
+    if image_base64.startswith('data:'):
+        image_base64 = image_base64.split(',', 1)[1]
+    return hashlib.sha256(base64.b64decode(image_base64)).hexdigest()
+
+def cached_transcription(cache, key, transcribe):
+    """Return (transcription, cached), calling transcribe() and storing its result on a miss"""
+    hit = cache.get(key)
+    if hit is not None:
+        return hit['transcription'], True
+    transcription = transcribe()
+    cache.put(key, {'transcription': transcription})
+    return transcription, False
+
+def is_truthy(value):
+    """Interpret query string flags like ?refresh=true"""
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+# ============================================================================
+# IMAGE PREPROCESSING
+# ============================================================================
+
+# Camera photos are decoded, EXIF-oriented, downscaled and re-encoded as JPEG
+# without metadata before vision calls. Handwriting needs more pixels to stay
+# legible; 1568 px is the largest edge the model uses without resizing itself.
+IMAGE_PROFILES = {
+    'analysis': {
+        'max_edge': int(os.getenv('IMAGE_ANALYSIS_MAX_EDGE', 1024)),
+        'quality': int(os.getenv('IMAGE_ANALYSIS_QUALITY', 80))
+    },
+    'handwriting': {
+        'max_edge': int(os.getenv('IMAGE_HANDWRITING_MAX_EDGE', 1568)),
+        'quality': int(os.getenv('IMAGE_HANDWRITING_QUALITY', 90))
+    }
+}
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 4))
+IMAGE_MAX_PER_ANALYSIS = int(os.getenv('IMAGE_MAX_PER_ANALYSIS', 5))
+IMAGE_DUPLICATE_DISTANCE = int(os.getenv('IMAGE_DUPLICATE_DISTANCE', 6))  # Differing bits of 64 in the dHash
+IMAGE_UPLINK_MBPS = float(os.getenv('IMAGE_UPLINK_MBPS', 10))  # For the latency-saved estimate
+
+# Pillow releases the GIL while decoding, resizing and encoding, so threads run in parallel
+image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='image')
+
+def difference_hash(img):
+    """
+    64-bit perceptual difference hash (dHash) as 16 hex digits
+    
+    The image is reduced to 9x8 grayscale and each bit records whether a pixel
+    is brighter than its right neighbour, so re-shot or re-compressed photos of
+    the same scene land within a few bits of each other.
+    """
+    pixels = list(img.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f'{bits:016x}'
+
+def hash_distance(a, b):
+    """Number of differing bits between two difference hashes"""
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+def select_images(reports, max_images):
+    """
+    Choose which preprocessed images to send to the vision model
+    
+    Images within IMAGE_DUPLICATE_DISTANCE of an earlier kept image are dropped
+    as near-duplicates. If more than max_images remain, the most visually
+    diverse subset is picked greedily: starting from the first image, each
+    step adds the image farthest (by hash distance) from those already chosen.
+    Images without a hash (not decodable) are never treated as duplicates.
+    Returns (sent indexes in original order, list of skipped entries).
+    """
+    kept, skipped = [], []
+    for index, report in enumerate(reports):
+        duplicate_of = None
+        if report.get('dhash'):
+            for other in kept:
+                if reports[other].get('dhash'):
+                    distance = hash_distance(report['dhash'], reports[other]['dhash'])
+                    if distance <= IMAGE_DUPLICATE_DISTANCE:
+                        duplicate_of = other
+                        break
+        if duplicate_of is None:
+            kept.append(index)
+        else:
+            skipped.append({'index': index, 'reason': 'duplicate', 'duplicate_of': duplicate_of,
+                            'distance': distance})
+    
+    if len(kept) > max_images:
+        def spread(a, b):
+            if reports[a].get('dhash') and reports[b].get('dhash'):
+                return hash_distance(reports[a]['dhash'], reports[b]['dhash'])
+            return 64
+        
+        chosen = [kept[0]]
+        candidates = kept[1:]
+        while len(chosen) < max_images:
+            best = max(candidates, key=lambda c: min(spread(c, s) for s in chosen))
+            chosen.append(best)
+            candidates.remove(best)
+        skipped.extend({'index': index, 'reason': 'image_limit'} for index in candidates)
+        kept = sorted(chosen)
+    
+    return kept, sorted(skipped, key=lambda entry: entry['index'])
+
+def preprocess_image(image_base64, profile):
+    """
+    Prepare one base64 image (with or without data URI prefix) for a vision call
+    
+    Returns (data URI, report). When Pillow is missing or the image cannot be
+    decoded, the original is returned unchanged and report['processed'] is False.
+    """
+    started = time.perf_counter()
+    encoded = image_base64.split(',', 1)[1] if image_base64.startswith('data:') else image_base64
+    original = base64.b64decode(encoded)
+    report = {'original_bytes': len(original), 'processed_bytes': len(original), 'processed': False}
+    
+    if Image is None:
+        return image_base64, report
+    
+    settings = IMAGE_PROFILES[profile]
+    try:
+        with Image.open(io.BytesIO(original)) as img:
+            report['original_size'] = list(img.size)
+            # Let libjpeg decode at a reduced scale (1/2 .. 1/8) that still covers max_edge
+            img.draft('RGB', (settings['max_edge'], settings['max_edge']))
+            img = ImageOps.exif_transpose(img)
+            if img.mode in ('RGBA', 'LA', 'P'):
+                # Flatten transparency onto white; JPEG has no alpha channel
+                rgba = img.convert('RGBA')
+                img = Image.new('RGB', rgba.size, (255, 255, 255))
+                img.paste(rgba, mask=rgba.getchannel('A'))
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+            img.thumbnail((settings['max_edge'], settings['max_edge']), Image.LANCZOS)
+            report['dhash'] = difference_hash(img)
+            
+            # No exif/icc arguments, so metadata (GPS, device) is dropped
+            buffer = io.BytesIO()
+            img.save(buffer, format='JPEG', quality=settings['quality'], optimize=True)
+            report['size'] = list(img.size)
+    except Exception as e:
+        print(f"Image preprocessing skipped: {e}")
+        return image_base64, report
+    
+    processed = buffer.getvalue()
+    report.update({
+        'processed_bytes': len(processed),
+        'processed': True,
+        'ms': round((time.perf_counter() - started) * 1000, 1)
+    })
+    return 'data:image/jpeg;base64,' + base64.b64encode(processed).decode('ascii'), report
+
+def preprocess_images(images_base64, profile):
+    """
+    Preprocess images on image_executor, keeping their order
+    
+    Returns (images, report) where report totals bytes before and after,
+    the wall time spent, and an estimate of upload time saved at
+    IMAGE_UPLINK_MBPS net of that preprocessing time.
+    """
+    started = time.perf_counter()
+    results = list(image_executor.map(lambda image: preprocess_image(image, profile), images_base64))
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    
+    original_bytes = sum(r['original_bytes'] for _, r in results)
+    processed_bytes = sum(r['processed_bytes'] for _, r in results)
+    # Base64 in the JSON body inflates the upload by 4/3
+    upload_ms_saved = (original_bytes - processed_bytes) * 4 / 3 * 8 / (IMAGE_UPLINK_MBPS * 1000)
+    report = {
+        'profile': profile,
+        'images': [r for _, r in results],
+        'original_bytes': original_bytes,
+        'processed_bytes': processed_bytes,
+        'bytes_saved': original_bytes - processed_bytes,
+        'preprocess_ms': round(elapsed_ms, 1),
+        'estimated_latency_saved_ms': round(upload_ms_saved - elapsed_ms, 1)
     }
+    print(f"Preprocessed {len(results)} image(s) [{profile}]: {original_bytes:,} -> {processed_bytes:,} bytes "
+          f"in {elapsed_ms:.0f} ms (est. {report['estimated_latency_saved_ms']:.0f} ms saved)")
+    return [image for image, _ in results], report
+
+# ============================================================================
+# REQUIREMENT RELEVANCE RANKING
+# ============================================================================
+
+# Requirements sent with each observation analysis; 0 sends the full list
+ANALYSIS_REQUIREMENTS_TOP_K = int(os.getenv('ANALYSIS_REQUIREMENTS_TOP_K', 15))
+REQUIREMENT_INDEX_CACHE_SIZE = 32
+
+RANKING_STOPWORDS = frozenset(
+    'a an and are as at be been being by for from has have in is it its of on or that the this to '
+    'was were with which all any must should shall may during per'.split()
+)
+
+# Suffix rewrites for a light stemmer, so calibrated/calibration, gasket/gaskets and
+# sanitising/sanitization meet; the longest matching suffix wins
+STEM_RULES = sorted([
+    ('ifications', 'ify'), ('ification', 'ify'), ('ified', 'ify'), ('ifies', 'ify'),
+    ('isations', 'iz'), ('izations', 'iz'), ('isation', 'iz'), ('ization', 'iz'),
+    ('ising', 'iz'), ('izing', 'iz'), ('ised', 'iz'), ('ized', 'iz'), ('ises', 'iz'), ('izes', 'iz'),
+    ('ise', 'iz'), ('ize', 'iz'),
+    ('ations', 'at'), ('ation', 'at'), ('ated', 'at'), ('ating', 'at'), ('ates', 'at'), ('ate', 'at'),
+    ('sses', 'ss'), ('ches', 'ch'), ('shes', 'sh'), ('xes', 'x'), ('ies', 'y'),
+    ('ing', ''), ('ed', ''), ('s', '')
+], key=lambda rule: -len(rule[0]))
+
+def stem_token(token):
+    if token[0].isdigit():
+        return token
+    for suffix, replacement in STEM_RULES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            if suffix == 's' and token.endswith(('ss', 'us', 'is')):
+                break
+            token = token[:-len(suffix)] + replacement
+            break
+    return token[:-1] if len(token) > 4 and token.endswith('e') else token
+
+def tokenize_for_ranking(text):
+    """Lowercase, stemmed word tokens; citation numbers like 211.42 and 4.29 stay whole"""
+    return [stem_token(token) for token in re.findall(r'[a-z0-9]+(?:\.[a-z0-9]+)*', str(text).lower())
+            if token not in RANKING_STOPWORDS]
+
+class RequirementIndex:
+    """
+    BM25 index over one requirement list
+    
+    Each requirement is indexed by its text, category and citation. Build it
+    once per requirement set with requirement_index() and reuse it for every
+    observation analysed against that set.
+    """
+    
+    K1 = 1.2
+    B = 0.75
+    
+    def __init__(self, requirements):
+        self.requirements = requirements
+        self.postings = {}
+        self.lengths = []
+        for position, req in enumerate(requirements):
+            terms = Counter(tokenize_for_ranking(' '.join([
+                req.get('requirement_text (verbatim)') or req.get('requirement_text', ''),
+                req.get('category', ''),
+                req.get('citation') or req.get('regulation_name', '')
+            ])))
+            self.lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, []).append((position, frequency))
+        
+        count = len(requirements)
+        self.average_length = (sum(self.lengths) / count) if count else 0
+        self.idf = {term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+                    for term, docs in self.postings.items()}
+    
+    def top_k(self, query, k):
+        """
+        Return the k most relevant requirements for query, best first
+        
+        Ties (including requirements with no matching terms) keep list order,
+        so the result is deterministic.
+        """
+        scores = [0.0] * len(self.requirements)
+        for term in set(tokenize_for_ranking(query)):
+            for position, frequency in self.postings.get(term, ()):
+                norm = 1 - self.B + self.B * self.lengths[position] / (self.average_length or 1)
+                scores[position] += self.idf[term] * frequency * (self.K1 + 1) / (frequency + self.K1 * norm)
+        
+        ranked = sorted(range(len(scores)), key=lambda position: (-scores[position], position))
+        return [self.requirements[position] for position in ranked[:k]]
+
+_requirement_indexes = OrderedDict()
+_requirement_indexes_lock = threading.Lock()
+
+def requirement_index(requirements):
+    """Return the RequirementIndex for this requirement set, building it on first use"""
+    key = hashlib.sha256(json.dumps(requirements, sort_keys=True).encode('utf-8')).hexdigest()
+    with _requirement_indexes_lock:
+        index = _requirement_indexes.get(key)
+        if index is not None:
+            _requirement_indexes.move_to_end(key)
+            return index
     
-    color = colors.get(ext, '718096')
-    return f"https://placehold.co/300x400/{color}/FFFFFF?text={base_name.replace(' ', '+')}"
+    index = RequirementIndex(requirements)
+    with _requirement_indexes_lock:
+        _requirement_indexes[key] = index
+        while len(_requirement_indexes) > REQUIREMENT_INDEX_CACHE_SIZE:
+            _requirement_indexes.popitem(last=False)
+    return index
+
+def select_relevant_requirements(requirements, query, k=None):
+    """
+    Narrow the requirement list to the k most relevant to an observation
+    
+    Returns (requirements to send, report). The full list is returned when it
+    already fits in k, when k is 0, or when the observation has no text to rank by
+    (e.g. images only).
+    """
+    k = ANALYSIS_REQUIREMENTS_TOP_K if k is None else k
+    report = {'total': len(requirements), 'top_k': k}
+    if not k or len(requirements) <= k or not tokenize_for_ranking(query):
+        report['sent'] = len(requirements)
+        return requirements, report
+    
+    selected = requirement_index(requirements).top_k(query, k)
+    report['sent'] = len(selected)
+    report['ids'] = [req.get('id') for req in selected]
+    return selected, report
+
+# ============================================================================
+# TOKEN BUDGETS
+# ============================================================================
+
+MODEL_CONTEXT_TOKENS = int(os.getenv('MODEL_CONTEXT_TOKENS', 200000))
+CHARS_PER_TOKEN = 3.5  # Slightly pessimistic for English prose and JSON
+
+# Input limits per endpoint; output sizes are worked out per request below
+TOKEN_BUDGETS = {
+    'requirements': {'max_input_tokens': int(os.getenv('REQUIREMENTS_MAX_INPUT_TOKENS', 8000))},
+    'analysis': {'max_input_tokens': int(os.getenv('ANALYSIS_MAX_INPUT_TOKENS', 12000))}
+}
+REQUIREMENTS_PER_RESPONSE = 10  # build_requirements_prompt asks for 10
+# Requirements keep the ceiling they always had: the model stops at the end of the JSON, and a
+# tighter cap would leave long requirement sets to the truncation salvage
+REQUIREMENTS_MAX_OUTPUT_TOKENS = int(os.getenv('REQUIREMENTS_MAX_OUTPUT_TOKENS', 40000))
+ANALYSIS_OUTPUT_TOKENS = 2000
+ANALYSIS_OUTPUT_TOKENS_PER_IMAGE = 400  # visual_findings grows with each image
+ANALYSIS_MAX_OUTPUT_TOKENS = 4000
+
+def estimate_tokens(text):
+    """Rough token count for text; no tokenizer is available for the served model"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def estimate_image_tokens(size=None):
+    """Vision tokens for an image of (width, height); the model bills about w*h/750, capped near 1600"""
+    if not size:
+        return 1600
+    return min(math.ceil(size[0] * size[1] / 750), 1600)
+
+def truncate_text(text, max_chars):
+    """Cut text at a word boundary to at most max_chars, marking the cut"""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max(max_chars, 0)].rsplit(' ', 1)[0]
+    return cut + ' …[trimmed]'
+
+class TokenBudget:
+    """
+    Input/output token budget for one prompt
+    
+    Prompt builders hand fit() a render function and their trim steps, lowest
+    priority first. Steps run in that fixed order until the estimate fits
+    max_input_tokens, so the same inputs always produce the same prompt.
+    max_tokens is the requested output size, reduced if the context window
+    would overflow. report() records every decision for logs and responses.
+    """
+    
+    def __init__(self, endpoint, output_tokens, extra_input_tokens=0):
+        self.endpoint = endpoint
+        self.max_input_tokens = TOKEN_BUDGETS[endpoint]['max_input_tokens']
+        self.output_tokens = output_tokens
+        self.extra_input_tokens = extra_input_tokens  # e.g. images
+        self.input_tokens = 0
+        self.original_input_tokens = 0
+        self.trimmed = []
+    
+    def estimate(self, prompt):
+        return estimate_tokens(prompt) + self.extra_input_tokens
+    
+    def fit(self, render, steps):
+        """
+        Render the prompt and trim until it fits
+        
+        steps is a list of (section name, trim) pairs; trim(overflow_tokens)
+        shortens its section in place and returns False once it cannot shrink
+        any further.
+        """
+        prompt = render()
+        self.original_input_tokens = self.estimate(prompt)
+        for name, trim in steps:
+            before = self.estimate(prompt)
+            while self.estimate(prompt) > self.max_input_tokens and trim(self.estimate(prompt) - self.max_input_tokens):
+                prompt = render()
+            if self.estimate(prompt) < before:
+                self.trimmed.append({'section': name, 'tokens_removed': before - self.estimate(prompt)})
+        self.input_tokens = self.estimate(prompt)
+        return prompt
+    
+    @property
+    def max_tokens(self):
+        return max(min(self.output_tokens, MODEL_CONTEXT_TOKENS - self.input_tokens), 1)
+    
+    def report(self):
+        return {
+            'endpoint': self.endpoint,
+            'input_tokens_estimate': self.input_tokens,
+            'input_tokens_before_trimming': self.original_input_tokens,
+            'max_input_tokens': self.max_input_tokens,
+            'within_budget': self.input_tokens <= self.max_input_tokens,
+            'max_tokens': self.max_tokens,
+            'trimmed': self.trimmed
+        }
+    
+    def log(self):
+        trimmed = ', '.join(f"{t['section']} -{t['tokens_removed']}" for t in self.trimmed) or 'nothing trimmed'
+        print(f"Token budget [{self.endpoint}]: ~{self.input_tokens} input tokens "
+              f"(limit {self.max_input_tokens}), max_tokens={self.max_tokens}, {trimmed}")
+
+def shrink_list(items, minimum):
+    """Trim step that drops the last item of a list while more than minimum remain"""
+    def trim(overflow):
+        if len(items) <= minimum:
+            return False
+        items.pop()
+        return True
+    return trim
+
+def shrink_text(state, key, floor_tokens):
+    """Trim step that shortens state[key] by the overflow, but not below floor_tokens"""
+    def trim(overflow):
+        text = state[key]
+        limit = max(len(text) - int((overflow + 1) * CHARS_PER_TOKEN), int(floor_tokens * CHARS_PER_TOKEN))
+        if not text or len(text) <= limit or text.endswith('…[trimmed]'):
+            return False
+        state[key] = truncate_text(text, limit)
+        return True
+    return trim
 
 # ============================================================================
 # LLM REQUIREMENT GENERATION FUNCTIONS
@@ -85,7 +915,7 @@ def call_claude(prompt, max_tokens=40000):
     print (prompt)
     try:
         response = client.chat.completions.create(
-            model="databricks-claude-sonnet-4",  # Databricks model name
+            model=CLAUDE_MODEL,
             messages=[
                 {"role": "user", "content": prompt}
             ],
@@ -100,6 +930,31 @@ def call_claude(prompt, max_tokens=40000):
         print(f"Error calling Databricks Claude via OpenAI client: {e}")
         raise
 
+def call_claude_stream(prompt, max_tokens=40000):
+    """
+    Call Databricks Claude Sonnet 4 with streaming enabled
+    
+    Yields text deltas as they arrive instead of waiting for the full completion.
+    """
+    try:
+        stream = client.chat.completions.create(
+            model=CLAUDE_MODEL,
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens,
+            temperature=0.3,
+            timeout=60,
+            stream=True
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        
+    except Exception as e:
+        print(f"Error streaming from Databricks Claude via OpenAI client: {e}")
+        raise
+
 def call_claude_with_vision(prompt, image_base64, max_tokens=4000):
     """
     Call Databricks Claude Sonnet 4 with vision capabilities (single image)
@@ -165,7 +1020,7 @@ def call_claude_with_multiple_images(prompt, images_base64, max_tokens=4000):
         # Use Anthropic message format with vision
         # The OpenAI client for Databricks should support this format
         response = client.chat.completions.create(
-            model="databricks-claude-sonnet-4",
+            model=CLAUDE_MODEL,
             messages=[{
                 "role": "user",
                 "content": content
@@ -185,7 +1040,33 @@ def call_claude_with_multiple_images(prompt, images_base64, max_tokens=4000):
         print(traceback.format_exc())
         raise
 
-def build_requirements_prompt(audit_scope):
+def build_requirements_prompt(audit_scope, budget=None, received=None):
+    """
+    Build the requirements prompt within the 'requirements' token budget
+    
+    When the scope is too large, the lists are shortened from the end (key
+    systems, then process areas, then regulations) and then the products text.
+    Pass the requirements already received to ask only for the remaining ones.
+    """
+    budget = budget or TokenBudget('requirements', requirements_output_tokens())
+    scope = dict(audit_scope)
+    for key in ('process_areas', 'key_systems', 'regulatory_requirements'):
+        if isinstance(scope.get(key), list):
+            scope[key] = list(scope[key])
+    scope['products'] = str(scope.get('products', 'Not specified'))
+    
+    return budget.fit(lambda: render_requirements_prompt(scope, received), [
+        ('key_systems', shrink_list(scope.get('key_systems') or [], 3)),
+        ('process_areas', shrink_list(scope.get('process_areas') or [], 3)),
+        ('regulatory_requirements', shrink_list(scope.get('regulatory_requirements') or [], 2)),
+        ('products', shrink_text(scope, 'products', 50))
+    ])
+
+def requirements_output_tokens():
+    """Output budget for one requirements response (or continuation)"""
+    return REQUIREMENTS_MAX_OUTPUT_TOKENS
+
+def render_requirements_prompt(audit_scope, received=None):
     """Build specialized prompt for Claude based on audit scope"""
     facility = audit_scope.get('facility', 'Not specified')
     process_areas = audit_scope.get('process_areas', [])
@@ -193,6 +1074,8 @@ def build_requirements_prompt(audit_scope):
     time_period = audit_scope.get('time_period', 'Not specified')
     key_systems = audit_scope.get('key_systems', [])
     regulatory_reqs = audit_scope.get('regulatory_requirements', [])
+    received = received or []
+    count = REQUIREMENTS_PER_RESPONSE - len(received)
     
     prompt = f"""You are a GxP regulatory compliance expert specializing in pharmaceutical audits. 
 Based on the following audit scope, generate a comprehensive list of specific regulatory requirements 
@@ -217,7 +1100,7 @@ Regulatory Framework:
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
 TASK:
-Generate 10 specific, actionable regulatory requirements that apply to this audit scope.
+Generate {count} specific, actionable regulatory requirements that apply to this audit scope.
 Focus on requirements most relevant to the identified process areas and products.
 
 For each requirement, provide:
@@ -273,140 +1156,76 @@ Generate requirements that are:
 
 Begin with the most critical requirements first."""
     
-    return prompt
+    if received:
+        next_id = max((requirement_number(req) for req in received), default=0) + 1
+        prompt += f"""
 
-def clean_json_string(json_str):
-    """Clean up common JSON formatting issues"""
-    import re
-    
-    # Remove any BOM or special characters at start
-    json_str = json_str.lstrip('\ufeff\xef\xbb\xbf')
-    
-    # Fix trailing commas in arrays and objects
-    json_str = re.sub(r',\s*}', '}', json_str)
-    json_str = re.sub(r',\s*]', ']', json_str)
-    
-    # Fix missing commas between array/object items
-    # This is tricky - only add if needed
-    
-    return json_str
+CONTINUATION:
+A previous response was cut off after these {len(received)} requirements:
+{chr(10).join(f"• {req.get('id', '')}: {requirement_citation(req)} ({req.get('category', 'Other')})" for req in received)}
 
-def fix_common_json_errors(response):
-    """Attempt to fix common JSON errors in LLM responses"""
-    import re
-    
-    # Extract JSON portion
-    if "```json" in response:
-        json_start = response.find("```json") + 7
-        json_end = response.find("```", json_start)
-        json_str = response[json_start:json_end].strip()
-    elif "```" in response:
-        json_start = response.find("```") + 3
-        json_end = response.find("```", json_start)
-        json_str = response[json_start:json_end].strip()
-    else:
-        # Try to find JSON object boundaries
-        json_match = re.search(r'\{[\s\S]*\}', response)
-        if json_match:
-            json_str = json_match.group(0)
-        else:
-            json_str = response.strip()
+Generate ONLY the remaining {count} requirements. Do not repeat any requirement listed above.
+Number the ids from req_{next_id:03d}."""
     
-    # Clean up
-    json_str = clean_json_string(json_str)
+    return prompt
+
+JSON_TOKEN_PATTERN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\]]|,\s*(?=[}\]])')
+
+def extract_json(response):
+    """
+    Extract and parse the JSON object in an LLM response
     
-    # Fix unescaped quotes in strings (common issue)
-    # This is complex and risky - be careful
+    One pass over the text: starts at the first '{' (after the markdown fence,
+    if one comes before it), stops where that object closes, and drops
+    trailing commas. Raw newlines inside strings are accepted by parsing with
+    strict=False.
+    Raises json.JSONDecodeError if no object can be parsed.
+    """
+    start = response.find('{')
+    fence = response.find("```", 0, start)
+    if fence != -1:
+        # A fence before the object opens it; fences after it (or inside strings) are left alone
+        start = response.find('{', fence + 3)
+    if start == -1:
+        raise json.JSONDecodeError("No JSON object found", response, 0)
     
-    # Fix unescaped newlines in strings
-    json_str = re.sub(r'(?<!\\)\n(?=[^"]*"(?:[^"]*"[^"]*")*[^"]*$)', r'\\n', json_str)
+    pieces = []
+    copied = start
+    end = len(response)
+    depth = 0
+    for match in JSON_TOKEN_PATTERN.finditer(response, start):
+        ch = response[match.start()]
+        if ch == ',':
+            # Trailing comma before a closing bracket
+            pieces.append(response[copied:match.start()])
+            copied = match.start() + 1
+        elif ch == '{' or ch == '[':
+            depth += 1
+        elif ch == '}' or ch == ']':
+            depth -= 1
+            if depth == 0:
+                end = match.end()
+                break
+    pieces.append(response[copied:end])
     
-    return json_str
+    return json.loads(''.join(pieces), strict=False)
 
 def parse_llm_response(response):
     """Parse Claude's JSON response with robust error handling"""
     try:
-        # Extract JSON from response (handle markdown code blocks if present)
-        if "```json" in response:
-            json_start = response.find("```json") + 7
-            json_end = response.find("```", json_start)
-            json_str = response[json_start:json_end].strip()
-        elif "```" in response:
-            json_start = response.find("```") + 3
-            json_end = response.find("```", json_start)
-            json_str = response[json_start:json_end].strip()
-        else:
-            json_str = response.strip()
-        
-        # Clean up common JSON issues
-        json_str = clean_json_string(json_str)
-        
-        data = json.loads(json_str)
-        
-        # New flat structure - just requirements array
-        requirements = data.get('requirements', [])
-        
-        # Group by category for frontend compatibility
-        categories_dict = {}
-        for req in requirements:
-            category = req.get('category', 'Other')
-            if category not in categories_dict:
-                categories_dict[category] = {
-                    'category_name': category,
-                    'requirements': []
-                }
-            categories_dict[category]['requirements'].append(req)
-        
-        # Build response in expected format
-        categories = list(categories_dict.values())
-        for cat in categories:
-            cat['requirement_count'] = len(cat['requirements'])
-        
-        return {
-            "total_requirements": len(requirements),
-            "categories": categories,
-            "raw_requirements": requirements  # Keep original flat list
-        }
+        data = extract_json(response)
+        return group_requirements(data.get('requirements', []))
         
     except json.JSONDecodeError as e:
         print(f"Error parsing Claude response: {e}")
         print(f"Response was: {response[:500]}...")
         
-        # Try to fix common JSON errors and retry
-        try:
-            fixed_json = fix_common_json_errors(response)
-            data = json.loads(fixed_json)
-            requirements = data.get('requirements', [])
-            
-            # Group by category
-            categories_dict = {}
-            for req in requirements:
-                category = req.get('category', 'Other')
-                if category not in categories_dict:
-                    categories_dict[category] = {
-                        'category_name': category,
-                        'requirements': []
-                    }
-                categories_dict[category]['requirements'].append(req)
-            
-            categories = list(categories_dict.values())
-            for cat in categories:
-                cat['requirement_count'] = len(cat['requirements'])
-            
-            return {
-                "total_requirements": len(requirements),
-                "categories": categories,
-                "raw_requirements": requirements
-            }
-        except Exception as retry_error:
-            print(f"Retry also failed: {retry_error}")
-            
-            # Return minimal structure if all parsing fails
-            return {
-                "total_requirements": 0,
-                "categories": [],
-                "error": "Failed to parse LLM response"
-            }
+        # Return minimal structure if parsing fails
+        return {
+            "total_requirements": 0,
+            "categories": [],
+            "error": "Failed to parse LLM response"
+        }
     except Exception as e:
         print(f"Unexpected error in parse_llm_response: {e}")
         return {
@@ -415,26 +1234,1381 @@ def parse_llm_response(response):
             "error": f"Failed to parse LLM response: {str(e)}"
         }
 
+def group_requirements(requirements):
+    """Group a flat requirements list by category in the shape the frontend expects"""
+    categories_dict = {}
+    for req in requirements:
+        category = req.get('category', 'Other')
+        if category not in categories_dict:
+            categories_dict[category] = {
+                'category_name': category,
+                'requirements': []
+            }
+        categories_dict[category]['requirements'].append(req)
+    
+    categories = list(categories_dict.values())
+    for cat in categories:
+        cat['requirement_count'] = len(cat['requirements'])
+    
+    return {
+        "total_requirements": len(requirements),
+        "categories": categories,
+        "raw_requirements": requirements
+    }
+
+class RequirementStreamParser:
+    """
+    Incrementally extract requirement objects from a streamed LLM response
+    
+    Text is fed in arbitrary chunks. Once the "requirements" array has started,
+    every object that closes at the top level of the array is parsed and
+    returned by feed(). Each character is scanned exactly once: only the
+    unscanned text and the object being read are kept in the working buffer,
+    and the full response is only joined when text() is called.
+    """
+    
+    KEY = '"requirements"'
+    
+    def __init__(self):
+        self.chunks = []
+        self.pending = ''
+        self.pos = 0
+        self.key_end = None
+        self.in_array = False
+        self.done = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.object_start = None
+    
+    def text(self):
+        """Everything fed so far"""
+        return ''.join(self.chunks)
+    
+    def feed(self, text):
+        """Add text and return the list of requirement dicts completed by it"""
+        self.chunks.append(text)
+        completed = []
+        if self.done:
+            return completed
+        self.pending += text
+        
+        if not self.in_array:
+            if self.key_end is None:
+                key_pos = self.pending.find(self.KEY, self.pos)
+                if key_pos == -1:
+                    # Keep just enough to match a key split across chunks
+                    self.pos = max(len(self.pending) - len(self.KEY) + 1, 0)
+                    self._trim(self.pos)
+                    return completed
+                self.key_end = key_pos + len(self.KEY)
+            array_pos = self.pending.find('[', self.key_end)
+            if array_pos == -1:
+                self.key_end = len(self.pending)
+                return completed
+            self.in_array = True
+            self.pos = array_pos + 1
+        
+        buffer = self.pending
+        i = self.pos
+        while self.in_array and i < len(buffer):
+            ch = buffer[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in '{[':
+                if self.depth == 0 and ch == '{':
+                    self.object_start = i
+                self.depth += 1
+            elif ch in '}]':
+                if self.depth == 0 and ch == ']':
+                    self.in_array = False
+                    self.done = True
+                else:
+                    self.depth -= 1
+                    if self.depth == 0 and ch == '}' and self.object_start is not None:
+                        requirement = self._parse_object(buffer[self.object_start:i + 1])
+                        if requirement is not None:
+                            completed.append(requirement)
+                        self.object_start = None
+            i += 1
+        self.pos = i
+        
+        # Scanned text outside an open object is no longer needed
+        self._trim(self.object_start if self.object_start is not None else i)
+        return completed
+    
+    def _trim(self, keep_from):
+        """Drop the working buffer before keep_from, shifting the saved positions"""
+        if keep_from == 0:
+            return
+        self.pending = self.pending[keep_from:]
+        self.pos -= keep_from
+        if self.key_end is not None:
+            self.key_end = max(self.key_end - keep_from, 0)
+        if self.object_start is not None:
+            self.object_start -= keep_from
+    
+    @staticmethod
+    def _parse_object(text):
+        try:
+            return extract_json(text)
+        except json.JSONDecodeError as e:
+            print(f"Skipping unparseable streamed requirement: {e}")
+            return None
+
 # ============================================================================
-# API ROUTES
+# TRUNCATED RESPONSE RECOVERY
 # ============================================================================
 
-@app.route('/')
-def serve_frontend():
-    """Serve the main HTML file"""
-    return send_file('audit_poc.html')
+REQUIREMENT_CONTINUATION_ATTEMPTS = int(os.getenv('REQUIREMENT_CONTINUATION_ATTEMPTS', 2))
 
-@app.route('/api/upload', methods=['POST'])
-def upload_files():
-    """Handle file uploads"""
-    try:
-        if 'files' not in request.files:
-            return jsonify({'success': False, 'message': 'No files provided'}), 400
+def requirement_number(req):
+    """Numeric part of an id like req_007, or 0"""
+    match = re.search(r'(\d+)$', str(req.get('id', '')))
+    return int(match.group(1)) if match else 0
+
+def requirement_citation(req):
+    return req.get('regulation_name') or req.get('citation') or ''
+
+def add_requirement(requirements, req):
+    """
+    Append a continuation requirement unless it repeats one already received
+    
+    Duplicates are matched on citation and category. An id that is already
+    taken is renumbered after the highest existing id. Returns True if added.
+    """
+    key = (requirement_citation(req).strip().lower(), str(req.get('category', '')).strip().lower())
+    if key[0] and any((requirement_citation(r).strip().lower(), str(r.get('category', '')).strip().lower()) == key
+                      for r in requirements):
+        return False
+    if req.get('id') in {r.get('id') for r in requirements}:
+        req['id'] = f"req_{max(requirement_number(r) for r in requirements) + 1:03d}"
+    requirements.append(req)
+    return True
+
+def new_recovery_report(salvaged):
+    return {'truncated': True, 'salvaged': salvaged, 'continuation_requests': 0, 'added': 0, 'complete': False}
+
+def continue_requirements(audit_scope, requirements, recovery, stream=False):
+    """
+    Top up a truncated requirements list with continuation requests
+    
+    Each request asks only for the requirements still missing and lists the
+    ones received so they are not repeated. New requirements are appended to
+    requirements in place and yielded as they are parsed, so the streaming
+    endpoint can forward them. recovery is updated with the outcome.
+    """
+    for _ in range(REQUIREMENT_CONTINUATION_ATTEMPTS):
+        remaining = REQUIREMENTS_PER_RESPONSE - len(requirements)
+        if remaining <= 0:
+            recovery['complete'] = True
+            return
         
-        files = request.files.getlist('files')
-        uploaded_documents = []
+        budget = TokenBudget('requirements', requirements_output_tokens())
+        prompt = build_requirements_prompt(audit_scope, budget, received=requirements)
+        budget.log()
+        recovery['continuation_requests'] += 1
+        print(f"Requesting the remaining {remaining} requirements...")
         
-        for file in files:
+        parser = RequirementStreamParser()
+        try:
+            if stream:
+                deltas = call_claude_stream(prompt, max_tokens=budget.max_tokens)
+            else:
+                deltas = [call_claude(prompt, max_tokens=budget.max_tokens)]
+            for delta in deltas:
+                for req in parser.feed(delta):
+                    if add_requirement(requirements, req):
+                        recovery['added'] += 1
+                        yield req
+        except Exception as e:
+            print(f"Continuation request failed: {e}")
+            return
+        
+        if parser.done:
+            recovery['complete'] = True
+            return
+
+def recover_truncated_requirements(audit_scope, response):
+    """
+    Salvage a requirements response that was cut off mid-JSON
+    
+    Keeps every requirement object that closed before the cut, then asks for
+    the rest with continue_requirements(). Returns the grouped result with a
+    'recovery' report, or None if the response was not truncated or nothing
+    could be salvaged.
+    """
+    parser = RequirementStreamParser()
+    requirements = parser.feed(response)
+    if parser.done or not requirements:
+        return None
+    
+    print(f"⚠️ Response truncated after {len(requirements)} complete requirements")
+    recovery = new_recovery_report(len(requirements))
+    for _ in continue_requirements(audit_scope, requirements, recovery):
+        pass
+    
+    result = group_requirements(requirements)
+    result['recovery'] = recovery
+    return result
+
+def sse_event(event, data):
+    """Format a Server-Sent Events message with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# ============================================================================
+# BACKGROUND JOBS
+# ============================================================================
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))
+JOB_MAX_QUEUED = int(os.getenv('JOB_MAX_QUEUED', 100))
+JOB_RETENTION_SECONDS = 24 * 3600  # Finished jobs are kept for a day
+
+class JobQueueFull(Exception):
+    """Raised when the job queue is at capacity"""
+
+class JobQueue:
+    """
+    Bounded worker pool for slow upstream calls, with job state persisted in SQLite
+    
+    Handlers are registered by kind and receive the job payload dict; whatever
+    they return is stored as the job result. Jobs that were queued or running
+    when the process stopped are re-queued by recover() on the next start.
+    Assumes a single server process owns the queue.
+    """
+    
+    def __init__(self, max_workers, max_queued):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.handlers = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._changed = threading.Condition()
+    
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+    
+    def submit(self, kind, payload):
+        """Persist a new job and hand it to the worker pool; returns the job dict"""
+        if kind not in self.handlers:
+            raise ValueError(f'Unknown job kind: {kind}')
+        
+        db = get_db()
+        queued = db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        if queued >= self.max_queued:
+            raise JobQueueFull(f'Job queue is full ({queued} jobs waiting). Please retry shortly.')
+        
+        job_id = f'job-{uuid.uuid4().hex[:12]}'
+        with db:
+            db.execute(
+                "INSERT INTO jobs (id, kind, status, payload, created_at) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, kind, json.dumps(payload), time.time())
+            )
+        self._executor.submit(self._run, job_id)
+        print(f"Queued {kind} job {job_id}")
+        return self.get(job_id)
+    
+    def get(self, job_id):
+        """Return the job as a dict (with queue position while waiting), or None"""
+        db = get_db()
+        row = db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        
+        now = time.time()
+        job = {
+            'id': row['id'],
+            'kind': row['kind'],
+            'status': row['status'],
+            'createdAt': datetime.fromtimestamp(row['created_at']).isoformat(),
+            'waitSeconds': round((row['started_at'] or now) - row['created_at'], 2)
+        }
+        if row['status'] == 'queued':
+            job['queuePosition'] = db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at <= ?",
+                (row['created_at'],)
+            ).fetchone()[0]
+        if row['started_at']:
+            job['runSeconds'] = round((row['finished_at'] or now) - row['started_at'], 2)
+        if row['status'] == 'succeeded':
+            job['result'] = json.loads(row['result'])
+        if row['status'] == 'failed':
+            job['error'] = row['error']
+        return job
+    
+    def wait_for_change(self, timeout):
+        """Block until any job changes state or timeout expires"""
+        with self._changed:
+            self._changed.wait(timeout)
+    
+    def stats(self):
+        """Queue depth and wait times for monitoring"""
+        db = get_db()
+        now = time.time()
+        counts = dict(db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        oldest = db.execute("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        waits = db.execute(
+            'SELECT AVG(started_at - created_at), MAX(started_at - created_at) FROM jobs '
+            'WHERE started_at IS NOT NULL AND created_at > ?',
+            (now - 3600,)
+        ).fetchone()
+        return {
+            'workers': self.max_workers,
+            'max_queued': self.max_queued,
+            'queue_depth': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'succeeded': counts.get('succeeded', 0),
+            'failed': counts.get('failed', 0),
+            'oldest_queued_wait_seconds': round(now - oldest, 2) if oldest else 0.0,
+            'avg_wait_seconds_last_hour': round(waits[0] or 0.0, 2),
+            'max_wait_seconds_last_hour': round(waits[1] or 0.0, 2)
+        }
+    
+    def recover(self):
+        """Re-queue jobs interrupted by a restart and prune old finished jobs"""
+        db = get_db()
+        with db:
+            db.execute("DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?",
+                       (time.time() - JOB_RETENTION_SECONDS,))
+            db.execute("UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'")
+        pending = db.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at").fetchall()
+        for row in pending:
+            self._executor.submit(self._run, row['id'])
+        if pending:
+            print(f"Recovered {len(pending)} interrupted job(s)")
+    
+    def _run(self, job_id):
+        db = get_db()
+        with db:
+            claimed = db.execute(
+                "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            ).rowcount
+        if not claimed:
+            return
+        self._notify()
+        
+        row = db.execute('SELECT kind, payload FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        try:
+            result = self.handlers[row['kind']](json.loads(row['payload']))
+            with db:
+                db.execute("UPDATE jobs SET status = 'succeeded', result = ?, finished_at = ? WHERE id = ?",
+                           (json.dumps(result), time.time(), job_id))
+            print(f"Job {job_id} ({row['kind']}) succeeded")
+        except Exception as e:
+            print(f"Job {job_id} ({row['kind']}) failed: {e}")
+            import traceback
+            print(traceback.format_exc())
+            with db:
+                db.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                           (str(e), time.time(), job_id))
+        self._notify()
+    
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+job_queue = JobQueue(JOB_WORKERS, JOB_MAX_QUEUED)
+
+def submit_job_response(kind, payload):
+    """Queue a job and build the 202 response pointing at its status endpoints"""
+    try:
+        job = job_queue.submit(kind, payload)
+    except JobQueueFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 503, {'Retry-After': '10'}
+    
+    return jsonify({
+        'success': True,
+        'job': job,
+        'statusUrl': f"/api/jobs/{job['id']}",
+        'eventsUrl': f"/api/jobs/{job['id']}/events"
+    }), 202
+
+# ============================================================================
+# CONTENT-ADDRESSED STORAGE
+# ============================================================================
+
+BLOB_FOLDER = os.path.join(DATA_FOLDER, 'blobs')
+BLOB_PRUNE_GRACE_SECONDS = 3600  # Unreferenced blobs this new may belong to an upload still being registered
+SHA256_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+os.makedirs(BLOB_FOLDER, exist_ok=True)
+
+class BlobStore:
+    """
+    Uploaded document bytes stored once per SHA-256
+    
+    Each blob lives in BLOB_FOLDER under its hash. Every upload still gets its
+    own file name in UPLOAD_FOLDER (and its own manifest row with title and
+    category), but that name is a hard link to the blob, so identical uploads
+    share one copy on disk and a duplicate costs no data writes. Where hard
+    links are not supported (e.g. the folders are on different drives) the
+    blob is copied instead. Files uploaded before the store existed are taken
+    in as blobs, by linking, the first time their content is uploaded again.
+    Blobs no manifest row refers to are removed by prune().
+    """
+    
+    def __init__(self, folder):
+        self.folder = folder
+        self.writes = 0
+        self.duplicates = 0
+        self.bytes_skipped = 0
+        self._link_warning = False
+        self._lock = threading.Lock()
+    
+    def path(self, sha256):
+        return os.path.join(self.folder, sha256)
+    
+    def contains(self, sha256):
+        """Whether the bytes with this hash are stored (adopting an older upload of them if need be)"""
+        if not sha256 or not SHA256_PATTERN.fullmatch(sha256):
+            return False
+        return os.path.exists(self.path(sha256)) or self._adopt_upload(sha256)
+    
+    def put(self, stream, sha256):
+        """Store a seekable stream's bytes unless already stored; returns True if data was written"""
+        if self.contains(sha256):
+            self.record_duplicate(sha256)
+            return False
+        temp_path = f'{self.path(sha256)}.{uuid.uuid4().hex}.tmp'
+        try:
+            stream.seek(0)
+            with open(temp_path, 'wb') as f:
+                shutil.copyfileobj(stream, f, 1024 * 1024)
+            stream.seek(0)
+            os.replace(temp_path, self.path(sha256))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        with self._lock:
+            self.writes += 1
+        return True
+    
+    def put_file(self, file_path, sha256):
+        """Move a complete file into the store, or delete it if its bytes are already stored"""
+        if self.contains(sha256):
+            os.remove(file_path)
+            self.record_duplicate(sha256)
+            return False
+        shutil.move(file_path, self.path(sha256))
+        with self._lock:
+            self.writes += 1
+        return True
+    
+    def link(self, sha256, dest_path):
+        """Give a stored blob an upload's file name"""
+        try:
+            os.link(self.path(sha256), dest_path)
+        except OSError as e:
+            if not self._link_warning:
+                print(f"Hard links unavailable for uploads ({e}); storing copies")
+                self._link_warning = True
+            shutil.copyfile(self.path(sha256), dest_path)
+    
+    def prune(self, referenced):
+        """Delete blobs whose hash is not in `referenced`, and abandoned temp files; returns the count"""
+        cutoff = time.time() - BLOB_PRUNE_GRACE_SECONDS
+        removed = 0
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                stat = entry.stat()
+                if entry.name in referenced or max(stat.st_mtime, stat.st_ctime) > cutoff:
+                    continue
+                os.remove(entry.path)
+                removed += 1
+        return removed
+    
+    def stats(self):
+        """Disk use of uploaded documents with and without de-duplication"""
+        db = get_db()
+        references, logical, contents = db.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0), COUNT(DISTINCT sha256) FROM documents').fetchone()
+        # Count each file once per inode, so hard links and their blob are one copy
+        stored = {}
+        for folder in (UPLOAD_FOLDER, self.folder):
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        stat = os.stat(entry.path)
+                        stored[(stat.st_dev, stat.st_ino)] = stat.st_size
+        stored_bytes = sum(stored.values())
+        return {
+            'references': references,
+            'unique_contents': contents,
+            'logical_bytes': logical,
+            'stored_bytes': stored_bytes,
+            'saved_bytes': max(logical - stored_bytes, 0),
+            'saved_ratio': round(max(logical - stored_bytes, 0) / logical, 3) if logical else 0.0,
+            'blob_writes': self.writes,
+            'duplicate_uploads': self.duplicates,
+            'duplicate_bytes_skipped': self.bytes_skipped
+        }
+    
+    def record_duplicate(self, sha256):
+        """Count an upload served from an existing blob"""
+        size = os.path.getsize(self.path(sha256))
+        with self._lock:
+            self.duplicates += 1
+            self.bytes_skipped += size
+    
+    def _adopt_upload(self, sha256):
+        for row in get_db().execute('SELECT filename FROM documents WHERE sha256 = ?', (sha256,)).fetchall():
+            try:
+                os.link(os.path.join(UPLOAD_FOLDER, row['filename']), self.path(sha256))
+                return True
+            except FileExistsError:
+                return True
+            except OSError:
+                continue
+        return False
+
+blob_store = BlobStore(BLOB_FOLDER)
+
+# ============================================================================
+# DOCUMENT MANIFEST
+# ============================================================================
+
+DOCUMENT_RECONCILE_SECONDS = int(os.getenv('DOCUMENT_RECONCILE_SECONDS', 300))
+
+class DocumentManifest:
+    """
+    Index of uploaded documents, persisted in the SQLite documents table
+    
+    Uploads are recorded as they are saved, with a stable id, the category
+    guessed from the original filename, size, mtime and SHA-256, so listing
+    documents never touches the upload folder. reconcile() brings the index
+    in line with files added, changed or removed outside the API; it runs in
+    a background thread at startup and every DOCUMENT_RECONCILE_SECONDS.
+    Status is 'Analyzing' until document_extractor has indexed the text.
+    """
+    
+    def add(self, filename, title, category, sha256, status='Analyzing'):
+        """Record a file saved in the upload folder; returns the document dict"""
+        stat = os.stat(os.path.join(UPLOAD_FOLDER, filename))
+        document_id = f'doc-{uuid.uuid4().hex[:8]}'
+        db = get_db()
+        with db:
+            # A reconcile pass may have indexed the file between save and insert; keep its id
+            db.execute(
+                'INSERT INTO documents (id, filename, title, category, size, mtime, sha256, status, uploaded_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (filename) DO UPDATE SET title = excluded.title, category = excluded.category, '
+                'size = excluded.size, mtime = excluded.mtime, sha256 = excluded.sha256, status = excluded.status',
+                (document_id, filename, title, category, stat.st_size, stat.st_mtime, sha256, status, time.time())
+            )
+        row = db.execute('SELECT * FROM documents WHERE filename = ?', (filename,)).fetchone()
+        return self._to_document(row)
+    
+    def get(self, document_id):
+        row = get_db().execute('SELECT * FROM documents WHERE id = ?', (document_id,)).fetchone()
+        return self._to_document(row) if row else None
+    
+    def list(self, category=None):
+        """Return documents in upload order, optionally for one category"""
+        if category:
+            rows = get_db().execute('SELECT * FROM documents WHERE category = ? ORDER BY uploaded_at, id',
+                                    (category,)).fetchall()
+        else:
+            rows = get_db().execute('SELECT * FROM documents ORDER BY uploaded_at, id').fetchall()
+        return [self._to_document(row) for row in rows]
+    
+    def category_counts(self):
+        rows = get_db().execute('SELECT category, COUNT(*) FROM documents GROUP BY category ORDER BY category')
+        return dict(rows.fetchall())
+    
+    def reconcile(self):
+        """
+        Sync the index with the upload folder
+        
+        Files without a row are added, rows whose size or mtime changed are
+        re-hashed, and rows whose file is gone are removed. Unchanged files
+        cost one stat each. New and changed files, and any left 'Analyzing'
+        by a restart, are queued for text extraction; missing thumbnails are queued
+        and orphaned ones deleted, as are blobs no document refers to any more.
+        Returns counts of each change.
+        """
+        db = get_db()
+        indexed = {row['filename']: row for row in db.execute('SELECT filename, size, mtime FROM documents')}
+        added = updated = 0
+        
+        with os.scandir(UPLOAD_FOLDER) as entries:
+            on_disk = {entry.name: entry.stat() for entry in entries if entry.is_file() and allowed_file(entry.name)}
+        
+        for filename, stat in on_disk.items():
+            row = indexed.get(filename)
+            if row is not None and row['size'] == stat.st_size and row['mtime'] == stat.st_mtime:
+                continue
+            with open(os.path.join(UPLOAD_FOLDER, filename), 'rb') as f:
+                sha256 = sha256_stream(f)
+            with db:
+                if row is None:
+                    db.execute(
+                        'INSERT OR IGNORE INTO documents '
+                        '(id, filename, title, category, size, mtime, sha256, status, uploaded_at) '
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, 'Analyzing', ?)",
+                        (f'doc-{uuid.uuid4().hex[:8]}', filename, os.path.splitext(filename)[0],
+                         categorize_document(filename), stat.st_size, stat.st_mtime, sha256, stat.st_mtime)
+                    )
+                    added += 1
+                else:
+                    db.execute("UPDATE documents SET size = ?, mtime = ?, sha256 = ?, status = 'Analyzing' "
+                               'WHERE filename = ?', (stat.st_size, stat.st_mtime, sha256, filename))
+                    updated += 1
+        
+        missing = [filename for filename in indexed if filename not in on_disk]
+        with db:
+            db.executemany('DELETE FROM documents WHERE filename = ?', [(filename,) for filename in missing])
+        
+        for row in db.execute("SELECT filename, sha256 FROM documents WHERE status = 'Analyzing'").fetchall():
+            document_extractor.submit(row['filename'], row['sha256'])
+        
+        documents = db.execute('SELECT filename, sha256 FROM documents').fetchall()
+        thumbnail_renderer.reconcile(documents)
+        blob_store.prune({row['sha256'] for row in documents})
+        
+        if added or updated or missing:
+            print(f"Document manifest reconciled: {added} added, {updated} updated, {len(missing)} removed")
+        return {'added': added, 'updated': updated, 'removed': len(missing), 'files': len(on_disk)}
+    
+    @staticmethod
+    def _to_document(row):
+        filename = row['filename']
+        return {
+            'id': row['id'],
+            'title': row['title'],
+            'type': os.path.splitext(filename)[1].upper()[1:],
+            'size': f"{round(row['size'] / (1024 * 1024), 1)} MB",
+            'uploadDate': datetime.fromtimestamp(row['uploaded_at']).strftime('%Y-%m-%d'),
+            'status': row['status'],
+            'thumbnail': generate_thumbnail_path(filename, row['sha256']),
+            'fullDocument': f'/api/document/{filename}',
+            'category': row['category'],
+            'filename': filename,
+            'sha256': row['sha256']
+        }
+
+document_manifest = DocumentManifest()
+
+# ============================================================================
+# DOCUMENT TEXT EXTRACTION
+# ============================================================================
+
+DOCUMENT_EXTRACTION_WORKERS = int(os.getenv('DOCUMENT_EXTRACTION_WORKERS', min(4, os.cpu_count() or 1)))
+DOCUMENT_CHUNK_CHARS = int(os.getenv('DOCUMENT_CHUNK_CHARS', 1500))
+DOCUMENT_CHUNK_OVERLAP = int(os.getenv('DOCUMENT_CHUNK_OVERLAP', 200))
+
+def docx_pages(file_path):
+    """Paragraph and table text of a .docx, split into pages at page breaks"""
+    document = DocxDocument(file_path)
+    pages, current = [], []
+    for block in document.iter_inner_content():
+        if hasattr(block, 'rows'):
+            current.extend(' | '.join(cell.text for cell in row.cells) for row in block.rows)
+            continue
+        current.append(block.text)
+        if block._p.xpath('.//w:br[@w:type="page"]'):
+            pages.append('\n'.join(current))
+            current = []
+    if current or not pages:
+        pages.append('\n'.join(current))
+    return pages
+
+def chunk_pages(pages, size=DOCUMENT_CHUNK_CHARS, overlap=DOCUMENT_CHUNK_OVERLAP):
+    """
+    Split page texts into overlapping chunks of about size characters
+    
+    Whitespace is collapsed, chunks end at a word boundary and never span
+    pages, so each chunk carries its 1-based page number.
+    """
+    chunks = []
+    for number, page in enumerate(pages, start=1):
+        text = ' '.join(page.split())
+        start = 0
+        while start < len(text):
+            end = min(start + size, len(text))
+            if end < len(text):
+                space = text.rfind(' ', start + size // 2, end)
+                end = space if space != -1 else end
+            chunks.append((number, text[start:end]))
+            if end >= len(text):
+                break
+            next_start = max(end - overlap, start + 1)
+            space = text.find(' ', next_start, end)
+            start = space + 1 if space != -1 else next_start
+    return chunks
+
+def extract_document_chunks(file_path):
+    """
+    Extract text page by page and chunk it; runs in a worker process
+    
+    Returns {'pages', 'chars', 'chunks': [(page, text), ...], 'seconds'}.
+    """
+    started = time.perf_counter()
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.pdf':
+        pages = [page.extract_text() or '' for page in PdfReader(file_path).pages]
+    elif extension == '.docx':
+        pages = docx_pages(file_path)
+    else:
+        raise ValueError(f'Text extraction is not supported for {extension} files')
+    return {
+        'pages': len(pages),
+        'chars': sum(len(page) for page in pages),
+        'chunks': chunk_pages(pages),
+        'seconds': time.perf_counter() - started
+    }
+
+def extraction_available(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    return (extension == '.pdf' and PdfReader is not None) or (extension == '.docx' and DocxDocument is not None)
+
+class DocumentExtractor:
+    """
+    Extracts uploaded document text in a process pool into a chunk index
+    
+    Results are stored in document_text and document_chunks keyed by the
+    file's SHA-256, so uploading the same content again (under any name)
+    reuses the stored chunks instead of extracting twice, and concurrent
+    uploads of one file share a single extraction. When a hash is indexed,
+    every document with that hash moves from 'Analyzing' to 'Analyzed'
+    ('Extraction Failed' if the file could not be read). A failure is stored
+    against the hash too, with its error, so a corrupt file is not extracted
+    again on every reconcile; changed content has a new hash and is retried.
+    """
+    
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+    
+    def submit(self, filename, sha256):
+        """Queue extraction of an uploaded file unless its content is already indexed"""
+        if self.get(sha256) is not None:
+            self._set_status(sha256)
+            return
+        if not extraction_available(filename):
+            print(f"Text extraction unavailable for {filename}")
+            self._set_status(sha256, 'Extraction Failed')
+            return
+        
+        with self._lock:
+            if sha256 in self._in_flight or self.get(sha256) is not None:
+                return
+            future = self.run(extract_document_chunks, os.path.abspath(os.path.join(UPLOAD_FOLDER, filename)))
+            self._in_flight[sha256] = future
+        future.add_done_callback(lambda f: self._store(sha256, f))
+    
+    def run(self, fn, *args):
+        """Submit fn(*args) to the worker pool (also used for thumbnails); returns the future"""
+        with self._pool_lock:
+            if self._pool is None:
+                # Spawn rather than fork: the server is multi-threaded, and a forked child can inherit held locks
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            return self._pool.submit(fn, *args)
+    
+    def reset_pool(self):
+        """Drop a broken pool so the next submission starts a new one"""
+        with self._pool_lock:
+            self._pool = None
+    
+    def get(self, sha256):
+        """Extraction summary for a content hash, or None if not indexed yet"""
+        row = get_db().execute('SELECT * FROM document_text WHERE sha256 = ?', (sha256,)).fetchone()
+        return dict(row) if row else None
+    
+    def chunks(self, sha256):
+        rows = get_db().execute('SELECT chunk_index, page, text FROM document_chunks WHERE sha256 = ? '
+                                'ORDER BY chunk_index', (sha256,)).fetchall()
+        return [dict(row) for row in rows]
+    
+    def wait(self, timeout=None):
+        """Block until every queued extraction has been stored (used by tests and benchmarks)"""
+        deadline = time.time() + timeout if timeout else None
+        while True:
+            with self._lock:
+                pending = list(self._in_flight.values())
+            if not pending:
+                return True
+            if deadline and time.time() > deadline:
+                return False
+            time.sleep(0.01)
+    
+    def _store(self, sha256, future):
+        try:
+            result = future.result()
+            status, error = 'extracted', None
+        except (BrokenProcessPool, FileNotFoundError) as e:
+            # A worker died or the file was removed while queued; leave the hash unindexed so reconcile retries it
+            print(f"Document text extraction interrupted ({sha256[:12]}): {e}")
+            if isinstance(e, BrokenProcessPool):
+                self.reset_pool()
+            with self._lock:
+                self._in_flight.pop(sha256, None)
+            return
+        except Exception as e:
+            print(f"Document text extraction failed ({sha256[:12]}): {e}")
+            result = {'pages': 0, 'chars': 0, 'chunks': [], 'seconds': None}
+            status, error = 'failed', str(e)
+        
+        db = get_db()
+        with db:
+            db.execute('DELETE FROM document_chunks WHERE sha256 = ?', (sha256,))
+            db.executemany('INSERT INTO document_chunks (sha256, chunk_index, page, text) VALUES (?, ?, ?, ?)',
+                           [(sha256, index, page, text) for index, (page, text) in enumerate(result['chunks'])])
+            db.execute(
+                'INSERT OR REPLACE INTO document_text '
+                '(sha256, status, pages, chars, chunks, error, seconds, extracted_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (sha256, status, result['pages'], result['chars'], len(result['chunks']), error,
+                 result['seconds'], time.time())
+            )
+        self._set_status(sha256)
+        with self._lock:
+            self._in_flight.pop(sha256, None)
+        if status == 'extracted':
+            print(f"Extracted {result['pages']} pages into {len(result['chunks'])} chunks "
+                  f"in {result['seconds']:.2f}s ({sha256[:12]})")
+    
+    def _set_status(self, sha256, status=None):
+        if status is None:
+            extraction = self.get(sha256)
+            status = 'Analyzed' if extraction and extraction['status'] == 'extracted' else 'Extraction Failed'
+        db = get_db()
+        with db:
+            db.execute('UPDATE documents SET status = ? WHERE sha256 = ?', (status, sha256))
+
+document_extractor = DocumentExtractor(DOCUMENT_EXTRACTION_WORKERS)
+
+# ============================================================================
+# DOCUMENT THUMBNAILS
+# ============================================================================
+
+THUMBNAIL_FOLDER = os.path.join(DATA_FOLDER, 'thumbnails')
+THUMBNAIL_SIZE = (300, 400)  # The 3:4 document cards
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600  # Names change with the content, so browsers may keep them
+THUMBNAIL_COLORS = {'pdf': '0D47A1', 'doc': '2D3748', 'docx': '4A5568'}
+
+# Bump when render_thumbnail() changes so every thumbnail is rendered again
+THUMBNAIL_VERSION = 1
+
+os.makedirs(THUMBNAIL_FOLDER, exist_ok=True)
+
+def thumbnail_key(sha256):
+    return f'{sha256}-v{THUMBNAIL_VERSION}'
+
+def first_page_text(file_path):
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.pdf' and PdfReader is not None:
+        reader = PdfReader(file_path)
+        return (reader.pages[0].extract_text() or '') if reader.pages else ''
+    if extension == '.docx' and DocxDocument is not None:
+        return docx_pages(file_path)[0]
+    return ''
+
+def render_text_preview(text, size, color):
+    """A page-shaped image with a coloured header band and the first lines of text"""
+    img = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([0, 0, size[0], 24], fill=f'#{color}')
+    try:
+        font = ImageFont.load_default(size=10)
+    except TypeError:  # Pillow < 10.1 has a single bitmap font
+        font = ImageFont.load_default()
+    y = 36
+    for paragraph in text.splitlines():
+        for line in textwrap.wrap(paragraph, width=size[0] // 6) or ['']:
+            if y > size[1] - 16:
+                return img
+            draw.text((14, y), line, fill='#334155', font=font)
+            y += 13
+    return img
+
+def render_thumbnail(file_path, out_path, size):
+    """
+    Render the first page of a document to a JPEG; runs in a worker process
+    
+    PDFs are rasterized with pdfium when it is installed. Other documents, and
+    PDFs without pdfium, get a text preview of their first page. The file is
+    written under a temporary name and moved into place, so a half-written
+    thumbnail is never served.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.pdf' and pdfium is not None:
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            page = pdf[0]
+            # Render at twice the target size and downsample for sharper text
+            scale = 2 * min(size[0] / page.get_width(), size[1] / page.get_height())
+            img = page.render(scale=scale).to_pil().convert('RGB')
+        finally:
+            pdf.close()
+        img.thumbnail(size, Image.LANCZOS)
+        renderer = 'pdfium'
+    else:
+        img = render_text_preview(first_page_text(file_path), size, THUMBNAIL_COLORS.get(extension.lstrip('.'), '718096'))
+        renderer = 'text'
+    
+    temp_path = f'{out_path}.{os.getpid()}.tmp'
+    img.save(temp_path, format='JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+    os.replace(temp_path, out_path)
+    return {'renderer': renderer, 'size': img.size, 'bytes': os.path.getsize(out_path)}
+
+def placeholder_svg(text, color, width=THUMBNAIL_SIZE[0], height=THUMBNAIL_SIZE[1]):
+    """Solid placeholder with centred white text, drawn locally instead of fetched from placehold.co"""
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}"><rect width="100%" height="100%" fill="#{color}"/>'
+        f'<text x="50%" y="50%" fill="#FFFFFF" font-family="Inter, Arial, sans-serif" '
+        f'font-size="{max(min(width, height) // 10, 10)}" text-anchor="middle" dominant-baseline="middle">'
+        f'{html.escape(text)}</text></svg>'
+    )
+
+class ThumbnailRenderer:
+    """
+    Renders first-page thumbnails into THUMBNAIL_FOLDER in the document worker pool
+    
+    Thumbnails are named by the source file's SHA-256 (plus THUMBNAIL_VERSION),
+    so they are rendered once per content and a changed file gets a new one;
+    reconcile() removes thumbnails whose source is gone. A file that cannot be
+    rendered gets a .failed marker holding the error instead, so it is not
+    queued again until its content (or THUMBNAIL_VERSION) changes. Without
+    Pillow nothing is rendered and documents keep the local placeholder.
+    """
+    
+    def __init__(self):
+        self._in_flight = set()
+        self._lock = threading.Lock()
+    
+    def path(self, sha256):
+        return os.path.join(THUMBNAIL_FOLDER, f'{thumbnail_key(sha256)}.jpg')
+    
+    def failure_path(self, sha256):
+        return os.path.join(THUMBNAIL_FOLDER, f'{thumbnail_key(sha256)}.failed')
+    
+    def submit(self, filename, sha256):
+        """Queue a thumbnail for an uploaded file unless one exists, or failed, for its content"""
+        if Image is None or os.path.exists(self.path(sha256)) or os.path.exists(self.failure_path(sha256)):
+            return
+        with self._lock:
+            if sha256 in self._in_flight:
+                return
+            self._in_flight.add(sha256)
+        future = document_extractor.run(render_thumbnail, os.path.abspath(os.path.join(UPLOAD_FOLDER, filename)),
+                                        os.path.abspath(self.path(sha256)), THUMBNAIL_SIZE)
+        future.add_done_callback(lambda f: self._done(sha256, f))
+    
+    def reconcile(self, documents):
+        """Queue thumbnails missing for (filename, sha256) pairs and delete those of removed or old-version files"""
+        expected = {os.path.basename(self.path(sha256)): (filename, sha256) for filename, sha256 in documents}
+        failed = {os.path.basename(self.failure_path(sha256)) for _, sha256 in documents}
+        with os.scandir(THUMBNAIL_FOLDER) as entries:
+            existing = {entry.name for entry in entries}
+        removed = 0
+        for name in existing - set(expected) - failed:
+            if not name.endswith('.tmp'):  # Leave thumbnails still being written
+                os.remove(os.path.join(THUMBNAIL_FOLDER, name))
+                removed += 1
+        for name in set(expected) - existing:
+            self.submit(*expected[name])
+        return removed
+    
+    def _done(self, sha256, future):
+        try:
+            result = future.result()
+            print(f"Rendered {result['renderer']} thumbnail {result['size'][0]}x{result['size'][1]}, "
+                  f"{result['bytes']:,} bytes ({sha256[:12]})")
+        except (BrokenProcessPool, FileNotFoundError) as e:
+            # A worker died or the file was removed while queued; the next reconcile retries it
+            print(f"Thumbnail rendering interrupted ({sha256[:12]}): {e}")
+            if isinstance(e, BrokenProcessPool):
+                document_extractor.reset_pool()
+        except Exception as e:
+            print(f"Thumbnail rendering failed ({sha256[:12]}): {e}")
+            with open(self.failure_path(sha256), 'w') as f:
+                f.write(f'{type(e).__name__}: {e}\n')
+        with self._lock:
+            self._in_flight.discard(sha256)
+
+thumbnail_renderer = ThumbnailRenderer()
+
+# ============================================================================
+# RESUMABLE UPLOADS
+# ============================================================================
+
+PARTIAL_UPLOAD_FOLDER = os.path.join(DATA_FOLDER, 'partial_uploads')
+UPLOAD_CHUNK_BYTES = int(os.getenv('UPLOAD_CHUNK_MB', 4)) * 1024 * 1024
+UPLOAD_CHUNK_MIN_BYTES = 64 * 1024
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL_HOURS', 24)) * 3600
+RESUMABLE_AUDIO_MAX_SIZE = int(os.getenv('RESUMABLE_AUDIO_MAX_MB', 500)) * 1024 * 1024
+UPLOAD_READ_BYTES = 64 * 1024
+
+# Per kind: filename check and largest file a session may declare
+UPLOAD_KINDS = {
+    'document': (allowed_file, MAX_FILE_SIZE),
+    'audio': (allowed_audio_file, RESUMABLE_AUDIO_MAX_SIZE),
+}
+
+os.makedirs(PARTIAL_UPLOAD_FOLDER, exist_ok=True)
+
+class UploadError(Exception):
+    """A rejected upload session request; carries the HTTP status to return"""
+    
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+class UploadSessions:
+    """
+    Resumable uploads assembled from numbered chunks
+    
+    A session declares the file's name, kind and size and gets a chunk size.
+    Chunk n covers bytes [n * chunk_size, (n + 1) * chunk_size) and must
+    arrive in order: it is streamed onto the end of a partial file in
+    PARTIAL_UPLOAD_FOLDER while a SHA-256 is updated, so neither the chunk nor
+    the file is held in memory. A chunk that fails half way is cut off again
+    and can simply be re-sent; a chunk that was already received is
+    acknowledged without being written twice. Sessions are kept in SQLite, so
+    uploads resume across restarts (the running hash is rebuilt from the
+    partial file once). Abandoned sessions expire after UPLOAD_SESSION_TTL.
+    """
+    
+    def __init__(self):
+        self._hashes = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+    
+    def create(self, kind, filename, size, chunk_size=None, sha256=None):
+        if kind not in UPLOAD_KINDS:
+            raise UploadError(f"Unknown upload kind '{kind}' (expected one of {', '.join(UPLOAD_KINDS)})")
+        is_allowed, max_size = UPLOAD_KINDS[kind]
+        if not filename or not is_allowed(filename):
+            raise UploadError(f'File {filename} is not a supported format')
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError('size must be a positive number of bytes')
+        if size > max_size:
+            raise UploadError(f'File is larger than the {max_size // (1024 * 1024)} MB limit', 413)
+        chunk_size = min(max(int(chunk_size or UPLOAD_CHUNK_BYTES), UPLOAD_CHUNK_MIN_BYTES), UPLOAD_CHUNK_BYTES)
+        
+        self.expire()
+        upload_id = uuid.uuid4().hex
+        now = time.time()
+        db = get_db()
+        with db:
+            db.execute(
+                'INSERT INTO upload_sessions (id, kind, filename, size, chunk_size, received, sha256, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?)',
+                (upload_id, kind, filename, size, chunk_size, sha256.lower() if sha256 else None, now, now)
+            )
+        open(self._path(upload_id), 'wb').close()  # After the row, so expire() never sees it as an orphan
+        self._hashes[upload_id] = hashlib.sha256()
+        return self.get(upload_id)
+    
+    def get(self, upload_id):
+        row = get_db().execute('SELECT * FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()
+        return self._to_session(row) if row else None
+    
+    def write_chunk(self, upload_id, index, stream, length):
+        """
+        Append chunk `index` from a binary stream of `length` bytes
+        
+        Raises UploadError with 409 (and the expected chunk) when the chunk is
+        ahead of what was received. Returns the session.
+        """
+        with self._session_lock(upload_id):
+            session = self._require(upload_id)
+            start = index * session['chunkSize']
+            if index < 0 or start >= session['size']:
+                raise UploadError(f"Chunk {index} is outside the file ({session['chunks']} chunks)")
+            if start < session['offset']:
+                return session  # Already received; the client missed the acknowledgement
+            if start > session['offset']:
+                raise UploadError(f"Chunk {index} is ahead of the upload; send chunk {session['nextChunk']}", 409)
+            expected = min(session['chunkSize'], session['size'] - start)
+            if length != expected:
+                raise UploadError(f'Chunk {index} must be {expected} bytes, got {length}')
+            
+            # Hash a copy so a chunk that fails half way leaves the running hash untouched
+            digest = self._hash(upload_id, session['offset']).copy()
+            path = self._path(upload_id)
+            written = 0
+            try:
+                with open(path, 'r+b') as f:
+                    f.seek(start)
+                    while written < expected:
+                        data = stream.read(min(UPLOAD_READ_BYTES, expected - written))
+                        if not data:
+                            raise UploadError(f'Chunk {index} ended after {written} of {expected} bytes')
+                        f.write(data)
+                        digest.update(data)
+                        written += len(data)
+            except BaseException:
+                os.truncate(path, start)
+                raise
+            
+            self._hashes[upload_id] = digest
+            db = get_db()
+            with db:
+                db.execute('UPDATE upload_sessions SET received = ?, updated_at = ? WHERE id = ?',
+                           (start + written, time.time(), upload_id))
+            return self.get(upload_id)
+    
+    def commit(self, upload_id, dest_path):
+        """
+        Finish a complete upload by moving it to dest_path; returns (session, sha256)
+        
+        The file leaves PARTIAL_UPLOAD_FOLDER before the session is removed, so
+        expire() never sees it as an orphan; the caller owns it from here on. A
+        hash that differs from the one declared at creation discards the upload.
+        """
+        with self._session_lock(upload_id):
+            session = self._require(upload_id)
+            if session['offset'] != session['size']:
+                raise UploadError(f"Upload is incomplete ({session['offset']} of {session['size']} bytes); "
+                                  f"send chunk {session['nextChunk']}", 409)
+            sha256 = self._hash(upload_id, session['offset']).hexdigest()
+            path = self._path(upload_id)
+            if session['sha256'] and session['sha256'] != sha256:
+                self._forget(upload_id)
+                os.remove(path)
+                raise UploadError(f'Upload does not match the declared SHA-256 (got {sha256})', 422)
+            shutil.move(path, dest_path)
+            self._forget(upload_id)
+            return session, sha256
+    
+    def abort(self, upload_id):
+        with self._session_lock(upload_id):
+            self._require(upload_id)
+            self._forget(upload_id)
+            os.remove(self._path(upload_id))
+    
+    def expire(self):
+        """Remove sessions untouched for UPLOAD_SESSION_TTL, and partial files without a session"""
+        db = get_db()
+        stale = [row['id'] for row in db.execute('SELECT id FROM upload_sessions WHERE updated_at < ?',
+                                                 (time.time() - UPLOAD_SESSION_TTL,))]
+        for upload_id in stale:
+            with self._session_lock(upload_id):
+                self._forget(upload_id)
+        with os.scandir(PARTIAL_UPLOAD_FOLDER) as entries:
+            on_disk = {entry.name.split('.')[0]: entry.path for entry in entries}
+        live = {row['id'] for row in db.execute('SELECT id FROM upload_sessions')}
+        for upload_id, path in on_disk.items():
+            if upload_id not in live:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:  # Aborted meanwhile
+                    pass
+        return len(stale)
+    
+    def _require(self, upload_id):
+        session = self.get(upload_id)
+        if session is None:
+            raise UploadError('Upload session not found', 404)
+        return session
+    
+    def _hash(self, upload_id, offset):
+        """Running hash of the first `offset` bytes, rebuilt from the partial file after a restart"""
+        digest = self._hashes.get(upload_id)
+        if digest is None:
+            path = self._path(upload_id)
+            os.truncate(path, offset)  # Drop anything a crash left past the last acknowledged chunk
+            with open(path, 'rb') as f:
+                digest = hashlib.sha256()
+                for data in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(data)
+            self._hashes[upload_id] = digest
+        return digest
+    
+    def _forget(self, upload_id):
+        db = get_db()
+        with db:
+            db.execute('DELETE FROM upload_sessions WHERE id = ?', (upload_id,))
+        self._hashes.pop(upload_id, None)
+        with self._lock:
+            self._locks.pop(upload_id, None)
+    
+    def _session_lock(self, upload_id):
+        with self._lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+    
+    def _path(self, upload_id):
+        return os.path.join(PARTIAL_UPLOAD_FOLDER, f'{upload_id}.part')
+    
+    @staticmethod
+    def _to_session(row):
+        chunks = -(-row['size'] // row['chunk_size'])
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'filename': row['filename'],
+            'size': row['size'],
+            'chunkSize': row['chunk_size'],
+            'chunks': chunks,
+            'offset': row['received'],
+            'nextChunk': row['received'] // row['chunk_size'] if row['received'] < row['size'] else None,
+            'complete': row['received'] == row['size'],
+            'sha256': row['sha256'],
+            'createdAt': row['created_at'],
+            'updatedAt': row['updated_at']
+        }
+
+upload_sessions = UploadSessions()
+
+def reconcile_documents_periodically():
+    """Background loop keeping the manifest in line with the upload folder"""
+    while True:
+        try:
+            document_manifest.reconcile()
+        except Exception as e:
+            print(f"Document manifest reconcile failed: {e}")
+        time.sleep(DOCUMENT_RECONCILE_SECONDS)
+
+# ============================================================================
+# FRONTEND DELIVERY
+# ============================================================================
+
+# HTML shells served from the application directory
+FRONTEND_PAGES = {'audit_poc.html', 'fieldwork_ui.html', 'fieldwork_ai_enhanced_ui.html',
+                  'COMPLETE_FIELDWORK_INTEGRATION.html'}
+
+# Browsers revalidate on every load and get a 304 while the file is unchanged
+FRONTEND_CACHE_CONTROL = 'no-cache'
+
+class FrontendCache:
+    """
+    Precompressed copies of the HTML shells, validated by ETag
+    
+    Each page is read once and compressed with brotli (when installed) and
+    gzip at the highest levels, which is affordable because it happens only
+    when the file changes: every request stats the file and recompresses
+    if its size or mtime moved. The ETag is the content hash plus the
+    encoding, so each representation validates separately.
+    """
+    
+    def __init__(self, folder, pages):
+        self.folder = folder
+        self.pages = pages
+        self._entries = {}
+        self._lock = threading.Lock()
+    
+    def get(self, name):
+        """Return the compressed variants of a page, rebuilding them if the file changed"""
+        stat = os.stat(os.path.join(self.folder, name))
+        version = (stat.st_size, stat.st_mtime_ns)
+        entry = self._entries.get(name)
+        if entry is None or entry['version'] != version:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is None or entry['version'] != version:
+                    entry = self._build(name, version)
+                    self._entries[name] = entry
+        return entry
+    
+    def warm(self):
+        """Compress every page up front so the first visitor is not kept waiting"""
+        for name in self.pages:
+            if os.path.exists(os.path.join(self.folder, name)):
+                self.get(name)
+    
+    def _build(self, name, version):
+        start = time.perf_counter()
+        with open(os.path.join(self.folder, name), 'rb') as f:
+            body = f.read()
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        variants = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['br'] = brotli.compress(body, mode=brotli.MODE_TEXT, quality=11)
+        sizes = ', '.join(f'{encoding} {len(data):,}' for encoding, data in variants.items())
+        print(f"Compressed {name} in {(time.perf_counter() - start) * 1000:.0f} ms: {sizes} bytes")
+        return {
+            'version': version,
+            'variants': variants,
+            'etags': {encoding: f'{digest}-{encoding}' for encoding in variants},
+            'last_modified': version[1] / 1e9
+        }
+
+frontend_cache = FrontendCache(app.root_path, FRONTEND_PAGES)
+
+def choose_encoding(accept_encodings, available):
+    """Smallest encoding the client accepts: br, then gzip, then the uncompressed body"""
+    for encoding in ('br', 'gzip'):
+        if encoding in available and accept_encodings[encoding]:
+            return encoding
+    return 'identity'
+
+def serve_frontend_page(name):
+    """Serve a precompressed HTML shell, answering conditional requests with 304"""
+    entry = frontend_cache.get(name)
+    encoding = choose_encoding(request.accept_encodings, entry['variants'])
+    etag = entry['etags'][encoding]
+    
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(entry['variants'][encoding], mimetype='text/html')
+        response.last_modified = entry['last_modified']
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = FRONTEND_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response
+
+# ============================================================================
+# API ROUTES
+# ============================================================================
+
+@app.route('/')
+def serve_frontend():
+    """Serve the main HTML file"""
+    return serve_frontend_page('audit_poc.html')
+
+@app.route('/<page>')
+def serve_frontend_shell(page):
+    """Serve the other HTML shells (fieldwork UIs) the same way as the main page"""
+    if page not in FRONTEND_PAGES:
+        return jsonify({'error': 'Not found'}), 404
+    return serve_frontend_page(page)
+
+def register_uploaded_document(unique_filename, original_filename, sha256):
+    """Record a saved upload in the manifest and queue its text extraction and thumbnail"""
+    # Categorized by the original filename
+    document = document_manifest.add(
+        unique_filename,
+        title=os.path.splitext(original_filename)[0],
+        category=categorize_document(original_filename),
+        sha256=sha256
+    )
+    
+    # Extract and index the text in the background; status becomes 'Analyzed' when done
+    document_extractor.submit(unique_filename, sha256)
+    thumbnail_renderer.submit(unique_filename, sha256)
+    
+    return document_manifest.get(document['id'])
+
+@app.route('/api/upload', methods=['POST'])
+def upload_files():
+    """Handle file uploads"""
+    try:
+        if 'files' not in request.files:
+            return jsonify({'success': False, 'message': 'No files provided'}), 400
+        
+        files = request.files.getlist('files')
+        uploaded_documents = []
+        duplicates = 0
+        
+        for file in files:
             if file.filename == '':
                 continue
                 
@@ -449,47 +2623,19 @@ def upload_files():
             unique_filename = f"{uuid.uuid4()}{file_extension}"
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
             
-            # Save file
-            file.save(file_path)
-            
-            # Get file info
-            file_size = get_file_size_mb(file_path)
-            upload_date = datetime.now().strftime('%Y-%m-%d')
-            
-            # Determine document category based on filename
-            filename_lower = file.filename.lower()
-            if 'master' in filename_lower or 'site' in filename_lower:
-                category = 'Site Master File'
-            elif 'sop' in filename_lower:
-                if 'gown' in filename_lower or 'asep' in filename_lower:
-                    category = 'Aseptic Process SOPs'
-                else:
-                    category = 'Quality System SOPs'
-            elif 'batch' in filename_lower or 'mbr' in filename_lower:
-                category = 'Aseptic Process SOPs'
-            else:
-                category = 'Other Documents'
-            
-            # Create document record
-            document = {
-                'id': f'doc-{uuid.uuid4().hex[:8]}',
-                'title': os.path.splitext(file.filename)[0],
-                'type': file_extension.upper()[1:],
-                'size': f'{file_size} MB',
-                'uploadDate': upload_date,
-                'status': 'Analyzing',
-                'thumbnail': generate_thumbnail_path(file_path),
-                'fullDocument': f'/api/document/{unique_filename}',
-                'category': category,
-                'filename': unique_filename
-            }
+            # Store the bytes once per content; a duplicate writes nothing and only gets a new name
+            sha256 = upload_sha256(file.stream)
+            if not blob_store.put(file.stream, sha256):
+                duplicates += 1
+            blob_store.link(sha256, file_path)
             
-            uploaded_documents.append(document)
+            uploaded_documents.append(register_uploaded_document(unique_filename, file.filename, sha256))
         
         return jsonify({
             'success': True,
             'message': f'Successfully uploaded {len(uploaded_documents)} file(s)',
-            'documents': uploaded_documents
+            'documents': uploaded_documents,
+            'duplicates': duplicates
         })
         
     except Exception as e:
@@ -500,46 +2646,20 @@ def upload_files():
 
 @app.route('/api/documents', methods=['GET'])
 def get_documents():
-    """Get list of all uploaded documents"""
+    """
+    Get list of all uploaded documents from the manifest
+    
+    Optional query parameter: category (exact match). The response also
+    includes the document count per category.
+    """
     try:
-        documents = []
-        
-        for filename in os.listdir(UPLOAD_FOLDER):
-            if allowed_file(filename):
-                file_path = os.path.join(UPLOAD_FOLDER, filename)
-                file_size = get_file_size_mb(file_path)
-                upload_date = datetime.fromtimestamp(os.path.getmtime(file_path)).strftime('%Y-%m-%d')
-                
-                # Determine category
-                filename_lower = filename.lower()
-                if 'master' in filename_lower or 'site' in filename_lower:
-                    category = 'Site Master File'
-                elif 'sop' in filename_lower:
-                    if 'gown' in filename_lower or 'asep' in filename_lower:
-                        category = 'Aseptic Process SOPs'
-                    else:
-                        category = 'Quality System SOPs'
-                elif 'batch' in filename_lower or 'mbr' in filename_lower:
-                    category = 'Aseptic Process SOPs'
-                else:
-                    category = 'Other Documents'
-                
-                document = {
-                    'id': f'doc-{uuid.uuid4().hex[:8]}',
-                    'title': os.path.splitext(filename)[0],
-                    'type': os.path.splitext(filename)[1].upper()[1:],
-                    'size': f'{file_size} MB',
-                    'uploadDate': upload_date,
-                    'status': 'Analyzed',
-                    'thumbnail': generate_thumbnail_path(file_path),
-                    'fullDocument': f'/api/document/{filename}',
-                    'category': category,
-                    'filename': filename
-                }
-                
-                documents.append(document)
+        documents = document_manifest.list(category=request.args.get('category'))
         
-        return jsonify({'success': True, 'documents': documents})
+        return jsonify({
+            'success': True,
+            'documents': documents,
+            'categories': document_manifest.category_counts()
+        })
         
     except Exception as e:
         return jsonify({
@@ -547,6 +2667,81 @@ def get_documents():
             'message': f'Failed to retrieve documents: {str(e)}'
         }), 500
 
+@app.route('/api/documents/storage', methods=['GET'])
+def get_document_storage():
+    """Disk used by uploaded documents and what de-duplication saves"""
+    return jsonify({'success': True, 'storage': blob_store.stats()})
+
+@app.route('/api/documents/<document_id>/text', methods=['GET'])
+def get_document_text(document_id):
+    """Get the extracted text chunks of a document, with page numbers"""
+    document = document_manifest.get(document_id)
+    if not document:
+        return jsonify({'success': False, 'error': 'Document not found'}), 404
+    
+    extraction = document_extractor.get(document['sha256'])
+    if extraction is None:
+        return jsonify({'success': True, 'status': document['status'], 'extraction': None, 'chunks': []})
+    
+    return jsonify({
+        'success': True,
+        'status': document['status'],
+        'extraction': {
+            'status': extraction['status'],
+            'pages': extraction['pages'],
+            'chars': extraction['chars'],
+            'chunks': extraction['chunks'],
+            'seconds': extraction['seconds'],
+            'error': extraction['error']
+        },
+        'chunks': document_extractor.chunks(document['sha256'])
+    })
+
+THUMBNAIL_KEY_PATTERN = re.compile(r'[0-9a-f]{64}-v\d+')
+HEX_COLOR_PATTERN = re.compile(r'[0-9A-Fa-f]{6}')
+
+@app.route('/api/thumbnails/placeholder')
+def serve_placeholder():
+    """
+    Local stand-in for placehold.co images used by the frontend
+    
+    Query parameters: w, h (pixels, up to 2000), color (6-digit hex) and text.
+    """
+    width = min(max(request.args.get('w', THUMBNAIL_SIZE[0], type=int), 1), 2000)
+    height = min(max(request.args.get('h', THUMBNAIL_SIZE[1], type=int), 1), 2000)
+    color = request.args.get('color', '718096')
+    if not HEX_COLOR_PATTERN.fullmatch(color):
+        color = '718096'
+    text = request.args.get('text', '').replace('+', ' ')[:60]
+    
+    response = Response(placeholder_svg(text, color, width, height), mimetype='image/svg+xml')
+    response.headers['Cache-Control'] = f'public, max-age={THUMBNAIL_MAX_AGE}, immutable'
+    return response
+
+@app.route('/api/thumbnails/<key>')
+def serve_thumbnail(key):
+    """
+    Serve a rendered document thumbnail
+    
+    Keys embed the source file's SHA-256, so a rendered thumbnail never changes
+    and is cached for a year. Until it is rendered a placeholder coloured by the
+    ?type= extension is served uncached, so the real one shows on the next load.
+    """
+    if not THUMBNAIL_KEY_PATTERN.fullmatch(key):
+        return jsonify({'error': 'Thumbnail not found'}), 404
+    
+    file_path = os.path.abspath(os.path.join(THUMBNAIL_FOLDER, f'{key}.jpg'))
+    if os.path.exists(file_path):
+        response = send_file(file_path, mimetype='image/jpeg', max_age=THUMBNAIL_MAX_AGE)
+        response.headers['Cache-Control'] = f'public, max-age={THUMBNAIL_MAX_AGE}, immutable'
+        return response
+    
+    extension = request.args.get('type', '').lower()
+    response = Response(placeholder_svg(extension.upper(), THUMBNAIL_COLORS.get(extension, '718096')),
+                        mimetype='image/svg+xml')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/api/document/<filename>')
 def serve_document(filename):
     """Serve uploaded documents"""
@@ -581,11 +2776,70 @@ def download_document(filename):
         return jsonify({'error': str(e)}), 500
 
 
+def run_generate_requirements(audit_scope, refresh=False):
+    """
+    Generate requirements for an audit scope, serving repeats from the cache
+    
+    Shared by the synchronous endpoint and the background job worker. Returns the
+    grouped result, or an error payload when the LLM response can't be parsed.
+    """
+    # Serve identical scopes from the cache unless a refresh is requested
+    cache_key = requirements_cache_key(audit_scope)
+    if not refresh:
+        cached = requirements_cache.get(cache_key)
+        if cached is not None:
+            print(f"✅ Requirements cache hit ({cache_key[:12]})")
+            cached['cached'] = True
+            return cached
+    
+    # Build prompt
+    budget = TokenBudget('requirements', requirements_output_tokens())
+    prompt = build_requirements_prompt(audit_scope, budget)
+    budget.log()
+    
+    # Call Claude Sonnet 3.5
+    print("Calling Databricks Claude Sonnet 4.5...")
+    llm_response = call_claude(prompt, max_tokens=budget.max_tokens)
+    
+    # Parse response, topping up a truncated one instead of failing
+    requirements = parse_llm_response(llm_response)
+    if 'error' in requirements and requirements['total_requirements'] == 0:
+        requirements = recover_truncated_requirements(audit_scope, llm_response) or requirements
+    
+    # Check if parsing failed
+    if 'error' in requirements and requirements['total_requirements'] == 0:
+        error_msg = f"Failed to parse LLM response. The AI returned invalid JSON. Please try again."
+        print(error_msg)
+        print(f"Raw LLM response: {llm_response[:1000]}...")
+        return {
+            'error': error_msg,
+            'details': 'The AI response could not be parsed as valid JSON. This is usually temporary - please try again.',
+            'total_requirements': 0,
+            'categories': []
+        }
+    
+    print(f"✅ Generated {requirements.get('total_requirements', 0)} requirements")
+    
+    requirements['token_budget'] = budget.report()
+    if requirements.get('recovery', {}).get('complete', True):
+        requirements_cache.put(cache_key, requirements)
+    requirements['cached'] = False
+    
+    return requirements
+
+def run_generate_requirements_job(payload):
+    """Background job handler for requirement generation"""
+    return run_generate_requirements(payload['audit_scope'], refresh=payload.get('refresh', False))
+
 @app.route('/api/generate-requirements', methods=['POST'])
 def generate_requirements():
     """
     Generate regulatory requirements based on audit scope using Databricks Claude Sonnet 3.5
     
+    Results are cached per canonicalized audit scope; pass ?refresh=true to bypass
+    the cache and force regeneration. Pass ?async=true to queue the generation as a
+    background job and get a job id back immediately.
+    
     Expected POST body:
     {
         "facility": "PharmaCore Site C - Aseptic Filling Suite 2",
@@ -603,31 +2857,16 @@ def generate_requirements():
         if not audit_scope:
             return jsonify({'error': 'No audit scope provided'}), 400
         
-        # Build prompt
-        prompt = build_requirements_prompt(audit_scope)
-        
-        # Call Claude Sonnet 3.5
-        print("Calling Databricks Claude Sonnet 4.5...")
-        llm_response = call_claude(prompt)
-        
-        # Parse response
-        requirements = parse_llm_response(llm_response)
-        
-        # Check if parsing failed
-        if 'error' in requirements and requirements['total_requirements'] == 0:
-            error_msg = f"Failed to parse LLM response. The AI returned invalid JSON. Please try again."
-            print(error_msg)
-            print(f"Raw LLM response: {llm_response[:1000]}...")
-            return jsonify({
-                'error': error_msg,
-                'details': 'The AI response could not be parsed as valid JSON. This is usually temporary - please try again.',
-                'total_requirements': 0,
-                'categories': []
-            }), 200  # Return 200 so frontend can display error message
+        refresh = is_truthy(request.args.get('refresh'))
         
-        print(f"✅ Generated {requirements.get('total_requirements', 0)} requirements")
+        if is_truthy(request.args.get('async')):
+            return submit_job_response('generate_requirements', {
+                'audit_scope': audit_scope,
+                'refresh': refresh
+            })
         
-        return jsonify(requirements), 200
+        # Return 200 even for parse errors so frontend can display the error message
+        return jsonify(run_generate_requirements(audit_scope, refresh=refresh)), 200
         
     except Exception as e:
         error_msg = f'Failed to generate requirements: {str(e)}'
@@ -641,64 +2880,754 @@ def generate_requirements():
             'categories': []
         }), 500
 
-# ============================================================================
-# OBSERVATION MANAGEMENT
-# ============================================================================
+@app.route('/api/generate-requirements/stream', methods=['POST'])
+def generate_requirements_stream():
+    """
+    Streaming variant of /api/generate-requirements using Server-Sent Events
+    
+    Accepts the same audit scope body (and ?refresh=true). Emits:
+      event: requirement  {"index": 0, "category": "...", "requirement": {...}}
+      event: complete     the full grouped result, same shape as the non-streaming endpoint
+      event: error        {"error": "..."}
+    """
+    audit_scope = request.json
+    
+    if not audit_scope:
+        return jsonify({'error': 'No audit scope provided'}), 400
+    
+    cache_key = requirements_cache_key(audit_scope)
+    cached = None
+    if not is_truthy(request.args.get('refresh')):
+        cached = requirements_cache.get(cache_key)
+    
+    def generate():
+        if cached is not None:
+            print(f"✅ Requirements cache hit ({cache_key[:12]}), replaying as stream")
+            for index, req in enumerate(cached.get('raw_requirements', [])):
+                yield sse_event('requirement', {
+                    'index': index,
+                    'category': req.get('category', 'Other'),
+                    'requirement': req
+                })
+            cached['cached'] = True
+            yield sse_event('complete', cached)
+            return
+        
+        try:
+            budget = TokenBudget('requirements', requirements_output_tokens())
+            prompt = build_requirements_prompt(audit_scope, budget)
+            budget.log()
+            parser = RequirementStreamParser()
+            requirements = []
+            started = time.time()
+            
+            print("Streaming from Databricks Claude Sonnet 4.5...")
+            try:
+                for delta in call_claude_stream(prompt, max_tokens=budget.max_tokens):
+                    for req in parser.feed(delta):
+                        if not requirements:
+                            print(f"First requirement streamed after {time.time() - started:.1f}s")
+                        yield sse_event('requirement', {
+                            'index': len(requirements),
+                            'category': req.get('category', 'Other'),
+                            'requirement': req
+                        })
+                        requirements.append(req)
+            except Exception as e:
+                # Keep what already streamed and top it up below
+                if not requirements:
+                    raise
+                print(f"⚠️ Stream dropped after {len(requirements)} requirements: {e}")
+            
+            # Cut off by max_tokens or a dropped connection: ask for the rest
+            recovery = None
+            if requirements and not parser.done:
+                print(f"⚠️ Response truncated after {len(requirements)} complete requirements")
+                recovery = new_recovery_report(len(requirements))
+                for req in continue_requirements(audit_scope, requirements, recovery, stream=True):
+                    yield sse_event('requirement', {
+                        'index': len(requirements) - 1,
+                        'category': req.get('category', 'Other'),
+                        'requirement': req
+                    })
+            
+            # Fall back to the full parser if the incremental pass found nothing
+            if not requirements:
+                result = parse_llm_response(parser.text())
+                if 'error' in result and result['total_requirements'] == 0:
+                    yield sse_event('error', {
+                        'error': 'Failed to parse LLM response. The AI returned invalid JSON. Please try again.',
+                        'total_requirements': 0,
+                        'categories': []
+                    })
+                    return
+                for index, req in enumerate(result['raw_requirements']):
+                    yield sse_event('requirement', {
+                        'index': index,
+                        'category': req.get('category', 'Other'),
+                        'requirement': req
+                    })
+            else:
+                result = group_requirements(requirements)
+                if recovery:
+                    result['recovery'] = recovery
+            
+            print(f"✅ Streamed {result['total_requirements']} requirements in {time.time() - started:.1f}s")
+            result['token_budget'] = budget.report()
+            if recovery is None or recovery['complete']:
+                requirements_cache.put(cache_key, result)
+            result['cached'] = False
+            yield sse_event('complete', result)
+            
+        except Exception as e:
+            error_msg = f'Failed to generate requirements: {str(e)}'
+            print(f"❌ Error: {error_msg}")
+            yield sse_event('error', {
+                'error': error_msg,
+                'total_requirements': 0,
+                'categories': []
+            })
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+# ============================================================================
+# OBSERVATION MANAGEMENT
+# ============================================================================
+
+def build_search_query(text):
+    """
+    Turn a user search string into a safe FTS5 query
+    
+    Each word or "quoted phrase" becomes a phrase match, so document numbers
+    like EX-24-0312 match as written. Terms are ANDed by default; OR and NOT
+    between terms are kept as operators, and a trailing * does prefix matching.
+    """
+    parts = []
+    for term in re.findall(r'"[^"]*"|\S+', text or ''):
+        if term in ('OR', 'NOT', 'AND'):
+            if parts and parts[-1] not in ('OR', 'NOT', 'AND'):
+                parts.append(term)
+            continue
+        prefix = term.endswith('*')
+        term = term.strip('"').rstrip('*')
+        if not term.strip():
+            continue
+        parts.append('"' + term.replace('"', '""') + '"' + ('*' if prefix else ''))
+    
+    # Drop a dangling operator at the end
+    while parts and parts[-1] in ('OR', 'NOT', 'AND'):
+        parts.pop()
+    return ' '.join(parts)
+
+def linked_requirement_ids(observation):
+    """All requirement ids an observation is linked to (multi-select plus legacy field)"""
+    linked = list(observation.get('linkedRequirements') or [])
+    if observation.get('linkedRequirement'):
+        linked.append(observation['linkedRequirement'])
+    
+    ids = []
+    for requirement in linked:
+        requirement_id = requirement.get('id') if isinstance(requirement, dict) else requirement
+        if requirement_id and requirement_id not in ids:
+            ids.append(requirement_id)
+    return ids
+
+class BatchError(Exception):
+    """Raised when an operation in a batch fails; the whole batch is rolled back"""
+    
+    def __init__(self, index, message, results):
+        super().__init__(message)
+        self.index = index
+        self.message = message
+        self.results = results
+
+class ObservationStore:
+    """
+    Repository for observations, persisted in the SQLite observations table
+    
+    Each observation is stored as its full JSON document plus indexed columns
+    for id, linked requirement id, complianceStatus, severity and category, and
+    numeric ranks of complianceStatus and severity for sorting.
+    Ids (OBS-001, OBS-002, ...) come from a persistent counter, so they keep
+    increasing across restarts. Dashboard statistics are kept as counters that
+    are adjusted in the same transaction as every write, and the
+    observation_requirements table is an inverted index from every entry in
+    linkedRequirements to the observations that reference it. The
+    observation_search FTS5 table (rowid = seq) indexes the observation text,
+    transcriptions and image description for full-text search.
+    """
+    
+    def __init__(self):
+        # Databases created before the stats counters or requirement index existed need a one-off rebuild
+        db = get_db()
+        if db.execute("SELECT 1 FROM counters WHERE name = 'stats.total'").fetchone() is None:
+            self.rebuild_stats()
+        if db.execute("SELECT 1 FROM counters WHERE name = 'index.requirements'").fetchone() is None:
+            self.rebuild_requirement_index()
+        if db.execute("SELECT 1 FROM counters WHERE name = 'index.search'").fetchone() is None:
+            self.rebuild_search_index()
+        if db.execute("SELECT 1 FROM counters WHERE name = 'index.ranks'").fetchone() is None:
+            self.rebuild_sort_ranks()
+    
+
+    def get(self, observation_id):
+        """Primary-key lookup; returns the observation dict or None"""
+        row = get_db().execute('SELECT data FROM observations WHERE id = ?', (observation_id,)).fetchone()
+        return json.loads(row['data']) if row else None
+    
+    # Sortable API field -> indexed column; seq (creation order) breaks ties.
+    # Status and severity sort by rank, so desc puts non-compliant and critical first
+    SORT_COLUMNS = {
+        'created': 'seq',
+        'complianceStatus': 'status_rank',
+        'severity': 'severity_rank',
+        'category': 'category'
+    }
+    STATUS_RANKS = {'compliant': 1, 'gap': 2, 'non-compliant': 3}
+    SEVERITY_RANKS = {'minor': 1, 'major': 2, 'critical': 3}
+    
+    def list(self, requirement_ids=None, match='any', compliance_status=None, severity=None, category=None):
+        """Return observations in creation order, filtered on any indexed column"""
+        return self.page(requirement_ids=requirement_ids, match=match, compliance_status=compliance_status,
+                         severity=severity, category=category)[0]
+    
+    def page(self, requirement_ids=None, match='any', compliance_status=None, severity=None, category=None,
+             sort='created', order='asc', limit=None, after=None):
+        """
+        Return (observations, next_cursor) using keyset pagination
+        
+        requirement_ids filters through the linkedRequirements inverted index:
+        match='any' keeps observations linked to at least one of the ids,
+        match='all' keeps those linked to every one of them.
+        
+        after is the opaque cursor returned by the previous page; next_cursor is
+        None once the last page has been returned. Raises ValueError for an
+        unknown sort field or a cursor issued for a different sort order.
+        """
+        if sort not in self.SORT_COLUMNS:
+            raise ValueError(f"Unsupported sort field '{sort}'. Use one of: {', '.join(self.SORT_COLUMNS)}")
+        if order not in ('asc', 'desc'):
+            raise ValueError("order must be 'asc' or 'desc'")
+        column = self.SORT_COLUMNS[sort]
+        
+        clauses, params = self._filter_clauses(requirement_ids, match, compliance_status, severity, category)
+        
+        if after:
+            cursor_sort, cursor_order, value, seq = self._decode_cursor(after)
+            if (cursor_sort, cursor_order) != (sort, order):
+                raise ValueError('Cursor was issued for a different sort order')
+            comparison = '>' if order == 'asc' else '<'
+            if column == 'seq':
+                clauses.append(f'seq {comparison} ?')
+                params.append(seq)
+            else:
+                clauses.append(f'({column}, seq) {comparison} (?, ?)')
+                params.extend([value, seq])
+        
+        sql = f'SELECT seq, {column} AS sort_value, data FROM observations'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        direction = order.upper()
+        sql += f' ORDER BY {column} {direction}' if column == 'seq' else f' ORDER BY {column} {direction}, seq {direction}'
+        if limit is not None:
+            # Fetch one extra row to know whether another page exists
+            sql += ' LIMIT ?'
+            params.append(limit + 1)
+        
+        rows = get_db().execute(sql, params).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = self._encode_cursor(sort, order, last['sort_value'], last['seq'])
+        
+        return [json.loads(row['data']) for row in rows], next_cursor
+    
+    def count(self):
+        return get_db().execute('SELECT COUNT(*) FROM observations').fetchone()[0]
+    
+    def create(self, build):
+        """
+        Allocate the next observation id, build the observation with it and store it
+        
+        build is called with (observation_id) and must return the observation dict.
+        """
+        db = get_db()
+        with db:
+            seq = self._allocate_seqs(db, 1)
+            observation = build(f'OBS-{seq:03d}')
+            self._insert(db, seq, observation)
+        return observation
+    
+    def update(self, observation):
+        """Write back a modified observation; returns False if it no longer exists"""
+        db = get_db()
+        with db:
+            return self._replace(db, observation)
+    
+    def apply_batch(self, operations, build, apply_changes):
+        """
+        Apply a list of create/update operations atomically in one transaction
+        
+        Each operation is {'op': 'create', 'data': {...}} or
+        {'op': 'update', 'id': 'OBS-001', 'data': {...}}. Ids for all creates are
+        allocated as one contiguous range. build(observation_id, data) and
+        apply_changes(observation, data) produce the stored documents.
+        
+        Returns per-item results. If any operation fails, nothing is written and
+        BatchError is raised with per-item results explaining what happened.
+        """
+        db = get_db()
+        results = []
+        try:
+            with db:
+                create_count = sum(1 for op in operations if op.get('op', 'create') == 'create')
+                next_seq = self._allocate_seqs(db, create_count) if create_count else None
+                
+                for index, op in enumerate(operations):
+                    kind = op.get('op', 'create')
+                    data = op.get('data') or {}
+                    if kind == 'create':
+                        observation = build(f'OBS-{next_seq:03d}', data)
+                        self._insert(db, next_seq, observation)
+                        next_seq += 1
+                        results.append({'index': index, 'op': 'create', 'status': 'created',
+                                        'id': observation['id'], 'observation': observation})
+                    elif kind == 'update':
+                        row = db.execute('SELECT data FROM observations WHERE id = ?', (op.get('id'),)).fetchone()
+                        if row is None:
+                            raise BatchError(index, f"Observation not found: {op.get('id')}", results)
+                        observation = apply_changes(json.loads(row['data']), data)
+                        self._replace(db, observation)
+                        results.append({'index': index, 'op': 'update', 'status': 'updated',
+                                        'id': observation['id'], 'observation': observation})
+                    else:
+                        raise BatchError(index, f"Unsupported op '{kind}'. Use 'create' or 'update'", results)
+        except BatchError:
+            raise
+        except Exception as e:
+            raise BatchError(len(results), str(e), results)
+        
+        return results
+    
+    def delete(self, observation_id):
+        """Delete by id; returns True if an observation was removed"""
+        db = get_db()
+        with db:
+            row = db.execute('SELECT seq, data FROM observations WHERE id = ?', (observation_id,)).fetchone()
+            if row is None:
+                return False
+            db.execute('DELETE FROM observations WHERE id = ?', (observation_id,))
+            db.execute('DELETE FROM observation_requirements WHERE observation_id = ?', (observation_id,))
+            db.execute('DELETE FROM observation_search WHERE rowid = ?', (row['seq'],))
+            self._apply_stats(db, json.loads(row['data']), -1)
+        return True
+    
+    def stats(self):
+        """Dashboard statistics read from the maintained counters (constant time)"""
+        counters = dict(get_db().execute("SELECT name, value FROM counters WHERE name LIKE 'stats.%'").fetchall())
+        return self._format_stats(lambda name: counters.get(name, 0))
+    
+    def recompute_stats(self):
+        """Recompute the statistics from scratch by scanning every observation"""
+        observations = self.list()
+        return {
+            'total': len(observations),
+            'by_status': {
+                'compliant': len([o for o in observations if o['complianceStatus'] == 'compliant']),
+                'gap': len([o for o in observations if o['complianceStatus'] == 'gap']),
+                'non_compliant': len([o for o in observations if o['complianceStatus'] == 'non-compliant'])
+            },
+            'by_severity': {
+                'critical': len([o for o in observations if o['severity'] == 'critical']),
+                'major': len([o for o in observations if o['severity'] == 'major']),
+                'minor': len([o for o in observations if o['severity'] == 'minor'])
+            },
+            'total_evidence': sum(len(o.get('evidence') or []) for o in observations)
+        }
+    
+    def rebuild_stats(self):
+        """Reset the counters from a full scan (used for older databases and repairs)"""
+        db = get_db()
+        with db:
+            db.execute("DELETE FROM counters WHERE name LIKE 'stats.%'")
+            db.execute("INSERT INTO counters (name, value) VALUES ('stats.total', 0)")
+            for row in db.execute('SELECT data FROM observations').fetchall():
+                self._apply_stats(db, json.loads(row['data']), 1)
+    
+    def search(self, query, requirement_ids=None, match='any', compliance_status=None, severity=None,
+               category=None, limit=20, offset=0):
+        """
+        Full-text search over observation text, transcriptions and image description
+        
+        query uses the syntax accepted by build_search_query(). Results are ranked
+        by BM25 over every match and combined with the same filters as page().
+        Returns a list of (observation, score, snippet) tuples, best match first.
+        """
+        fts_query = build_search_query(query)
+        if not fts_query:
+            raise ValueError('Search query is empty')
+        
+        clauses, params = self._filter_clauses(requirement_ids, match, compliance_status, severity, category)
+        # CROSS JOIN keeps the FTS index as the outer loop even when a filter column is indexed
+        sql = (
+            "SELECT observations.data, observation_search.rank AS score, "
+            "snippet(observation_search, -1, '<mark>', '</mark>', '…', 16) AS snippet "
+            "FROM observation_search CROSS JOIN observations ON observations.seq = observation_search.rowid "
+            "WHERE observation_search MATCH ?"
+        )
+        if clauses:
+            sql += ' AND ' + ' AND '.join(clauses)
+        sql += ' ORDER BY observation_search.rank LIMIT ? OFFSET ?'
+        
+        try:
+            rows = get_db().execute(sql, [fts_query, *params, limit, offset]).fetchall()
+        except sqlite3.OperationalError as e:
+            raise ValueError(f'Invalid search query: {e}')
+        
+        return [(json.loads(row['data']), -row['score'], row['snippet']) for row in rows]
+    
+    def rebuild_search_index(self):
+        """Rebuild the full-text index from a full scan"""
+        db = get_db()
+        with db:
+            db.execute('DELETE FROM observation_search')
+            for row in db.execute('SELECT seq, data FROM observations').fetchall():
+                self._index_search(db, row['seq'], json.loads(row['data']))
+            db.execute("INSERT OR REPLACE INTO counters (name, value) VALUES ('index.search', 1)")
+    
+    def rebuild_sort_ranks(self):
+        """Fill the status and severity rank columns from a full scan"""
+        db = get_db()
+        with db:
+            for row in db.execute('SELECT id, data FROM observations').fetchall():
+                columns = self._index_columns(json.loads(row['data']))
+                db.execute('UPDATE observations SET status_rank = ?, severity_rank = ? WHERE id = ?',
+                           (*columns[4:], row['id']))
+            db.execute("INSERT OR REPLACE INTO counters (name, value) VALUES ('index.ranks', 1)")
+    
+    def rebuild_requirement_index(self):
+        """Rebuild the requirement -> observation inverted index from a full scan"""
+        db = get_db()
+        with db:
+            db.execute('DELETE FROM observation_requirements')
+            for row in db.execute('SELECT data FROM observations').fetchall():
+                self._index_requirements(db, json.loads(row['data']))
+            db.execute("INSERT OR REPLACE INTO counters (name, value) VALUES ('index.requirements', 1)")
+    
+    @staticmethod
+    def _format_stats(counter):
+        return {
+            'total': counter('stats.total'),
+            'by_status': {
+                'compliant': counter('stats.status.compliant'),
+                'gap': counter('stats.status.gap'),
+                'non_compliant': counter('stats.status.non-compliant')
+            },
+            'by_severity': {
+                'critical': counter('stats.severity.critical'),
+                'major': counter('stats.severity.major'),
+                'minor': counter('stats.severity.minor')
+            },
+            'total_evidence': counter('stats.evidence')
+        }
+    
+    @staticmethod
+    def _apply_stats(db, observation, sign):
+        deltas = {
+            'stats.total': sign,
+            f"stats.status.{observation.get('complianceStatus')}": sign,
+            f"stats.severity.{observation.get('severity')}": sign,
+            'stats.evidence': sign * len(observation.get('evidence') or [])
+        }
+        for name, delta in deltas.items():
+            db.execute(
+                'INSERT INTO counters (name, value) VALUES (?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+                (name, delta)
+            )
+    
+    @staticmethod
+    def _allocate_seqs(db, count):
+        """Reserve count consecutive sequence numbers and return the first one"""
+        db.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('observation', 0)")
+        db.execute("UPDATE counters SET value = value + ? WHERE name = 'observation'", (count,))
+        return db.execute("SELECT value FROM counters WHERE name = 'observation'").fetchone()[0] - count + 1
+    
+    def _insert(self, db, seq, observation):
+        db.execute(
+            'INSERT INTO observations (id, seq, linked_requirement_id, compliance_status, severity, category, '
+            'status_rank, severity_rank, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (observation['id'], seq, *self._index_columns(observation), json.dumps(observation))
+        )
+        self._apply_stats(db, observation, 1)
+        self._index_requirements(db, observation)
+        self._index_search(db, seq, observation)
+    
+    def _replace(self, db, observation):
+        row = db.execute('SELECT seq, data FROM observations WHERE id = ?', (observation['id'],)).fetchone()
+        if row is None:
+            return False
+        db.execute(
+            'UPDATE observations SET linked_requirement_id = ?, compliance_status = ?, severity = ?, '
+            'category = ?, status_rank = ?, severity_rank = ?, data = ? WHERE id = ?',
+            (*self._index_columns(observation), json.dumps(observation), observation['id'])
+        )
+        self._apply_stats(db, json.loads(row['data']), -1)
+        self._apply_stats(db, observation, 1)
+        db.execute('DELETE FROM observation_requirements WHERE observation_id = ?', (observation['id'],))
+        self._index_requirements(db, observation)
+        db.execute('DELETE FROM observation_search WHERE rowid = ?', (row['seq'],))
+        self._index_search(db, row['seq'], observation)
+        return True
+    
+    @staticmethod
+    def _index_search(db, seq, observation):
+        metadata = observation.get('metadata') or {}
+        db.execute(
+            'INSERT INTO observation_search (rowid, observation_text, audio_transcription, '
+            'handwritten_transcription, image_description) VALUES (?, ?, ?, ?, ?)',
+            (seq, observation.get('observationText') or '', metadata.get('audioTranscription') or '',
+             metadata.get('handwrittenTranscription') or '', metadata.get('imageDescription') or '')
+        )
+    
+    @staticmethod
+    def _index_requirements(db, observation):
+        db.executemany(
+            'INSERT OR IGNORE INTO observation_requirements (requirement_id, observation_id) VALUES (?, ?)',
+            [(requirement_id, observation['id']) for requirement_id in linked_requirement_ids(observation)]
+        )
+    
+    @staticmethod
+    def _filter_clauses(requirement_ids, match, compliance_status, severity, category):
+        clauses, params = [], []
+        
+        if requirement_ids:
+            if match not in ('any', 'all'):
+                raise ValueError("match must be 'any' or 'all'")
+            requirement_ids = list(dict.fromkeys(requirement_ids))
+            placeholders = ', '.join('?' * len(requirement_ids))
+            subquery = (f'SELECT observation_id FROM observation_requirements '
+                        f'WHERE requirement_id IN ({placeholders})')
+            if match == 'all' and len(requirement_ids) > 1:
+                subquery += ' GROUP BY observation_id HAVING COUNT(*) = ?'
+                params_extra = [len(requirement_ids)]
+            else:
+                params_extra = []
+            clauses.append(f'id IN ({subquery})')
+            params.extend(requirement_ids + params_extra)
+        
+        for column, value in (('compliance_status', compliance_status),
+                              ('severity', severity),
+                              ('category', category)):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        return clauses, params
+    
+    @staticmethod
+    def _encode_cursor(sort, order, value, seq):
+        raw = json.dumps([sort, order, value, seq]).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+    
+    @staticmethod
+    def _decode_cursor(cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            sort, order, value, seq = json.loads(raw)
+            return sort, order, value, int(seq)
+        except (ValueError, TypeError):
+            raise ValueError('Invalid cursor')
+    
+    @classmethod
+    def _index_columns(cls, observation):
+        # Sortable columns are never NULL so keyset comparisons stay well-defined; unknown values rank 0
+        linked = linked_requirement_ids(observation)[:1]
+        return (
+            linked[0] if linked else None,
+            observation.get('complianceStatus') or '',
+            observation.get('severity') or '',
+            observation.get('category') or '',
+            cls.STATUS_RANKS.get(observation.get('complianceStatus'), 0),
+            cls.SEVERITY_RANKS.get(observation.get('severity'), 0)
+        )
+
+observation_store = ObservationStore()
+
+OBSERVATION_SUMMARY_LENGTH = 120
+
+def project_observation(observation, fields):
+    """
+    Keep only the requested fields of an observation
+    
+    Dotted names select nested values (e.g. metadata.location). The virtual
+    field 'summary' is the first 120 characters of observationText.
+    """
+    projected = {}
+    for field in fields:
+        if field == 'summary':
+            projected['summary'] = (observation.get('observationText') or '')[:OBSERVATION_SUMMARY_LENGTH]
+            continue
+        
+        value = observation
+        for part in field.split('.'):
+            value = value.get(part) if isinstance(value, dict) else None
+        
+        target = projected
+        parts = field.split('.')
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return projected
+
+@app.route('/api/observations', methods=['GET'])
+def get_observations():
+    """
+    Get observations, optionally filtered, sorted, paginated and projected
+    
+    Query parameters (all optional; with none the full list is returned):
+      requirement_id  - one or more ids (repeated or comma-separated), matched
+                        against every entry in linkedRequirements
+      match           - any (default) | all, for multiple requirement ids
+      status, severity, category  - filters
+      sort    - created (default) | complianceStatus | severity | category
+      order   - asc (default) | desc
+      limit   - page size; the response then includes nextCursor
+      after   - nextCursor from the previous page
+      fields  - comma-separated fields to return, e.g. id,complianceStatus,severity,summary
+    """
+    try:
+        # requirement_id may be repeated or comma-separated
+        requirement_ids = [rid.strip() for value in request.args.getlist('requirement_id')
+                           for rid in value.split(',') if rid.strip()]
+        
+        limit = request.args.get('limit', type=int)
+        if limit is not None and limit < 1:
+            raise ValueError('limit must be a positive integer')
+        
+        observations, next_cursor = observation_store.page(
+            requirement_ids=requirement_ids,
+            match=request.args.get('match', 'any'),
+            compliance_status=request.args.get('status'),
+            severity=request.args.get('severity'),
+            category=request.args.get('category'),
+            sort=request.args.get('sort', 'created'),
+            order=request.args.get('order', 'asc'),
+            limit=limit,
+            after=request.args.get('after')
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    if fields:
+        observations = [project_observation(obs, fields) for obs in observations]
+    
+    return jsonify({
+        'success': True,
+        'observations': observations,
+        'nextCursor': next_cursor,
+        'hasMore': next_cursor is not None
+    })
+
+def build_observation(observation_id, data):
+    """Build a new observation document from a create request body"""
+    # Handle both single linkedRequirement (legacy) and linkedRequirements (array)
+    linked_requirements = data.get('linkedRequirements', [])
+    if not linked_requirements and data.get('linkedRequirement'):
+        linked_requirements = [data.get('linkedRequirement')]
+    
+    return {
+        'id': observation_id,
+        'linkedRequirement': linked_requirements[0] if linked_requirements else None,  # For backward compatibility
+        'linkedRequirements': linked_requirements,  # New field for multi-select
+        'observationText': data.get('observationText', ''),
+        'complianceStatus': data.get('complianceStatus', 'gap'),  # compliant | gap | non-compliant
+        'severity': data.get('severity', 'medium'),  # critical | major | minor
+        'category': data.get('category', ''),
+        'evidence': data.get('evidence', []),
+        'metadata': {
+            'location': data.get('location', ''),
+            'auditor': data.get('auditor', 'Current User'),
+            'interviewed': data.get('interviewed', ''),
+            'imageDescription': data.get('imageDescription', ''),
+            'audioTranscription': data.get('audioTranscription', ''),
+            'handwrittenTranscription': data.get('handwrittenTranscription', ''),
+            'timestamp': datetime.now().isoformat(),
+            'lastUpdated': datetime.now().isoformat()
+        },
+        'aiAnalysis': data.get('aiAnalysis', {}),
+        'followUp': data.get('followUp', []),
+        'tags': data.get('tags', [])
+    }
 
-# In-memory storage for observations (replace with database in production)
-observations_db = []
-observation_counter = 1
+def apply_observation_changes(observation, data):
+    """Apply the editable fields of an update request body to an observation"""
+    observation['observationText'] = data.get('observationText', observation['observationText'])
+    observation['complianceStatus'] = data.get('complianceStatus', observation['complianceStatus'])
+    observation['severity'] = data.get('severity', observation['severity'])
+    observation['evidence'] = data.get('evidence', observation['evidence'])
+    observation['followUp'] = data.get('followUp', observation['followUp'])
+    observation['metadata']['lastUpdated'] = datetime.now().isoformat()
+    return observation
 
-@app.route('/api/observations', methods=['GET'])
-def get_observations():
-    """Get all observations, optionally filtered by requirement"""
-    requirement_id = request.args.get('requirement_id')
+@app.route('/api/observations/search', methods=['GET'])
+def search_observations():
+    """
+    Full-text search across observation text, audio and handwritten
+    transcriptions and image descriptions, ranked by relevance
+    
+    Query parameters:
+      q       - search text, e.g. EX-24-0312 OR SOP-EM-001 ("quoted phrases", prefix*)
+      requirement_id, match, status, severity, category - same filters as GET /api/observations
+      limit   - maximum results (default 20, max 100)
+      offset  - skip this many results
+      fields  - optional projection of each observation, as in GET /api/observations
+    """
+    started = time.perf_counter()
+    try:
+        requirement_ids = [rid.strip() for value in request.args.getlist('requirement_id')
+                           for rid in value.split(',') if rid.strip()]
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        
+        hits = observation_store.search(
+            request.args.get('q', ''),
+            requirement_ids=requirement_ids,
+            match=request.args.get('match', 'any'),
+            compliance_status=request.args.get('status'),
+            severity=request.args.get('severity'),
+            category=request.args.get('category'),
+            limit=limit,
+            offset=offset
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     
-    if requirement_id:
-        filtered = [obs for obs in observations_db if obs.get('linkedRequirement', {}).get('id') == requirement_id]
-        return jsonify({'success': True, 'observations': filtered})
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    results = [{
+        'observation': project_observation(observation, fields) if fields else observation,
+        'score': round(score, 4),
+        'snippet': snippet
+    } for observation, score, snippet in hits]
     
-    return jsonify({'success': True, 'observations': observations_db})
+    return jsonify({
+        'success': True,
+        'query': request.args.get('q', ''),
+        'results': results,
+        'tookMs': round((time.perf_counter() - started) * 1000, 2)
+    })
 
 @app.route('/api/observations', methods=['POST'])
 def create_observation():
     """Create a new observation"""
-    global observation_counter
-    
     try:
         data = request.json
         
-        # Handle both single linkedRequirement (legacy) and linkedRequirements (array)
-        linked_requirements = data.get('linkedRequirements', [])
-        if not linked_requirements and data.get('linkedRequirement'):
-            linked_requirements = [data.get('linkedRequirement')]
-        
-        observation = {
-            'id': f'OBS-{observation_counter:03d}',
-            'linkedRequirement': linked_requirements[0] if linked_requirements else None,  # For backward compatibility
-            'linkedRequirements': linked_requirements,  # New field for multi-select
-            'observationText': data.get('observationText', ''),
-            'complianceStatus': data.get('complianceStatus', 'gap'),  # compliant | gap | non-compliant
-            'severity': data.get('severity', 'medium'),  # critical | major | minor
-            'category': data.get('category', ''),
-            'evidence': data.get('evidence', []),
-            'metadata': {
-                'location': data.get('location', ''),
-                'auditor': data.get('auditor', 'Current User'),
-                'interviewed': data.get('interviewed', ''),
-                'imageDescription': data.get('imageDescription', ''),
-                'audioTranscription': data.get('audioTranscription', ''),
-                'handwrittenTranscription': data.get('handwrittenTranscription', ''),
-                'timestamp': datetime.now().isoformat(),
-                'lastUpdated': datetime.now().isoformat()
-            },
-            'aiAnalysis': data.get('aiAnalysis', {}),
-            'followUp': data.get('followUp', []),
-            'tags': data.get('tags', [])
-        }
-        
-        observations_db.append(observation)
-        observation_counter += 1
+        observation = observation_store.create(lambda observation_id: build_observation(observation_id, data))
         
         return jsonify({
             'success': True,
@@ -712,10 +3641,69 @@ def create_observation():
             'error': f'Failed to create observation: {str(e)}'
         }), 500
 
+MAX_BULK_OPERATIONS = 500
+
+@app.route('/api/observations/bulk', methods=['POST'])
+def bulk_observations():
+    """
+    Create and update many observations in one atomic request (e.g. offline sync)
+    
+    Expected POST body (a bare array of operations is also accepted):
+    {
+        "operations": [
+            {"op": "create", "data": {...same body as POST /api/observations...}},
+            {"op": "update", "id": "OBS-004", "data": {...same body as PUT...}}
+        ]
+    }
+    Either every operation is applied or none is. The response lists a result
+    per operation in request order.
+    """
+    try:
+        body = request.json
+        operations = body.get('operations') if isinstance(body, dict) else body
+        
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'success': False, 'error': 'No operations provided'}), 400
+        if len(operations) > MAX_BULK_OPERATIONS:
+            return jsonify({
+                'success': False,
+                'error': f'Too many operations ({len(operations)}). Maximum is {MAX_BULK_OPERATIONS} per request.'
+            }), 400
+        if not all(isinstance(op, dict) for op in operations):
+            return jsonify({'success': False, 'error': 'Each operation must be an object'}), 400
+        
+        results = observation_store.apply_batch(operations, build_observation, apply_observation_changes)
+        
+        return jsonify({
+            'success': True,
+            'results': results,
+            'created': sum(1 for r in results if r['status'] == 'created'),
+            'updated': sum(1 for r in results if r['status'] == 'updated'),
+            'message': f'Applied {len(results)} operation(s)'
+        })
+        
+    except BatchError as e:
+        results = [{'index': r['index'], 'op': r['op'], 'status': 'rolled_back'} for r in e.results]
+        results.append({'index': e.index, 'op': operations[e.index].get('op', 'create'),
+                        'status': 'failed', 'error': e.message})
+        results += [{'index': i, 'op': op.get('op', 'create'), 'status': 'not_applied'}
+                    for i, op in enumerate(operations) if i > e.index]
+        return jsonify({
+            'success': False,
+            'error': f'Operation {e.index} failed: {e.message}. No changes were applied.',
+            'results': results
+        }), 400
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Failed to apply bulk operations: {str(e)}'
+        }), 500
+
 @app.route('/api/observations/<observation_id>', methods=['GET'])
 def get_observation(observation_id):
     """Get a specific observation"""
-    observation = next((obs for obs in observations_db if obs['id'] == observation_id), None)
+    observation = observation_store.get(observation_id)
     
     if observation:
         return jsonify({'success': True, 'observation': observation})
@@ -726,7 +3714,7 @@ def get_observation(observation_id):
 def update_observation(observation_id):
     """Update an existing observation"""
     try:
-        observation = next((obs for obs in observations_db if obs['id'] == observation_id), None)
+        observation = observation_store.get(observation_id)
         
         if not observation:
             return jsonify({'success': False, 'error': 'Observation not found'}), 404
@@ -734,12 +3722,10 @@ def update_observation(observation_id):
         data = request.json
         
         # Update fields
-        observation['observationText'] = data.get('observationText', observation['observationText'])
-        observation['complianceStatus'] = data.get('complianceStatus', observation['complianceStatus'])
-        observation['severity'] = data.get('severity', observation['severity'])
-        observation['evidence'] = data.get('evidence', observation['evidence'])
-        observation['followUp'] = data.get('followUp', observation['followUp'])
-        observation['metadata']['lastUpdated'] = datetime.now().isoformat()
+        apply_observation_changes(observation, data)
+        
+        if not observation_store.update(observation):
+            return jsonify({'success': False, 'error': 'Observation not found'}), 404
         
         return jsonify({
             'success': True,
@@ -756,42 +3742,319 @@ def update_observation(observation_id):
 @app.route('/api/observations/<observation_id>', methods=['DELETE'])
 def delete_observation(observation_id):
     """Delete an observation"""
-    global observations_db
-    
-    observation = next((obs for obs in observations_db if obs['id'] == observation_id), None)
-    
-    if observation:
-        observations_db = [obs for obs in observations_db if obs['id'] != observation_id]
+    if observation_store.delete(observation_id):
         return jsonify({'success': True, 'message': 'Observation deleted successfully'})
     else:
         return jsonify({'success': False, 'error': 'Observation not found'}), 404
 
 @app.route('/api/observations/stats', methods=['GET'])
 def get_observation_stats():
-    """Get observation statistics"""
-    stats = {
-        'total': len(observations_db),
-        'by_status': {
-            'compliant': len([o for o in observations_db if o['complianceStatus'] == 'compliant']),
-            'gap': len([o for o in observations_db if o['complianceStatus'] == 'gap']),
-            'non_compliant': len([o for o in observations_db if o['complianceStatus'] == 'non-compliant'])
-        },
-        'by_severity': {
-            'critical': len([o for o in observations_db if o['severity'] == 'critical']),
-            'major': len([o for o in observations_db if o['severity'] == 'major']),
-            'minor': len([o for o in observations_db if o['severity'] == 'minor'])
-        },
-        'total_evidence': sum(len(o.get('evidence', [])) for o in observations_db)
-    }
+    """
+    Get observation statistics
+    
+    Served from incrementally maintained counters. Pass ?verify=true to also
+    recompute from scratch and report whether the counters are consistent.
+    """
+    stats = observation_store.stats()
+    response = {'success': True, 'stats': stats}
+    
+    if is_truthy(request.args.get('verify')):
+        recomputed = observation_store.recompute_stats()
+        response['consistency'] = {
+            'consistent': recomputed == stats,
+            'recomputed': recomputed
+        }
+    
+    return jsonify(response)
+
+class DataframeSplitBody:
+    """
+    Streaming request body for {"dataframe_split": {"columns": [0], "data": [["<base64 audio>"]]}}
+    
+    The audio stream is read and base64-encoded one chunk at a time while
+    requests sends the body, so the encoded payload is never held in memory.
+    The encoded length is known up front, so requests sends a Content-Length.
+    """
+    
+    PREFIX = b'{"dataframe_split": {"columns": [0], "data": [["'
+    SUFFIX = b'"]]}}'
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self.start = stream.tell()
+        stream.seek(0, os.SEEK_END)
+        self.size = stream.tell() - self.start
+        stream.seek(self.start)
+    
+    def __len__(self):
+        return len(self.PREFIX) + 4 * ((self.size + 2) // 3) + len(self.SUFFIX)
+    
+    def __iter__(self):
+        self.stream.seek(self.start)
+        yield self.PREFIX
+        leftover = b''
+        while True:
+            chunk = self.stream.read(AUDIO_STREAM_CHUNK_BYTES)
+            if not chunk:
+                break
+            # Short reads are possible; only encode whole 3-byte groups until the end
+            chunk = leftover + chunk
+            cut = len(chunk) - len(chunk) % 3
+            leftover = chunk[cut:]
+            yield base64.b64encode(chunk[:cut])
+        if leftover:
+            yield base64.b64encode(leftover)
+        yield self.SUFFIX
+
+class EmptyTranscription(ValueError):
+    """Whisper answered but returned no text (e.g. a silent recording)"""
+
+def run_transcribe_audio(audio):
+    """
+    Transcribe audio with Whisper using the dataframe_split format
+    
+    audio is either a path to a saved file or a seekable binary stream such as
+    an uploaded file. Shared by the synchronous endpoint and the background
+    job worker. Returns the transcription text; a saved file is left in place.
+    """
+    if isinstance(audio, str):
+        with open(audio, 'rb') as f:
+            return run_transcribe_audio(f)
+    
+    try:
+        # Payload in dataframe_split format, using positional indexing (0) instead of
+        # column names; the audio is base64-encoded as it is sent
+        body = DataframeSplitBody(audio)
+        
+        # Set the authentication header
+        headers = {
+            "Authorization": f"Bearer {DATABRICKS_TOKEN}",
+            "Content-Type": "application/json"
+        }
+        
+        # Send the POST request to the Databricks endpoint
+        print(f"Sending request to Whisper endpoint: {WHISPER_HOST} ({body.size:,} audio bytes)")
+        response = whisper_session.post(WHISPER_HOST, headers=headers, data=body, timeout=120)
+        response.raise_for_status()  # Raise an exception for HTTP errors
+        
+        # Parse and extract the transcription
+        result = response.json()
+        transcription = result.get("predictions", [None])[0]
+        
+        if not transcription:
+            raise EmptyTranscription("No transcription returned from Whisper API")
+        
+        print(f"Transcription successful: {len(transcription)} characters")
+        return transcription
+        
+    except requests.exceptions.HTTPError as e:
+        error_msg = f'HTTP error from Whisper API: {e.response.status_code} - {e.response.text}'
+        print(error_msg)
+        raise Exception(error_msg)
+
+# Long recordings are split into overlapping windows that are transcribed concurrently
+AUDIO_SEGMENT_SECONDS = int(os.getenv('AUDIO_SEGMENT_SECONDS', 30))
+AUDIO_SEGMENT_OVERLAP_SECONDS = int(os.getenv('AUDIO_SEGMENT_OVERLAP_SECONDS', 2))
+AUDIO_SEGMENT_WORKERS = int(os.getenv('AUDIO_SEGMENT_WORKERS', 4))
+AUDIO_SEGMENT_MIN_BYTES = 1024 * 1024  # Smaller uploads always go to Whisper in one request
+AUDIO_SAMPLE_RATE = 16000  # Whisper resamples to 16 kHz mono anyway
+FFMPEG = shutil.which('ffmpeg')
+STITCH_WINDOW_WORDS = 25
+
+# Shared by all requests, so concurrent recordings cannot exceed the worker count
+segment_executor = ThreadPoolExecutor(max_workers=AUDIO_SEGMENT_WORKERS, thread_name_prefix='whisper-segment')
+
+def decode_audio_to_wav(stream):
+    """
+    Write the recording to a temporary PCM WAV file and return its path
+    
+    WAV uploads are copied as-is; other formats are converted to 16 kHz mono
+    with ffmpeg. Returns None when the audio cannot be decoded (no ffmpeg, or
+    ffmpeg rejects the input). The caller removes the file.
+    """
+    header = stream.read(12)
+    stream.seek(0)
+    is_wav = header[:4] == b'RIFF' and header[8:12] == b'WAVE'
+    if not is_wav and not FFMPEG:
+        return None
+    
+    fd, wav_path = tempfile.mkstemp(suffix='.wav', dir=app.config['AUDIO_FOLDER'])
+    os.close(fd)
+    try:
+        if is_wav:
+            with open(wav_path, 'wb') as out:
+                shutil.copyfileobj(stream, out)
+            with wave.open(wav_path, 'rb'):
+                pass  # Raises wave.Error for compressed WAV
+        else:
+            process = subprocess.Popen(
+                [FFMPEG, '-v', 'error', '-y', '-i', 'pipe:0', '-ac', '1', '-ar', str(AUDIO_SAMPLE_RATE),
+                 '-f', 'wav', wav_path],
+                stdin=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+            try:
+                shutil.copyfileobj(stream, process.stdin)
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            if process.wait() != 0:
+                print(f"ffmpeg could not decode audio: {process.stderr.read().decode(errors='replace').strip()}")
+                os.remove(wav_path)
+                return None
+        return wav_path
+    except (wave.Error, EOFError) as e:
+        print(f"Unsupported WAV audio, sending as a single request: {e}")
+        os.remove(wav_path)
+        return None
+
+def plan_audio_segments(wav_path):
+    """Return (start_frame, frame_count) windows covering the recording with overlap"""
+    with wave.open(wav_path, 'rb') as wav:
+        rate = wav.getframerate()
+        total = wav.getnframes()
+    
+    window = AUDIO_SEGMENT_SECONDS * rate
+    step = window - AUDIO_SEGMENT_OVERLAP_SECONDS * rate
+    segments = []
+    start = 0
+    while True:
+        segments.append((start, min(window, total - start)))
+        if start + window >= total:
+            return segments
+        start += step
+
+def transcribe_segment(wav_path, start, count):
+    """Transcribe one window of a WAV file; an empty transcription (silence) gives ''"""
+    with wave.open(wav_path, 'rb') as wav:
+        params = wav.getparams()
+        wav.setpos(start)
+        frames = wav.readframes(count)
+    
+    segment = io.BytesIO()
+    with wave.open(segment, 'wb') as out:
+        out.setparams(params)
+        out.writeframes(frames)
+    segment.seek(0)
+    
+    # Only a silent window becomes a gap; any other failure fails the whole recording, so nothing is cached
+    try:
+        return run_transcribe_audio(segment)
+    except EmptyTranscription:
+        return ''
+
+def normalize_word(word):
+    return re.sub(r'[^\w]', '', word.lower())
+
+def stitch_transcripts(texts):
+    """
+    Join segment transcriptions in order, removing text repeated in the overlap
+    
+    The tail of the text so far and the head of the next segment are aligned on
+    their longest common run of words (ignoring case and punctuation). Words
+    after the run in the tail and before it in the head are boundary fragments
+    and are dropped. Without a run of at least two words (or one long word) the
+    segments are simply concatenated.
+    """
+    words = []
+    for text in texts:
+        following = text.split()
+        if not words:
+            words = following
+            continue
+        
+        tail_start = max(len(words) - STITCH_WINDOW_WORDS, 0)
+        tail = [normalize_word(w) for w in words[tail_start:]]
+        head = [normalize_word(w) for w in following[:STITCH_WINDOW_WORDS]]
+        
+        # Longest common contiguous run between tail and head (ties go to more characters)
+        best, best_chars, best_i, best_j = 0, 0, 0, 0
+        previous = [(0, 0)] * (len(head) + 1)
+        for i in range(1, len(tail) + 1):
+            current = [(0, 0)] * (len(head) + 1)
+            for j in range(1, len(head) + 1):
+                if tail[i - 1] and tail[i - 1] == head[j - 1]:
+                    run, chars = previous[j - 1]
+                    current[j] = (run + 1, chars + len(tail[i - 1]))
+                    if current[j] > (best, best_chars):
+                        (best, best_chars), best_i, best_j = current[j], i, j
+            previous = current
+        
+        if best >= 2 or best_chars >= 5:
+            words = words[:tail_start + best_i] + following[best_j:]
+        else:
+            words = words + following
+    return ' '.join(words)
+
+def run_transcribe_recording(audio):
+    """
+    Transcribe a recording of any length
+    
+    Recordings longer than one AUDIO_SEGMENT_SECONDS window are decoded to WAV,
+    split into overlapping windows and transcribed concurrently on
+    segment_executor, then stitched back together in order. Short recordings,
+    and audio that cannot be decoded locally, go to Whisper in one request.
+    """
+    if isinstance(audio, str):
+        with open(audio, 'rb') as f:
+            return run_transcribe_recording(f)
+    
+    audio.seek(0, os.SEEK_END)
+    size = audio.tell()
+    audio.seek(0)
+    if size < AUDIO_SEGMENT_MIN_BYTES:
+        return run_transcribe_audio(audio)
+    
+    wav_path = decode_audio_to_wav(audio)
+    if wav_path is None:
+        audio.seek(0)
+        return run_transcribe_audio(audio)
+    
+    try:
+        segments = plan_audio_segments(wav_path)
+        if len(segments) == 1:
+            audio.seek(0)
+            return run_transcribe_audio(audio)
+        
+        print(f"Transcribing {len(segments)} segments of {AUDIO_SEGMENT_SECONDS}s "
+              f"({AUDIO_SEGMENT_OVERLAP_SECONDS}s overlap) with {AUDIO_SEGMENT_WORKERS} workers")
+        futures = [segment_executor.submit(transcribe_segment, wav_path, start, count)
+                   for start, count in segments]
+        transcription = stitch_transcripts(future.result() for future in futures)
+        if not transcription:
+            raise ValueError("No transcription returned from Whisper API")
+        return transcription
+    finally:
+        os.remove(wav_path)
+
+def run_transcribe_audio_cached(audio):
+    """
+    Transcribe audio (a path or seekable binary stream), reusing the result for
+    identical bytes. Returns (transcription, cached).
+    """
+    if isinstance(audio, str):
+        with open(audio, 'rb') as f:
+            return run_transcribe_audio_cached(f)
     
-    return jsonify({'success': True, 'stats': stats})
+    key = transcription_cache_key(upload_sha256(audio), WHISPER_HOST, AUDIO_TRANSCRIPTION_VERSION,
+                                  AUDIO_SEGMENT_SECONDS, AUDIO_SEGMENT_OVERLAP_SECONDS)
+    return cached_transcription(audio_transcription_cache, key, lambda: run_transcribe_recording(audio))
+
+def run_transcribe_audio_job(payload):
+    """Background job handler for audio transcription; removes the audio file once done"""
+    audio_path = payload['audio_path']
+    try:
+        transcription, cached = run_transcribe_audio_cached(audio_path)
+        return {'success': True, 'transcription': transcription, 'cached': cached}
+    finally:
+        if os.path.exists(audio_path):
+            os.remove(audio_path)
 
 @app.route('/api/audio/transcribe', methods=['POST'])
 def transcribe_audio():
     """
     Transcribe audio file using Whisper model with Databricks dataframe_split format
     Expects: multipart/form-data with 'audio' file
-    Returns: transcribed text
+    Returns: transcribed text (or a job id with ?async=true)
     """
     try:
         if not WHISPER_HOST or not DATABRICKS_TOKEN:
@@ -809,68 +4072,22 @@ def transcribe_audio():
         if audio_file.filename == '':
             return jsonify({'success': False, 'error': 'No audio file selected'}), 400
         
-        # Save audio file temporarily
-        audio_filename = f"temp_{uuid.uuid4()}.webm"
-        audio_path = os.path.join(app.config['AUDIO_FOLDER'], audio_filename)
-        audio_file.save(audio_path)
+        # The job worker owns (and removes) a saved copy of the file from here on
+        if is_truthy(request.args.get('async')):
+            audio_filename = f"temp_{uuid.uuid4()}.webm"
+            audio_path = os.path.join(app.config['AUDIO_FOLDER'], audio_filename)
+            audio_file.save(audio_path)
+            return submit_job_response('transcribe_audio', {'audio_path': audio_path})
         
-        print(f"Transcribing audio: {audio_filename}")
+        # Stream straight from the spooled upload; nothing is written to AUDIO_FOLDER
+        print(f"Transcribing audio: {audio_file.filename}")
+        transcription, cached = run_transcribe_audio_cached(audio_file.stream)
         
-        try:
-            # Read and encode the audio file to base64
-            with open(audio_path, "rb") as f:
-                audio_base64 = base64.b64encode(f.read()).decode("utf-8")
-            
-            # Define the JSON payload in dataframe_split format
-            # Use positional indexing (0) instead of column names
-            payload = {
-                "dataframe_split": {
-                    "columns": [0],
-                    "data": [[audio_base64]]
-                }
-            }
-            
-            # Set the authentication header
-            headers = {
-                "Authorization": f"Bearer {DATABRICKS_TOKEN}",
-                "Content-Type": "application/json"
-            }
-            
-            # Send the POST request to the Databricks endpoint
-            print(f"Sending request to Whisper endpoint: {WHISPER_HOST}")
-            response = requests.post(WHISPER_HOST, headers=headers, json=payload, timeout=120)
-            response.raise_for_status()  # Raise an exception for HTTP errors
-            
-            # Clean up temp file
-            os.remove(audio_path)
-            
-            # Parse and extract the transcription
-            result = response.json()
-            transcription = result.get("predictions", [None])[0]
-            
-            if not transcription:
-                raise ValueError("No transcription returned from Whisper API")
-            
-            print(f"Transcription successful: {len(transcription)} characters")
-            
-            return jsonify({
-                'success': True,
-                'transcription': transcription
-            })
-            
-        except requests.exceptions.HTTPError as e:
-            # Clean up temp file on error
-            if os.path.exists(audio_path):
-                os.remove(audio_path)
-            error_msg = f'HTTP error from Whisper API: {e.response.status_code} - {e.response.text}'
-            print(error_msg)
-            raise Exception(error_msg)
-            
-        except Exception as e:
-            # Clean up temp file on error
-            if os.path.exists(audio_path):
-                os.remove(audio_path)
-            raise e
+        return jsonify({
+            'success': True,
+            'transcription': transcription,
+            'cached': cached
+        })
             
     except Exception as e:
         error_msg = f'Failed to transcribe audio: {str(e)}'
@@ -879,12 +4096,144 @@ def transcribe_audio():
         print(traceback.format_exc())
         return jsonify({'success': False, 'error': error_msg}), 500
 
+def link_uploaded_document(original_filename, sha256, duplicate):
+    """Name a stored blob as a new upload and register it; the response body for a finished upload"""
+    unique_filename = f"{uuid.uuid4()}{os.path.splitext(original_filename)[1]}"
+    blob_store.link(sha256, os.path.join(app.config['UPLOAD_FOLDER'], unique_filename))
+    return {
+        'success': True,
+        'message': f"Successfully uploaded {original_filename}",
+        'documents': [register_uploaded_document(unique_filename, original_filename, sha256)],
+        'duplicates': int(duplicate)
+    }
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """
+    Start a resumable upload
+    
+    Expects JSON: {"filename": "...", "size": <bytes>, "kind": "document" | "audio",
+    "chunkSize": <optional bytes>, "sha256": <optional hex digest checked on commit>}
+    """
+    data = request.get_json(silent=True) or {}
+    # No shortcut for a declared hash that is already stored: linking it without the bytes would
+    # reveal that a document exists. Duplicates are detected on commit, once the hash is verified
+    try:
+        session = upload_sessions.create(data.get('kind', 'document'), data.get('filename'), data.get('size'),
+                                         data.get('chunkSize'), data.get('sha256'))
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    return jsonify({'success': True, 'upload': session}), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Received offset and next expected chunk, for resuming after a dropped connection"""
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        return jsonify({'success': False, 'error': 'Upload session not found'}), 404
+    return jsonify({'success': True, 'upload': session})
+
+@app.route('/api/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def put_upload_chunk(upload_id, index):
+    """Append chunk `index`; the raw request body is the chunk's bytes"""
+    try:
+        session = upload_sessions.write_chunk(upload_id, index, request.stream, request.content_length)
+    except UploadError as e:
+        session = upload_sessions.get(upload_id)
+        return jsonify({'success': False, 'error': str(e), 'upload': session}), e.status
+    return jsonify({'success': True, 'upload': session})
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    """Cancel a resumable upload and delete what was received"""
+    try:
+        upload_sessions.abort(upload_id)
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    return jsonify({'success': True})
+
+@app.route('/api/uploads/<upload_id>/commit', methods=['POST'])
+def commit_upload(upload_id):
+    """
+    Finish a resumable upload and hand the file to the usual flow
+    
+    Documents are added like /api/upload and return the document. Audio is
+    transcribed like /api/audio/transcribe, including ?async=true for a job.
+    """
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        return jsonify({'success': False, 'error': 'Upload session not found'}), 404
+    if session['kind'] == 'audio' and (not WHISPER_HOST or not DATABRICKS_TOKEN):
+        return jsonify({
+            'success': False,
+            'error': 'Whisper service not configured. Please set WHISPER_HOST and DATABRICKS_TOKEN in environment variables.'
+        }), 503
+    
+    # Documents land next to the blobs, so storing them is a rename; prune() spares new temp files
+    if session['kind'] == 'document':
+        dest_path = os.path.join(BLOB_FOLDER, f'{upload_id}.tmp')
+    else:
+        dest_path = os.path.join(app.config['AUDIO_FOLDER'], f"temp_{uuid.uuid4()}{os.path.splitext(session['filename'])[1]}")
+    
+    try:
+        session, sha256 = upload_sessions.commit(upload_id, dest_path)
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e), 'upload': upload_sessions.get(upload_id)}), e.status
+    
+    if session['kind'] == 'document':
+        duplicate = not blob_store.put_file(dest_path, sha256)
+        return jsonify(link_uploaded_document(session['filename'], sha256, duplicate))
+    
+    # The job worker owns (and removes) the file from here on
+    audio_path = dest_path
+    if is_truthy(request.args.get('async')):
+        return submit_job_response('transcribe_audio', {'audio_path': audio_path})
+    
+    try:
+        print(f"Transcribing audio: {session['filename']}")
+        return jsonify(run_transcribe_audio_job({'audio_path': audio_path}))
+    except Exception as e:
+        error_msg = f'Failed to transcribe audio: {str(e)}'
+        print(error_msg)
+        return jsonify({'success': False, 'error': error_msg}), 500
+
+HANDWRITING_PROMPT = """Please transcribe all handwritten text from this image. 
+
+Instructions:
+- Extract all handwritten text exactly as written
+- Maintain the structure and organization of the notes
+- Include any diagrams or sketches descriptions in [brackets]
+- If text is unclear or illegible, indicate with [illegible]
+- Preserve bullet points, numbering, and formatting
+- Include any signatures, dates, or timestamps
+
+Provide only the transcribed text, without any additional commentary or explanations."""
+
+def run_transcribe_handwritten(image_base64):
+    """Transcribe handwritten notes from a base64 image using Claude Vision"""
+    images, _ = preprocess_images([image_base64], 'handwriting')
+    return call_claude_with_vision(HANDWRITING_PROMPT, images[0], max_tokens=2000)
+
+def run_transcribe_handwritten_cached(image_base64):
+    """Transcribe handwriting, reusing the result for an identical image. Returns (transcription, cached)."""
+    # The image is preprocessed before the call, so its settings (or their absence without Pillow) shape the output
+    preprocessing = IMAGE_PROFILES['handwriting'] if Image is not None else None
+    key = transcription_cache_key(sha256_base64_image(image_base64), CLAUDE_MODEL, HANDWRITING_PROMPT_VERSION,
+                                  preprocessing)
+    return cached_transcription(handwriting_transcription_cache, key,
+                                lambda: run_transcribe_handwritten(image_base64))
+
+def run_transcribe_handwritten_job(payload):
+    """Background job handler for handwriting transcription"""
+    transcription, cached = run_transcribe_handwritten_cached(payload['image'])
+    return {'success': True, 'transcription': transcription, 'cached': cached}
+
 @app.route('/api/handwritten/transcribe', methods=['POST'])
 def transcribe_handwritten():
     """
     Transcribe handwritten notes using Claude Vision API
     Expects: Base64 encoded image
-    Returns: Transcribed text
+    Returns: Transcribed text (or a job id with ?async=true)
     """
     try:
         if not DATABRICKS_HOST or not DATABRICKS_TOKEN:
@@ -899,25 +4248,16 @@ def transcribe_handwritten():
         if not image_base64:
             return jsonify({'success': False, 'error': 'No image provided'}), 400
         
-        # Prepare prompt for OCR
-        prompt = """Please transcribe all handwritten text from this image. 
-
-Instructions:
-- Extract all handwritten text exactly as written
-- Maintain the structure and organization of the notes
-- Include any diagrams or sketches descriptions in [brackets]
-- If text is unclear or illegible, indicate with [illegible]
-- Preserve bullet points, numbering, and formatting
-- Include any signatures, dates, or timestamps
-
-Provide only the transcribed text, without any additional commentary or explanations."""
-
-        # Call Claude Vision API
-        response_text = call_claude_with_vision(prompt, image_base64, max_tokens=2000)
+        if is_truthy(request.args.get('async')):
+            return submit_job_response('transcribe_handwritten', {'image': image_base64})
+        
+        # Call Claude Vision API (or reuse the transcription of an identical image)
+        response_text, cached = run_transcribe_handwritten_cached(image_base64)
         
         return jsonify({
             'success': True,
-            'transcription': response_text
+            'transcription': response_text,
+            'cached': cached
         })
         
     except Exception as e:
@@ -927,61 +4267,115 @@ Provide only the transcribed text, without any additional commentary or explanat
         print(traceback.format_exc())
         return jsonify({'success': False, 'error': error_msg}), 500
 
+def normalize_image_data(image_data):
+    """Normalize imageData to a list of non-empty base64 strings"""
+    if isinstance(image_data, str) and image_data:
+        image_data = [image_data]
+    elif not isinstance(image_data, list):
+        image_data = []
+    
+    # Filter out empty strings
+    return [img for img in image_data if img]
+
+def run_analyze_observation(data):
+    """
+    Run the AI analysis for an observation payload
+    
+    Shared by the synchronous endpoint and the background job worker.
+    Returns the parsed analysis dict.
+    """
+    observation_text = data.get('observationText', '')
+    image_description = data.get('imageDescription', '')  # Manual description (optional)
+    image_data = normalize_image_data(data.get('imageData', []))  # Can be array of Base64 images or single image
+    audio_transcription = data.get('audioTranscription', '')  # From speech-to-text
+    available_requirements = data.get('requirements', [])  # List of generated requirements
+    
+    # Preprocess photos, then drop near-duplicates and cap the count before building the prompt
+    image_report = None
+    if image_data:
+        image_data, image_report = preprocess_images(image_data, 'analysis')
+        sent, skipped = select_images(image_report['images'], IMAGE_MAX_PER_ANALYSIS)
+        image_report['sent'] = sent
+        image_report['skipped'] = skipped
+        image_report['bytes_skipped'] = sum(image_report['images'][entry['index']]['processed_bytes']
+                                            for entry in skipped)
+        image_data = [image_data[index] for index in sent]
+        if skipped:
+            print(f"Skipping {len(skipped)} image(s): "
+                  + ', '.join(f"#{entry['index']} ({entry['reason']})" for entry in skipped))
+    
+    # Send only the requirements most relevant to this observation
+    available_requirements, requirement_report = select_relevant_requirements(
+        available_requirements,
+        ' '.join([observation_text, image_description, audio_transcription])
+    )
+    if requirement_report['sent'] < requirement_report['total']:
+        print(f"Requirements: sending top {requirement_report['sent']} of {requirement_report['total']}")
+    
+    num_images = len(image_data)
+    print(f"Analyzing observation with Claude...")
+    print(f"Text: {len(observation_text)} chars, Images: {num_images}, Audio: {len(audio_transcription)} chars")
+    
+    # Build comprehensive prompt for Claude, within the token budget (images count as input)
+    image_tokens = 0
+    if image_report:
+        image_tokens = sum(estimate_image_tokens(image_report['images'][index].get('size'))
+                           for index in image_report['sent'])
+    budget = TokenBudget('analysis', analysis_output_tokens(num_images), extra_input_tokens=image_tokens)
+    prompt = build_observation_analysis_prompt(
+        observation_text, 
+        image_description, 
+        audio_transcription,
+        available_requirements,
+        num_images=num_images,
+        budget=budget
+    )
+    budget.log()
+    
+    # Call Claude - with vision if images provided
+    if image_data:
+        print(f"Using Claude VISION API for {num_images} image(s) analysis")
+        llm_response = call_claude_with_multiple_images(prompt, image_data, max_tokens=budget.max_tokens)
+    else:
+        llm_response = call_claude(prompt, max_tokens=budget.max_tokens)
+    
+    print(f"Claude response received")
+    
+    # Parse response
+    analysis = parse_observation_analysis(llm_response)
+    analysis['requirement_selection'] = requirement_report
+    analysis['token_budget'] = budget.report()
+    if image_report:
+        analysis['image_preprocessing'] = image_report
+    return analysis
+
+def run_analyze_observation_job(payload):
+    """Background job handler for observation analysis"""
+    return {'success': True, 'analysis': run_analyze_observation(payload)}
+
 @app.route('/api/observations/analyze', methods=['POST'])
 def analyze_observation():
     """
     AI-powered analysis of observation to auto-tag requirement and extract insights
-    Accepts: text observation + optional images (up to 5 base64) + optional audio transcription
+    Accepts: text observation + optional base64 images (near-duplicates are skipped and at most
+             IMAGE_MAX_PER_ANALYSIS are sent) + optional audio transcription
     Returns: Suggested requirement match, citations, compliance status, severity
+             (or a job id with ?async=true)
     """
     try:
         data = request.json
         
-        observation_text = data.get('observationText', '')
-        image_description = data.get('imageDescription', '')  # Manual description (optional)
-        image_data = data.get('imageData', [])  # Can be array of Base64 images or single image
-        audio_transcription = data.get('audioTranscription', '')  # From speech-to-text
-        available_requirements = data.get('requirements', [])  # List of generated requirements
-        
-        # Normalize image_data to always be a list
-        if isinstance(image_data, str) and image_data:
-            image_data = [image_data]
-        elif not isinstance(image_data, list):
-            image_data = []
-        
-        # Filter out empty strings
-        image_data = [img for img in image_data if img]
-        
-        if not observation_text and not image_description and not audio_transcription and not image_data:
+        if not (data.get('observationText') or data.get('imageDescription')
+                or data.get('audioTranscription') or normalize_image_data(data.get('imageData', []))):
             return jsonify({
                 'success': False,
                 'error': 'At least one input (text, image, or audio) is required'
             }), 400
         
-        num_images = len(image_data)
-        print(f"Analyzing observation with Claude...")
-        print(f"Text: {len(observation_text)} chars, Images: {num_images}, Audio: {len(audio_transcription)} chars")
-        
-        # Build comprehensive prompt for Claude
-        prompt = build_observation_analysis_prompt(
-            observation_text, 
-            image_description, 
-            audio_transcription,
-            available_requirements,
-            num_images=num_images
-        )
-        
-        # Call Claude - with vision if images provided
-        if image_data:
-            print(f"Using Claude VISION API for {num_images} image(s) analysis")
-            llm_response = call_claude_with_multiple_images(prompt, image_data, max_tokens=4000)
-        else:
-            llm_response = call_claude(prompt, max_tokens=2000)
-        
-        print(f"Claude response received")
+        if is_truthy(request.args.get('async')):
+            return submit_job_response('analyze_observation', data)
         
-        # Parse response
-        analysis = parse_observation_analysis(llm_response)
+        analysis = run_analyze_observation(data)
         
         return jsonify({
             'success': True,
@@ -995,7 +4389,51 @@ def analyze_observation():
         print(traceback.format_exc())
         return jsonify({'success': False, 'error': error_msg}), 500
 
-def build_observation_analysis_prompt(observation_text, image_desc, audio_trans, requirements, num_images=0):
+def build_observation_analysis_prompt(observation_text, image_desc, audio_trans, requirements, num_images=0,
+                                      budget=None):
+    """
+    Build the analysis prompt within the 'analysis' token budget
+    
+    Over budget, sections are trimmed lowest priority first: the audio
+    transcription, then each requirement's text (200 -> 100 characters, then
+    none), then the least relevant requirements (requirements arrive ranked),
+    then the image notes and finally the written observation.
+    """
+    budget = budget or TokenBudget('analysis', analysis_output_tokens(num_images))
+    state = {
+        'observation_text': observation_text or '',
+        'image_desc': image_desc or '',
+        'audio_trans': audio_trans or '',
+        'requirements': list(requirements),
+        'requirement_chars': 200
+    }
+    
+    def shorten_requirement_text(overflow):
+        if state['requirement_chars'] == 0:
+            return False
+        state['requirement_chars'] = 100 if state['requirement_chars'] > 100 else 0
+        return True
+    
+    return budget.fit(
+        lambda: render_observation_analysis_prompt(
+            state['observation_text'], state['image_desc'], state['audio_trans'],
+            state['requirements'], num_images, state['requirement_chars']
+        ),
+        [
+            ('audio_transcription', shrink_text(state, 'audio_trans', 300)),
+            ('requirement_text', shorten_requirement_text),
+            ('requirements', shrink_list(state['requirements'], 3)),
+            ('image_description', shrink_text(state, 'image_desc', 200)),
+            ('observation_text', shrink_text(state, 'observation_text', 500))
+        ]
+    )
+
+def analysis_output_tokens(num_images=0):
+    """Output budget for one observation analysis"""
+    return min(ANALYSIS_OUTPUT_TOKENS + num_images * ANALYSIS_OUTPUT_TOKENS_PER_IMAGE, ANALYSIS_MAX_OUTPUT_TOKENS)
+
+def render_observation_analysis_prompt(observation_text, image_desc, audio_trans, requirements, num_images=0,
+                                       requirement_chars=200):
     """Build prompt for AI observation analysis"""
     
     # Combine all inputs
@@ -1027,7 +4465,8 @@ def build_observation_analysis_prompt(observation_text, image_desc, audio_trans,
         req_context += f"  Citation: {citation}\n"
         req_context += f"  Category: {req.get('category', 'N/A')}\n"
         req_context += f"  Risk Level: {req.get('risk_level', 'N/A')}\n"
-        req_context += f"  Requirement: {req_text[:200]}...\n"
+        if requirement_chars:
+            req_context += f"  Requirement: {req_text[:requirement_chars]}...\n"
     
     vision_instructions = ""
     if num_images > 0:
@@ -1131,20 +4570,7 @@ Think carefully about the regulatory context and implications. Be specific and a
 def parse_observation_analysis(response):
     """Parse Claude's observation analysis response"""
     try:
-        # Extract JSON from response
-        if "```json" in response:
-            json_start = response.find("```json") + 7
-            json_end = response.find("```", json_start)
-            json_str = response[json_start:json_end].strip()
-        elif "```" in response:
-            json_start = response.find("```") + 3
-            json_end = response.find("```", json_start)
-            json_str = response[json_start:json_end].strip()
-        else:
-            json_str = response.strip()
-        
-        analysis = json.loads(json_str)
-        return analysis
+        return extract_json(response)
         
     except json.JSONDecodeError as e:
         print(f"Error parsing analysis response: {e}")
@@ -1162,6 +4588,67 @@ def parse_observation_analysis(response):
             "error": "Failed to parse AI response"
         }
 
+@app.route('/api/jobs/stats', methods=['GET'])
+def get_job_stats():
+    """Get job queue depth and wait times"""
+    return jsonify({'success': True, 'stats': job_queue.stats()})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status (and result, once finished) of a background job"""
+    job = job_queue.get(job_id)
+    
+    if job:
+        return jsonify({'success': True, 'job': job})
+    else:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    """
+    Subscribe to a background job's progress using Server-Sent Events
+    
+    Emits a status event whenever the job changes state, then a final
+    complete or failed event with the full job, and closes the stream.
+    """
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    def generate():
+        last_status = None
+        while True:
+            job = job_queue.get(job_id)
+            if job['status'] == 'succeeded':
+                yield sse_event('complete', job)
+                return
+            if job['status'] == 'failed':
+                yield sse_event('failed', job)
+                return
+            if job['status'] != last_status:
+                yield sse_event('status', job)
+                last_status = job['status']
+            else:
+                yield ": keep-alive\n\n"
+            job_queue.wait_for_change(timeout=15)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Get hit/miss counters and size for the response caches"""
+    return jsonify({
+        'success': True,
+        'caches': {
+            'requirements': requirements_cache.stats(),
+            'audio_transcriptions': audio_transcription_cache.stats(),
+            'handwriting_transcriptions': handwriting_transcription_cache.stats()
+        }
+    })
+
 @app.route('/api/health')
 def health_check():
     """Health check endpoint"""
@@ -1171,7 +4658,30 @@ def health_check():
         'llm_configured': bool(DATABRICKS_TOKEN and DATABRICKS_TOKEN != 'your-token')
     })
 
+job_queue.register('generate_requirements', run_generate_requirements_job)
+job_queue.register('transcribe_audio', run_transcribe_audio_job)
+job_queue.register('transcribe_handwritten', run_transcribe_handwritten_job)
+job_queue.register('analyze_observation', run_analyze_observation_job)
+
+def init_background_services():
+    """
+    Start the work a serving process does in the background
+    
+    Re-queues interrupted jobs, precompresses the frontend, expires stale
+    upload sessions and starts the document reconcile loop, which prunes blobs
+    and thumbnails in uploads/ and data/. Called only by the server entry
+    points (python app.py and wsgi.py), so importing this module from a
+    benchmark, test or extraction worker never touches those folders.
+    """
+    job_queue.recover()
+    frontend_cache.warm()
+    upload_sessions.expire()
+    threading.Thread(target=reconcile_documents_periodically, name='document-reconcile', daemon=True).start()
+
 if __name__ == '__main__':
+    # Under the debug reloader the parent process only watches files; the child serves requests and runs jobs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        init_background_services()
     print("Starting Audit POC Flask Server...")
     print("Frontend available at: http://localhost:5000")
     print("API endpoints available at: http://localhost:5000/api/")
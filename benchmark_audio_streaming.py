@@ -0,0 +1,116 @@
+"""
+Benchmark for the Whisper upload path
+Measures peak RSS of one 50 MB transcription with the previous implementation
+(read file, base64 string, json payload) against the streaming request body.
+Whisper is replaced by a local stub server that decodes the payload and
+returns its SHA-256, so the check also confirms the audio arrives intact.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+AUDIO_MB = 50
+
+def print_section(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+class StubWhisperHandler(BaseHTTPRequestHandler):
+    """Accepts a dataframe_split payload and returns the SHA-256 of the decoded audio"""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        audio = base64.b64decode(json.loads(body)['dataframe_split']['data'][0][0])
+        response = json.dumps({'predictions': [hashlib.sha256(audio).hexdigest()]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+def peak_rss_mb():
+    """Peak resident set size of this process (VmHWM, Linux only)"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+
+def run_variant(variant, audio_path):
+    """Child process: transcribe once and report peak RSS before and after"""
+    os.chdir(tempfile.mkdtemp())  # uploads/ and data/ are relative to the working directory
+    os.environ.setdefault('AUDIT_DB_PATH', os.path.join(os.getcwd(), 'benchmark.db'))
+    os.environ.setdefault('DATABRICKS_TOKEN', 'benchmark')
+    os.environ.setdefault('DATABRICKS_HOST', 'http://localhost')
+    import requests
+    import app
+
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if variant == 'previous':
+        # The implementation before streaming
+        with open(audio_path, "rb") as f:
+            audio_base64 = base64.b64encode(f.read()).decode("utf-8")
+        payload = {"dataframe_split": {"columns": [0], "data": [[audio_base64]]}}
+        headers = {"Authorization": f"Bearer {app.DATABRICKS_TOKEN}", "Content-Type": "application/json"}
+        response = requests.post(app.WHISPER_HOST, headers=headers, json=payload, timeout=120)
+        response.raise_for_status()
+        transcription = response.json()["predictions"][0]
+    else:
+        transcription = app.run_transcribe_audio(audio_path)
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        'baseline_mb': baseline,
+        'peak_mb': peak_rss_mb(),
+        'seconds': elapsed,
+        'sha256': transcription
+    }))
+
+def main():
+    print_section("WHISPER UPLOAD MEMORY BENCHMARK")
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubWhisperHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    audio_path = os.path.join(tempfile.mkdtemp(), 'recording.webm')
+    digest = hashlib.sha256()
+    with open(audio_path, 'wb') as f:
+        for _ in range(AUDIO_MB):
+            block = os.urandom(1024 * 1024)
+            digest.update(block)
+            f.write(block)
+    expected = digest.hexdigest()
+
+    env = dict(os.environ, WHISPER_HOST=f'http://127.0.0.1:{server.server_address[1]}/invocations')
+    print(f"Audio: {AUDIO_MB} MB, stub Whisper at {env['WHISPER_HOST']}\n")
+    print(f"  {'implementation':<12} {'baseline MB':>12} {'peak MB':>9} {'added MB':>9} {'seconds':>8} {'intact':>7}")
+    for variant in ['previous', 'streaming']:
+        output = subprocess.run(
+            [sys.executable, __file__, variant, audio_path],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        intact = '✓' if result['sha256'] == expected else '✗'
+        print(f"  {variant:<12} {result['baseline_mb']:>12.1f} {result['peak_mb']:>9.1f} "
+              f"{result['peak_mb'] - result['baseline_mb']:>9.1f} {result['seconds']:>8.2f} {intact:>7}")
+
+    server.shutdown()
+    os.remove(audio_path)
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        run_variant(sys.argv[1], sys.argv[2])
+    else:
+        main()
@@ -0,0 +1,156 @@
+"""
+Benchmark for background document text extraction
+Generates text PDFs and DOCX files, then measures extraction throughput
+(pages/sec) in-process and through the document_extractor process pool,
+how long /api/upload takes to return, and that re-uploading the same files
+reuses the chunk index instead of extracting again. Requires pypdf and
+python-docx.
+"""
+
+import io
+import os
+import random
+import tempfile
+import time
+
+from docx import Document
+
+PDF_FILES = 16
+DOCX_FILES = 4
+PAGES_PER_FILE = 40
+LINES_PER_PAGE = 45
+POOL_WORKERS = 4
+
+WORDS = ('batch record deviation investigation aseptic filling grade environmental monitoring sterilisation '
+         'validation cleaning disinfection operator gowning media fill CAPA root cause review approval '
+         'specification equipment calibration qualification excursion trend alert action limit').split()
+
+def print_section(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+def page_lines(rng):
+    return [' '.join(rng.choice(WORDS) for _ in range(12)) for _ in range(LINES_PER_PAGE)]
+
+def make_pdf(seed):
+    """A text PDF with PAGES_PER_FILE pages of Helvetica text"""
+    rng = random.Random(seed)
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None, '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for _ in range(PAGES_PER_FILE):
+        text = ''.join(f'({line}) Tj T* ' for line in page_lines(rng))
+        content = f'BT /F1 10 Tf 14 TL 40 800 Td {text}ET'
+        objects.append(f'<< /Length {len(content)} >>\nstream\n{content}\nendstream')
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+                       f'/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>')
+        kids.append(f'{len(objects)} 0 R')
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = io.BytesIO()
+    out.write(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f'{number} 0 obj\n{body}\nendobj\n'.encode('latin-1'))
+    xref = out.tell()
+    out.write(f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode())
+    for offset in offsets:
+        out.write(f'{offset:010d} 00000 n \n'.encode())
+    out.write(f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode())
+    return out.getvalue()
+
+def make_docx(seed):
+    """A DOCX with PAGES_PER_FILE pages separated by page breaks"""
+    rng = random.Random(seed)
+    document = Document()
+    for number in range(PAGES_PER_FILE):
+        for line in page_lines(rng):
+            document.add_paragraph(line)
+        if number < PAGES_PER_FILE - 1:
+            document.add_page_break()
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+def make_files(seed):
+    """(filename, bytes) pairs; a new seed gives new content and so new hashes"""
+    files = [(f'SOP_{seed}_{i:02d}.pdf', make_pdf(seed * 1000 + i)) for i in range(PDF_FILES)]
+    files += [(f'Batch_Record_{seed}_{i:02d}.docx', make_docx(seed * 1000 + 500 + i)) for i in range(DOCX_FILES)]
+    return files
+
+def save_files(files):
+    """Save into uploads/ and record in the manifest; returns [(filename, sha256)]"""
+    saved = []
+    for name, data in files:
+        filename = f'{app.uuid.uuid4()}{os.path.splitext(name)[1]}'
+        with open(os.path.join(app.UPLOAD_FOLDER, filename), 'wb') as f:
+            f.write(data)
+        sha256 = app.hashlib.sha256(data).hexdigest()
+        app.document_manifest.add(filename, os.path.splitext(name)[0], app.categorize_document(name), sha256)
+        saved.append((filename, sha256))
+    return saved
+
+def main():
+    # Extraction workers import app afresh and inherit these settings
+    global app
+    os.chdir(tempfile.mkdtemp())  # uploads/ is relative to the working directory
+    os.environ['AUDIT_DB_PATH'] = os.path.join(os.getcwd(), 'benchmark.db')
+    os.environ.setdefault('DATABRICKS_TOKEN', 'benchmark')
+    os.environ.setdefault('DATABRICKS_HOST', 'http://localhost')
+    import app
+
+    print_section("DOCUMENT TEXT EXTRACTION BENCHMARK")
+    total_pages = (PDF_FILES + DOCX_FILES) * PAGES_PER_FILE
+    print(f"{PDF_FILES} PDF + {DOCX_FILES} DOCX files x {PAGES_PER_FILE} pages = {total_pages} pages per run, "
+          f"{os.cpu_count()} CPU(s)\n")
+
+    print(f"  {'extraction':<32} {'seconds':>8} {'pages/sec':>10}")
+
+    # On demand inside a request thread, one file after another
+    saved = save_files(make_files(1))
+    start = time.perf_counter()
+    pages = sum(app.extract_document_chunks(os.path.join(app.UPLOAD_FOLDER, f))['pages'] for f, _ in saved)
+    seconds = time.perf_counter() - start
+    print(f"  {'in-process, sequential':<32} {seconds:>8.2f} {pages / seconds:>10.1f}")
+
+    # Process pool, including worker start-up
+    for seed, workers in [(2, 1), (3, POOL_WORKERS)]:
+        extractor = app.DocumentExtractor(workers)
+        saved = save_files(make_files(seed))
+        start = time.perf_counter()
+        for filename, sha256 in saved:
+            extractor.submit(filename, sha256)
+        extractor.wait()
+        seconds = time.perf_counter() - start
+        pages = sum(extractor.get(sha256)['pages'] for _, sha256 in saved)
+        print(f"  {f'process pool, {workers} worker(s)':<32} {seconds:>8.2f} {pages / seconds:>10.1f}")
+
+    print_section("Upload path")
+    client = app.app.test_client()
+    files = make_files(4)
+
+    def upload():
+        start = time.perf_counter()
+        response = client.post('/api/upload', data={'files': [(io.BytesIO(data), name) for name, data in files]},
+                               content_type='multipart/form-data').get_json()
+        return response['documents'], (time.perf_counter() - start) * 1000
+
+    documents, upload_ms = upload()
+    print(f"  /api/upload returned in {upload_ms:.0f} ms, statuses: "
+          f"{sorted({d['status'] for d in documents})}")
+    start = time.perf_counter()
+    app.document_extractor.wait()
+    statuses = {app.document_manifest.get(d['id'])['status'] for d in documents}
+    print(f"  Background extraction finished {time.perf_counter() - start:.2f} s later, statuses: {sorted(statuses)}")
+
+    extractions = app.get_db().execute('SELECT COUNT(*) FROM document_text').fetchone()[0]
+    documents, upload_ms = upload()
+    print(f"  Re-upload returned in {upload_ms:.0f} ms, statuses: {sorted({d['status'] for d in documents})}, "
+          f"new extractions: {app.get_db().execute('SELECT COUNT(*) FROM document_text').fetchone()[0] - extractions}")
+
+    chunks = app.document_extractor.chunks(documents[0]['sha256'])
+    print(f"  First document: {len(chunks)} chunks, e.g. page {chunks[0]['page']}: {chunks[0]['text'][:60]}...")
+
+if __name__ == "__main__":
+    main()
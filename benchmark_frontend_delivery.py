@@ -0,0 +1,73 @@
+"""
+Benchmark for frontend delivery
+Loads the main page through the Flask test client the way a browser would,
+first without a cached copy and then revalidating with If-None-Match, and
+compares bytes transferred and the transfer time at a slow site Wi-Fi speed
+against the previous uncompressed send_file response.
+"""
+
+import os
+import tempfile
+import time
+
+# Run against a throwaway database; the LLM client only needs placeholder settings
+os.chdir(tempfile.mkdtemp())  # uploads/ and data/ are relative to the working directory
+os.environ['AUDIT_DB_PATH'] = os.path.join(os.getcwd(), 'benchmark.db')
+os.environ.setdefault('DATABRICKS_TOKEN', 'benchmark')
+os.environ.setdefault('DATABRICKS_HOST', 'http://localhost')
+
+import app
+
+WIFI_MBPS = 2
+PAGE_LOADS = 10
+
+def print_section(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+def transfer_seconds(size):
+    return size * 8 / (WIFI_MBPS * 1_000_000)
+
+def load(client, accept_encoding, etag=None):
+    """Return (status, body bytes, ETag, server ms) for one page load"""
+    headers = {'Accept-Encoding': accept_encoding}
+    if etag:
+        headers['If-None-Match'] = etag
+    start = time.perf_counter()
+    response = client.get('/', headers=headers)
+    body = response.data
+    return response.status_code, len(body), response.headers.get('ETag'), (time.perf_counter() - start) * 1000
+
+def main():
+    print_section("FRONTEND DELIVERY BENCHMARK")
+    print(f"{PAGE_LOADS} page loads of / per client, {WIFI_MBPS} Mbps site Wi-Fi\n")
+
+    client = app.app.test_client()
+    start = time.perf_counter()
+    app.FrontendCache(app.app.root_path, app.FRONTEND_PAGES).warm()  # As init_background_services() does at startup
+    print(f"  Precompressing {len(app.FRONTEND_PAGES)} pages at startup: {(time.perf_counter() - start) * 1000:.0f} ms\n")
+
+    # Previous behaviour: the whole file on every load
+    previous = os.path.getsize(os.path.join(app.app.root_path, 'audit_poc.html'))
+    print(f"  {'client':<26} {'first load':>11} {'repeat':>8} {'total bytes':>12} {'Wi-Fi s':>8} {'server ms':>10}")
+    print(f"  {'previous (no ETag)':<26} {previous:>11,} {previous:>8,} {previous * PAGE_LOADS:>12,} "
+          f"{transfer_seconds(previous * PAGE_LOADS):>8.2f} {'':>10}")
+
+    for label, accept_encoding in [('no compression', 'identity'), ('gzip', 'gzip, deflate'),
+                                   ('brotli', 'gzip, deflate, br')]:
+        status, first, etag, first_ms = load(client, accept_encoding)
+        repeats, repeat_ms = [], []
+        for _ in range(PAGE_LOADS - 1):
+            status, size, _, ms = load(client, accept_encoding, etag)
+            assert status == 304, status
+            repeats.append(size)
+            repeat_ms.append(ms)
+        total = first + sum(repeats)
+        print(f"  {label:<26} {first:>11,} {max(repeats):>8,} {total:>12,} {transfer_seconds(total):>8.2f} "
+              f"{sum(repeat_ms) / len(repeat_ms):>10.2f}")
+
+    print("\n  Repeat loads are 304 Not Modified; server ms is the mean per revalidation")
+
+if __name__ == "__main__":
+    main()
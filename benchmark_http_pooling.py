@@ -0,0 +1,116 @@
+"""
+Benchmark for connection reuse on the Whisper endpoint
+Sends small transcription requests to a local stub server over HTTP and HTTPS
+(self-signed certificate, needs the openssl command), comparing a new
+connection per call (the previous requests.post) against the pooled
+whisper_session, sequentially and from 8 threads.
+"""
+
+import json
+import os
+import ssl
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CALLS = 200
+THREADS = 8
+
+# Run against a throwaway database; the LLM client only needs placeholder settings
+os.chdir(tempfile.mkdtemp())  # uploads/ and data/ are relative to the working directory
+os.environ['AUDIT_DB_PATH'] = os.path.join(os.getcwd(), 'benchmark.db')
+os.environ.setdefault('DATABRICKS_TOKEN', 'benchmark')
+os.environ.setdefault('DATABRICKS_HOST', 'http://localhost')
+
+import requests
+import urllib3
+import app
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+def print_section(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+class StubWhisperHandler(BaseHTTPRequestHandler):
+    """Keep-alive capable stub that returns a fixed transcription"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # Avoid 40 ms delayed-ACK stalls on kept-alive connections
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        response = json.dumps({'predictions': ['Gowning procedure observed.']}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(tls):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubWhisperHandler)
+    if tls:
+        directory = tempfile.mkdtemp()
+        cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                        '-subj', '/CN=127.0.0.1', '-keyout', key, '-out', cert],
+                       check=True, capture_output=True)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    scheme = 'https' if tls else 'http'
+    return server, f'{scheme}://127.0.0.1:{server.server_address[1]}/invocations'
+
+def call(post, url):
+    """One transcription-shaped request; returns latency in ms"""
+    payload = '{"dataframe_split": {"columns": [0], "data": [["UklGRiQAAABXQVZF"]]}}'
+    headers = {'Authorization': 'Bearer benchmark', 'Content-Type': 'application/json'}
+    start = time.perf_counter()
+    response = post(url, headers=headers, data=payload, timeout=10, verify=False)
+    response.raise_for_status()
+    response.json()
+    return (time.perf_counter() - start) * 1000
+
+def measure(post, url, threads):
+    """Return (mean ms, p95 ms, total seconds) for CALLS requests"""
+    call(post, url)  # warm up
+    start = time.perf_counter()
+    if threads == 1:
+        samples = [call(post, url) for _ in range(CALLS)]
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            samples = list(pool.map(lambda _: call(post, url), range(CALLS)))
+    total = time.perf_counter() - start
+    samples.sort()
+    return statistics.mean(samples), samples[int(len(samples) * 0.95) - 1], total
+
+def main():
+    print_section("WHISPER CONNECTION REUSE BENCHMARK")
+    print(f"{CALLS} calls per case, pool size {app.HTTP_POOL_SIZE}\n")
+    print(f"  {'transport':<7} {'client':<22} {'threads':>7} {'mean ms':>8} {'p95 ms':>7} {'total s':>8}")
+
+    for tls in [False, True]:
+        try:
+            server, url = start_server(tls)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"  Skipping HTTPS: could not create a certificate ({e})")
+            continue
+        for threads in [1, THREADS]:
+            for label, post in [('new connection/call', requests.post),
+                                ('pooled whisper_session', app.whisper_session.post)]:
+                mean_ms, p95_ms, total = measure(post, url, threads)
+                transport = 'https' if tls else 'http'
+                print(f"  {transport:<7} {label:<22} {threads:>7} {mean_ms:>8.2f} {p95_ms:>7.2f} {total:>8.2f}")
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark for image preprocessing before vision calls
+Builds phone-camera-sized JPEGs (12 MP, EXIF orientation and GPS tags) and
+measures bytes and time saved when analyze_observation sends five of them to a
+local stub of the Claude endpoint that reads the body at a simulated uplink
+speed. Requires Pillow.
+"""
+
+import base64
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+UPLINK_MBPS = 20
+PHOTOS = 5
+PHOTO_SIZE = (4032, 3024)
+
+def print_section(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+class StubClaudeHandler(BaseHTTPRequestHandler):
+    """Chat completions stub that reads the request at UPLINK_MBPS"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        remaining = int(self.headers['Content-Length'])
+        chunk = 64 * 1024
+        while remaining:
+            remaining -= len(self.rfile.read(min(chunk, remaining)))
+            time.sleep(chunk * 8 / (UPLINK_MBPS * 1_000_000))
+
+        analysis = {'matched_requirements': [], 'compliance_status': 'gap', 'severity': 'minor',
+                    'analysis': 'Gasket shows wear.', 'recommendations': [], 'key_findings': []}
+        response = json.dumps({
+            'id': 'stub', 'object': 'chat.completion', 'created': 0, 'model': 'stub',
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': json.dumps(analysis)}}],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+def make_photo(seed):
+    """Detailed 12 MP JPEG at camera quality, rotated via EXIF, with a GPS tag"""
+    base = Image.effect_noise((PHOTO_SIZE[0] // 8, PHOTO_SIZE[1] // 8), 60 + seed)
+    img = Image.merge('RGB', [base, base.rotate(90, expand=False), base.transpose(Image.FLIP_LEFT_RIGHT)])
+    img = img.resize(PHOTO_SIZE, Image.BICUBIC)
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90 CW
+    exif[0x8825] = {1: 'N', 2: (37.0, 46.0, 30.0)}  # GPS IFD
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=95, exif=exif)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+def main():
+    print_section("IMAGE PREPROCESSING BENCHMARK")
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubClaudeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.chdir(tempfile.mkdtemp())  # uploads/ and data/ are relative to the working directory
+    os.environ['AUDIT_DB_PATH'] = os.path.join(os.getcwd(), 'benchmark.db')
+    os.environ['DATABRICKS_HOST'] = f'http://127.0.0.1:{server.server_address[1]}'
+    os.environ.setdefault('DATABRICKS_TOKEN', 'benchmark')
+    os.environ['IMAGE_UPLINK_MBPS'] = str(UPLINK_MBPS)
+    import app
+
+    photos = [make_photo(i) for i in range(PHOTOS)]
+    payload = {'observationText': 'Gasket on filling line 2 looks worn.', 'imageData': photos}
+    print(f"{PHOTOS} photos at {PHOTO_SIZE[0]}x{PHOTO_SIZE[1]}, simulated uplink {UPLINK_MBPS} Mbps\n")
+
+    # Previous behaviour: images forwarded as captured
+    start = time.perf_counter()
+    app.call_claude_with_multiple_images('Analyze', photos, max_tokens=100)
+    raw_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    analysis = app.run_analyze_observation(payload)
+    processed_seconds = time.perf_counter() - start
+    report = analysis['image_preprocessing']
+
+    print_section("Results")
+    print(f"  {'':<28} {'bytes':>12} {'seconds':>9}")
+    print(f"  {'Forwarded as captured':<28} {report['original_bytes']:>12,} {raw_seconds:>9.2f}")
+    print(f"  {'Preprocessed (analysis)':<28} {report['processed_bytes']:>12,} {processed_seconds:>9.2f}")
+    print(f"\n  Bytes saved: {report['bytes_saved']:,} "
+          f"({report['bytes_saved'] / report['original_bytes']:.0%})")
+    print(f"  Preprocessing wall time ({app.IMAGE_WORKERS} workers): {report['preprocess_ms']:.0f} ms")
+    print(f"  Output size: {report['images'][0]['original_size']} -> {report['images'][0]['size']} (EXIF-rotated)")
+
+    for profile in ['analysis', 'handwriting']:
+        _, single = app.preprocess_images(photos[:1], profile)
+        print(f"  Profile {profile:<12} {single['images'][0]['size']}, {single['processed_bytes']:,} bytes")
+
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark for parsing LLM JSON responses
+Builds requirement responses of 100 KB to 1 MB wrapped in a markdown fence,
+with trailing commas and raw newlines inside strings, and times the previous
+parse path (json.loads, then fix_common_json_errors on failure) against the
+single-pass extract_json. Time per MB should stay flat as responses grow.
+Response shapes that must parse are checked first.
+"""
+
+import json
+import os
+import re
+import tempfile
+import time
+
+# Run against a throwaway database; the LLM client only needs placeholder settings
+os.chdir(tempfile.mkdtemp())  # uploads/ and data/ are relative to the working directory
+os.environ['AUDIT_DB_PATH'] = os.path.join(os.getcwd(), 'benchmark.db')
+os.environ.setdefault('DATABRICKS_TOKEN', 'benchmark')
+os.environ.setdefault('DATABRICKS_HOST', 'http://localhost')
+
+import app
+
+SIZES_KB = [100, 250, 500, 1000]
+PREVIOUS_MAX_KB = 250  # The previous path is quadratic; larger sizes take minutes
+REPEATS = 3
+
+# (response, expected) pairs extract_json must handle
+CASES = [
+    ('```json\n{"a": 1,}\n```', {'a': 1}),
+    ('Requirements below:\n```json\n{"a": [1, 2,]}\n```\nNotes follow.', {'a': [1, 2]}),
+    ('{"a": 1}\n```', {'a': 1}),
+    ('{"code": "use ```json fences```"}', {'code': 'use ```json fences```'}),
+    ('Here you go: {"a": "line one\nline two"} hope that helps', {'a': 'line one\nline two'}),
+]
+
+def print_section(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+def make_response(size_kb):
+    """A fenced requirements response with trailing commas and multi-line strings"""
+    requirements = []
+    length = 0
+    while length < size_kb * 1024:
+        n = len(requirements) + 1
+        requirement = (
+            f'    {{\n      "id": "req_{n:05d}",\n      "category": "Environmental Monitoring",\n'
+            f'      "citation": "EU GMP Annex 1 § 9.{n % 40}",\n      "risk_level": "High",\n'
+            f'      "requirement_text": "Alert and action limits must be set for viable particles.\n'
+            f'Excursions must be investigated, with \\"root cause\\" and CAPA documented.",\n'
+            f'      "audit_guidance": "Review EM trend reports, excursion logs and CAPA records.",\n    }}'
+        )
+        requirements.append(requirement)
+        length += len(requirement) + 2
+    return ('Here are the requirements for this audit scope:\n\n```json\n{\n  "requirements": [\n'
+            + ',\n'.join(requirements) + ',\n  ]\n}\n```\n')
+
+def previous_parse(response):
+    """The parse path before extract_json, kept for comparison"""
+    def clean_json_string(json_str):
+        json_str = json_str.lstrip('\ufeff\xef\xbb\xbf')
+        json_str = re.sub(r',\s*}', '}', json_str)
+        return re.sub(r',\s*]', ']', json_str)
+
+    json_start = response.find("```json") + 7
+    json_str = clean_json_string(response[json_start:response.find("```", json_start)].strip())
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        json_str = re.sub(r'(?<!\\)\n(?=[^"]*"(?:[^"]*"[^"]*")*[^"]*$)', r'\\n', json_str)
+        return json.loads(json_str)
+
+def best_of(parse, response):
+    """Return (best seconds, requirement count)"""
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        data = parse(response)
+        best = min(best, time.perf_counter() - start)
+    return best, len(data['requirements'])
+
+def check_cases():
+    for response, expected in CASES:
+        result = app.extract_json(response)
+        assert result == expected, f"{response!r} parsed as {result!r}"
+    print(f"  {len(CASES)} response shapes parse as expected")
+
+def main():
+    print_section("LLM JSON EXTRACTION BENCHMARK")
+    check_cases()
+    print(f"Best of {REPEATS} runs; previous path measured up to {PREVIOUS_MAX_KB} KB\n")
+    print(f"  {'size':>8} {'requirements':>12} {'previous ms':>12} {'extract_json ms':>16} {'ms per MB':>10}")
+
+    per_mb = []
+    for size_kb in SIZES_KB:
+        response = make_response(size_kb)
+        seconds, count = best_of(app.extract_json, response)
+        megabytes = len(response) / (1024 * 1024)
+        per_mb.append(seconds * 1000 / megabytes)
+
+        previous = ''
+        if size_kb <= PREVIOUS_MAX_KB:
+            previous_seconds, previous_count = best_of(previous_parse, response)
+            previous = f"{previous_seconds * 1000:,.1f}" if previous_count == count else 'mismatch'
+
+        print(f"  {len(response) // 1024:>5} KB {count:>12,} {previous:>12} "
+              f"{seconds * 1000:>16.1f} {per_mb[-1]:>10.1f}")
+
+    print(f"\n  extract_json ms per MB, largest / smallest: {per_mb[-1] / per_mb[0]:.2f}x (1.0 = linear)")
+
+if __name__ == "__main__":
+    main()
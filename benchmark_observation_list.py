@@ -0,0 +1,122 @@
+"""
+Benchmark for GET /api/observations
+Reports response size and serialization time for a 5,000-observation audit,
+comparing the full list against field projection and cursor pagination
+"""
+
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+# Run against a throwaway database; the LLM client only needs placeholder settings
+os.chdir(tempfile.mkdtemp())  # uploads/ and data/ are relative to the working directory
+os.environ['AUDIT_DB_PATH'] = os.path.join(os.getcwd(), 'benchmark.db')
+os.environ.setdefault('DATABRICKS_TOKEN', 'benchmark')
+os.environ.setdefault('DATABRICKS_HOST', 'http://localhost')
+
+import app
+
+OBSERVATIONS = 5000
+REPEAT = 5
+LIST_FIELDS = 'id,complianceStatus,severity,summary'
+
+SENTENCE = ("Operator entered Grade A without sanitizing gloves; EM excursion EX-24-0312 "
+            "investigation overdue per SOP-EM-001. ")
+
+def print_section(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+def make_observation(observation_id):
+    """Observation with realistic transcription and AI analysis payloads"""
+    requirement = {'id': f'req_{random.randint(1, 40):03d}', 'citation': 'EU GMP Annex 1 § 4.29'}
+    now = datetime.now().isoformat()
+    return {
+        'id': observation_id,
+        'linkedRequirement': requirement,
+        'linkedRequirements': [requirement],
+        'observationText': SENTENCE * random.randint(2, 6),
+        'complianceStatus': random.choice(['compliant', 'gap', 'non-compliant']),
+        'severity': random.choice(['critical', 'major', 'minor']),
+        'category': 'Environmental Monitoring',
+        'evidence': [f'Investigation report EX-24-{n:04d}' for n in range(random.randint(1, 6))],
+        'metadata': {
+            'location': 'Grade A Filling Room 2',
+            'auditor': 'Current User',
+            'interviewed': 'Sarah Chen (EM Coordinator)',
+            'imageDescription': SENTENCE * 2,
+            'audioTranscription': SENTENCE * random.randint(20, 40),
+            'handwrittenTranscription': SENTENCE * random.randint(5, 15),
+            'timestamp': now,
+            'lastUpdated': now
+        },
+        'aiAnalysis': {
+            'analysis': SENTENCE * 4,
+            'recommendations': [SENTENCE] * 3,
+            'key_findings': [SENTENCE] * 3,
+            'suggested_observation_text': SENTENCE * 5
+        },
+        'followUp': [],
+        'tags': []
+    }
+
+def measure(client, url):
+    """Return (bytes, mean ms, median ms) for GET url"""
+    samples = []
+    size = 0
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        response = client.get(url)
+        body = response.get_data()
+        samples.append((time.perf_counter() - start) * 1000)
+        size = len(body)
+    return size, statistics.mean(samples), statistics.median(samples)
+
+def walk_pages(client, page_size):
+    """Fetch every page with projection; return (total bytes, total ms, pages)"""
+    total_bytes, pages, cursor = 0, 0, None
+    start = time.perf_counter()
+    while True:
+        url = f'/api/observations?limit={page_size}&fields={LIST_FIELDS}'
+        if cursor:
+            url += f'&after={cursor}'
+        data = client.get(url)
+        total_bytes += len(data.get_data())
+        pages += 1
+        cursor = data.json['nextCursor']
+        if not cursor:
+            break
+    return total_bytes, (time.perf_counter() - start) * 1000, pages
+
+def main():
+    print_section("OBSERVATION LIST BENCHMARK")
+    random.seed(42)
+
+    print(f"Loading {OBSERVATIONS:,} observations...")
+    for _ in range(OBSERVATIONS):
+        app.observation_store.create(make_observation)
+
+    client = app.app.test_client()
+    cases = [
+        ('Full list (previous behaviour)', '/api/observations'),
+        ('Full list, projected', f'/api/observations?fields={LIST_FIELDS}'),
+        ('First page of 50, full objects', '/api/observations?limit=50'),
+        ('First page of 50, projected', f'/api/observations?limit=50&fields={LIST_FIELDS}'),
+    ]
+
+    print_section(f"Response size and time ({REPEAT} runs each)")
+    print(f"  {'request':<34} {'bytes':>12} {'mean ms':>9} {'median ms':>10}")
+    for label, url in cases:
+        size, mean_ms, median_ms = measure(client, url)
+        print(f"  {label:<34} {size:>12,} {mean_ms:>9.1f} {median_ms:>10.1f}")
+
+    total_bytes, total_ms, pages = walk_pages(client, 200)
+    print(f"\n  Walking all {pages} pages of 200 (projected): {total_bytes:,} bytes in {total_ms:.1f} ms")
+    print(f"\n  Projection: fields={LIST_FIELDS}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark for GET /api/observations/search
+Loads 50,000 observations and reports full-text query latency, with and
+without status/severity filters, against the target of 50 ms per query
+"""
+
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+# Run against a throwaway database; the LLM client only needs placeholder settings
+os.chdir(tempfile.mkdtemp())  # uploads/ and data/ are relative to the working directory
+os.environ['AUDIT_DB_PATH'] = os.path.join(os.getcwd(), 'benchmark.db')
+os.environ.setdefault('DATABRICKS_TOKEN', 'benchmark')
+os.environ.setdefault('DATABRICKS_HOST', 'http://localhost')
+
+import app
+
+OBSERVATIONS = 50_000
+REPEAT = 20
+TARGET_MS = 50
+
+FINDINGS = [
+    "Operator entered Grade A without sanitizing gloves.",
+    "Trending analysis for environmental monitoring data not performed quarterly.",
+    "Gowning qualification records are current for all aseptic operators.",
+    "Media fill documentation was missing the line clearance signature.",
+    "Cleaning log for the isolator was completed after the batch started.",
+    "Differential pressure alarm acknowledged without documented assessment.",
+]
+SOPS = [f'SOP-{area}-{n:03d}' for area in ('EM', 'QA', 'TR', 'CL') for n in range(1, 26)]
+
+def print_section(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+def make_observation(observation_id):
+    """Observation with transcriptions that mention excursion and SOP numbers"""
+    excursion = f'EX-24-{random.randint(1, 9999):04d}'
+    sop = random.choice(SOPS)
+    requirement = {'id': f'req_{random.randint(1, 40):03d}', 'citation': 'EU GMP Annex 1 § 4.29'}
+    now = datetime.now().isoformat()
+    return {
+        'id': observation_id,
+        'linkedRequirement': requirement,
+        'linkedRequirements': [requirement],
+        'observationText': f"{random.choice(FINDINGS)} Investigation {excursion} references {sop}.",
+        'complianceStatus': random.choice(['compliant', 'gap', 'non-compliant']),
+        'severity': random.choice(['critical', 'major', 'minor']),
+        'category': 'Environmental Monitoring',
+        'evidence': [],
+        'metadata': {
+            'location': 'Grade A Filling Room 2',
+            'audioTranscription': ' '.join(random.sample(FINDINGS, 3)) + f" The coordinator mentioned {sop}.",
+            'handwrittenTranscription': random.choice(FINDINGS),
+            'imageDescription': 'Photo of the filling line gowning area',
+            'timestamp': now,
+            'lastUpdated': now
+        },
+        'aiAnalysis': {},
+        'followUp': [],
+        'tags': []
+    }
+
+def measure(client, url):
+    """Return (result count, mean ms, p95 ms) for GET url"""
+    samples = []
+    count = 0
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        response = client.get(url)
+        samples.append((time.perf_counter() - start) * 1000)
+        count = len(response.json['results'])
+    samples.sort()
+    return count, statistics.mean(samples), samples[int(len(samples) * 0.95) - 1]
+
+def main():
+    print_section("OBSERVATION SEARCH BENCHMARK")
+    random.seed(42)
+
+    print(f"Loading {OBSERVATIONS:,} observations...")
+    start = time.perf_counter()
+    for _ in range(OBSERVATIONS):
+        app.observation_store.create(make_observation)
+    print(f"  Loaded in {time.perf_counter() - start:.1f} s")
+
+    client = app.app.test_client()
+    cases = [
+        ('Rare identifiers', '/api/observations/search?q=EX-24-0312 OR SOP-EM-001'),
+        ('Rare identifier + filters', '/api/observations/search?q=SOP-EM-001&status=gap&severity=major'),
+        ('Common phrase', '/api/observations/search?q="aseptic operators"'),
+        ('Common term + filters', '/api/observations/search?q=gowning&status=non-compliant&severity=critical'),
+        ('Prefix match', '/api/observations/search?q=investig*&limit=50'),
+        ('Projected results', '/api/observations/search?q=isolator cleaning&fields=id,severity,summary'),
+    ]
+
+    print_section(f"Query latency ({REPEAT} runs each, target < {TARGET_MS} ms)")
+    print(f"  {'query':<28} {'results':>8} {'mean ms':>9} {'p95 ms':>8}")
+    for label, url in cases:
+        count, mean_ms, p95_ms = measure(client, url)
+        flag = '✓' if p95_ms < TARGET_MS else '✗'
+        print(f"  {label:<28} {count:>8} {mean_ms:>9.1f} {p95_ms:>8.1f} {flag}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Benchmark for the observation store
+Compares CRUD latency of the SQLite-backed ObservationStore against the
+previous in-memory list implementation at 10k and 100k observations
+"""
+
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+# Run against a throwaway database; the LLM client only needs placeholder settings
+os.chdir(tempfile.mkdtemp())  # uploads/ and data/ are relative to the working directory
+os.environ['AUDIT_DB_PATH'] = os.path.join(os.getcwd(), 'benchmark.db')
+os.environ.setdefault('DATABRICKS_TOKEN', 'benchmark')
+os.environ.setdefault('DATABRICKS_HOST', 'http://localhost')
+
+import app
+
+SIZES = [10_000, 100_000]
+OPS = 200
+REQUIREMENT_IDS = [f'req_{i:03d}' for i in range(1, 41)]
+
+def print_section(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+def make_observation(observation_id):
+    """Build an observation shaped like the ones create_observation() stores"""
+    requirement = {'id': random.choice(REQUIREMENT_IDS), 'citation': '21 CFR 211.42'}
+    now = datetime.now().isoformat()
+    return {
+        'id': observation_id,
+        'linkedRequirement': requirement,
+        'linkedRequirements': [requirement],
+        'observationText': 'Investigation for EX-24-0312 was not completed within the required timeframe. ' * 3,
+        'complianceStatus': random.choice(['compliant', 'gap', 'non-compliant']),
+        'severity': random.choice(['critical', 'major', 'minor']),
+        'category': random.choice(['Environmental Monitoring', 'Training', 'Documentation']),
+        'evidence': ['EM data review', 'Investigation report'],
+        'metadata': {'location': 'Grade A Filling Room 2', 'timestamp': now, 'lastUpdated': now},
+        'aiAnalysis': {},
+        'followUp': [],
+        'tags': []
+    }
+
+def timed(fn, repeat):
+    """Run fn repeat times and return per-call latencies in microseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1_000_000)
+    return samples
+
+def summarize(samples):
+    return statistics.mean(samples), statistics.median(samples)
+
+def bench_list(size):
+    """The previous implementation: a module-level list scanned with next(...)"""
+    observations_db = [make_observation(f'OBS-{i:03d}') for i in range(1, size + 1)]
+    counter = [size + 1]
+    ids = [obs['id'] for obs in observations_db]
+    results = {}
+
+    def create():
+        observations_db.append(make_observation(f'OBS-{counter[0]:03d}'))
+        counter[0] += 1
+
+    def get():
+        target = random.choice(ids)
+        next((obs for obs in observations_db if obs['id'] == target), None)
+
+    def update():
+        target = random.choice(ids)
+        observation = next((obs for obs in observations_db if obs['id'] == target), None)
+        observation['severity'] = 'major'
+        observation['metadata']['lastUpdated'] = datetime.now().isoformat()
+
+    def filter_by_requirement():
+        [obs for obs in observations_db if (obs.get('linkedRequirement') or {}).get('id') == 'req_007']
+
+    def delete():
+        nonlocal observations_db
+        target = ids.pop(random.randrange(len(ids)))
+        next((obs for obs in observations_db if obs['id'] == target), None)
+        observations_db = [obs for obs in observations_db if obs['id'] != target]
+
+    results['create'] = summarize(timed(create, OPS))
+    results['get'] = summarize(timed(get, OPS))
+    results['update'] = summarize(timed(update, OPS))
+    results['filter'] = summarize(timed(filter_by_requirement, 20))
+    results['delete'] = summarize(timed(delete, OPS))
+    return results
+
+def bench_store(size):
+    """The SQLite-backed ObservationStore"""
+    db = app.get_db()
+    with db:
+        db.execute('DELETE FROM observations')
+        db.execute('DELETE FROM observation_requirements')
+        db.execute('DELETE FROM observation_search')
+        db.execute("DELETE FROM counters WHERE name = 'observation'")
+
+    store = app.observation_store
+    store.rebuild_stats()
+    print(f"  Loading {size:,} observations into SQLite...")
+    ids = [store.create(make_observation)['id'] for _ in range(size)]
+    results = {}
+
+    def get():
+        store.get(random.choice(ids))
+
+    def update():
+        observation = store.get(random.choice(ids))
+        observation['severity'] = 'major'
+        observation['metadata']['lastUpdated'] = datetime.now().isoformat()
+        store.update(observation)
+
+    def filter_by_requirement():
+        store.list(requirement_ids=['req_007'])
+
+    def delete():
+        store.delete(ids.pop(random.randrange(len(ids))))
+
+    results['create'] = summarize(timed(lambda: store.create(make_observation), OPS))
+    results['get'] = summarize(timed(get, OPS))
+    results['update'] = summarize(timed(update, OPS))
+    results['filter'] = summarize(timed(filter_by_requirement, 20))
+    results['delete'] = summarize(timed(delete, OPS))
+    return results
+
+def print_results(size, list_results, store_results):
+    print(f"\n  {size:,} observations (mean / median, microseconds per call)")
+    print(f"  {'operation':<10} {'list (old)':>22} {'sqlite store':>22} {'speedup':>9}")
+    for op in ['create', 'get', 'update', 'filter', 'delete']:
+        list_mean, list_median = list_results[op]
+        store_mean, store_median = store_results[op]
+        print(f"  {op:<10} {list_mean:>11.1f} / {list_median:>8.1f} "
+              f"{store_mean:>11.1f} / {store_median:>8.1f} {list_mean / store_mean:>8.1f}x")
+
+def main():
+    print_section("OBSERVATION STORE BENCHMARK")
+    print(f"Database: {os.environ['AUDIT_DB_PATH']}")
+    print(f"Operations per measurement: {OPS} (filter: 20)")
+
+    random.seed(42)
+    for size in SIZES:
+        print_section(f"{size:,} observations")
+        list_results = bench_list(size)
+        store_results = bench_store(size)
+        print_results(size, list_results, store_results)
+
+    print("\n  'filter' returns every observation linked to one of 40 requirements.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark for segmented transcription of long recordings
+Transcribes a synthetic 10-minute WAV through a local stub Whisper server whose
+latency grows with audio length, comparing one request for the whole file
+against overlapping segments on 1, 2, 4 and 8 workers. The stub "speaks" one
+word per second of audio, so the stitched text can be checked word for word.
+"""
+
+import base64
+import contextlib
+import io
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RECORDING_SECONDS = 600
+SAMPLE_RATE = 16000
+STUB_SECONDS_PER_AUDIO_SECOND = 0.01
+WORKER_COUNTS = [1, 2, 4, 8]
+
+def print_section(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+class StubWhisperHandler(BaseHTTPRequestHandler):
+    """Returns word<n> for each second of audio, where n is that second's sample value"""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        audio = base64.b64decode(json.loads(body)['dataframe_split']['data'][0][0])
+        with wave.open(io.BytesIO(audio), 'rb') as wav:
+            rate = wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+        samples = struct.unpack(f'<{len(frames) // 2}h', frames)
+        words = [f'word{samples[i]}' for i in range(0, len(samples), rate)]
+        time.sleep(len(words) * STUB_SECONDS_PER_AUDIO_SECOND)
+
+        response = json.dumps({'predictions': [' '.join(words)]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+def write_recording(path):
+    """Mono 16-bit WAV whose samples during second n all have the value n"""
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        for second in range(RECORDING_SECONDS):
+            wav.writeframes(struct.pack('<h', second) * SAMPLE_RATE)
+
+def main():
+    print_section("SEGMENTED TRANSCRIPTION BENCHMARK")
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubWhisperHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ['WHISPER_HOST'] = f'http://127.0.0.1:{server.server_address[1]}/invocations'
+    os.chdir(tempfile.mkdtemp())  # uploads/ and data/ are relative to the working directory
+    os.environ['AUDIT_DB_PATH'] = os.path.join(os.getcwd(), 'benchmark.db')
+    os.environ.setdefault('DATABRICKS_TOKEN', 'benchmark')
+    os.environ.setdefault('DATABRICKS_HOST', 'http://localhost')
+    import app
+
+    audio_path = os.path.join(tempfile.mkdtemp(), 'walkthrough.wav')
+    write_recording(audio_path)
+    expected = ' '.join(f'word{n}' for n in range(RECORDING_SECONDS))
+
+    print(f"Recording: {RECORDING_SECONDS // 60} minutes, {os.path.getsize(audio_path) / 1024 / 1024:.1f} MB WAV")
+    print(f"Segments: {app.AUDIO_SEGMENT_SECONDS}s windows, {app.AUDIO_SEGMENT_OVERLAP_SECONDS}s overlap")
+    print(f"Stub latency: {STUB_SECONDS_PER_AUDIO_SECOND * 1000:.0f} ms per second of audio\n")
+    print(f"  {'mode':<24} {'seconds':>8} {'text intact':>12}")
+
+    # app logs every Whisper call; keep the table readable
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        text = app.run_transcribe_audio(audio_path)
+    print(f"  {'single request':<24} {time.perf_counter() - start:>8.2f} {'✓' if text == expected else '✗':>12}")
+
+    for workers in WORKER_COUNTS:
+        app.segment_executor = ThreadPoolExecutor(max_workers=workers)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            text = app.run_transcribe_recording(audio_path)
+        elapsed = time.perf_counter() - start
+        print(f"  {f'segmented, {workers} workers':<24} {elapsed:>8.2f} {'✓' if text == expected else '✗':>12}")
+
+    server.shutdown()
+    os.remove(audio_path)
+
+if __name__ == "__main__":
+    main()
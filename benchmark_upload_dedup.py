@@ -0,0 +1,76 @@
+"""
+Benchmark for de-duplicated upload storage
+Three auditors upload the same set of SOP PDFs under their own titles through
+/api/upload. Reports the time per first and duplicate upload, the bytes
+written to the blob store, and the disk space saved compared with storing
+every upload separately. Also sends one document again as a resumable upload,
+which is de-duplicated when it is committed and its hash verified.
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+import time
+
+from benchmark_document_extraction import make_pdf
+
+# Run against a throwaway database; the LLM client only needs placeholder settings
+os.chdir(tempfile.mkdtemp())  # uploads/ and data/ are relative to the working directory
+os.environ['AUDIT_DB_PATH'] = os.path.join(os.getcwd(), 'benchmark.db')
+os.environ.setdefault('DATABRICKS_TOKEN', 'benchmark')
+os.environ.setdefault('DATABRICKS_HOST', 'http://localhost')
+
+import app
+
+DOCUMENTS = 10
+AUDITORS = 3
+
+def print_section(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}\n")
+
+def main():
+    print_section("UPLOAD DE-DUPLICATION BENCHMARK")
+    documents = [(f'SOP-QA-{i:03d}', make_pdf(i)) for i in range(DOCUMENTS)]
+    print(f"{DOCUMENTS} SOP PDFs ({sum(len(d) for _, d in documents) / (1024 * 1024):.1f} MB), "
+          f"each uploaded by {AUDITORS} auditors\n")
+
+    client = app.app.test_client()
+    timings = {'first': [], 'duplicate': []}
+    for auditor in range(AUDITORS):
+        for name, data in documents:
+            start = time.perf_counter()
+            response = client.post('/api/upload', data={'files': [(io.BytesIO(data), f'{name} (auditor {auditor + 1}).pdf')]},
+                                   content_type='multipart/form-data').get_json()
+            timings['duplicate' if response['duplicates'] else 'first'].append(time.perf_counter() - start)
+
+    print(f"  {'upload':<12} {'count':>6} {'mean ms':>9}")
+    for kind, values in timings.items():
+        print(f"  {kind:<12} {len(values):>6} {sum(values) / len(values) * 1000:>9.1f}")
+
+    name, data = documents[0]
+    start = time.perf_counter()
+    upload = client.post('/api/uploads', json={'filename': f'{name}.pdf', 'size': len(data),
+                                               'sha256': hashlib.sha256(data).hexdigest()}).get_json()['upload']
+    chunk_size = upload['chunkSize']
+    for index in range(upload['chunks']):
+        client.put(f"/api/uploads/{upload['id']}/chunks/{index}", data=data[index * chunk_size:(index + 1) * chunk_size])
+    response = client.post(f"/api/uploads/{upload['id']}/commit").get_json()
+    print(f"\n  Resumable upload of stored content: {(time.perf_counter() - start) * 1000:.1f} ms, "
+          f"chunks sent: {upload['chunks']}, duplicate: {bool(response['duplicates'])}")
+
+    app.document_extractor.wait()
+    stats = app.blob_store.stats()
+    print_section("Disk")
+    print(f"  Documents (references): {stats['references']}, unique contents: {stats['unique_contents']}")
+    print(f"  Without de-duplication: {stats['logical_bytes']:>12,} bytes")
+    print(f"  Stored:                 {stats['stored_bytes']:>12,} bytes")
+    print(f"  Saved:                  {stats['saved_bytes']:>12,} bytes ({stats['saved_ratio']:.0%})")
+    print(f"  Blob writes: {stats['blob_writes']}, duplicate uploads written: 0 of {stats['duplicate_uploads']}")
+    extractions = app.get_db().execute('SELECT COUNT(*) FROM document_text').fetchone()[0]
+    print(f"  Text extractions run: {extractions}")
+
+if __name__ == "__main__":
+    main()
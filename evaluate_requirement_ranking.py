@@ -0,0 +1,210 @@
+"""
+Offline evaluation of requirement ranking for observation analysis
+For each labelled observation, checks whether the expected requirement is
+among the top-k requirements sent to Claude, and how many prompt tokens the
+smaller requirements block saves compared with sending the full list.
+
+Usage:
+  python evaluate_requirement_ranking.py
+  python evaluate_requirement_ranking.py --requirements test_requirements_output.json --cases cases.json
+
+--requirements accepts a generate-requirements response (categories with
+requirements) or a plain list; --cases is a list of
+{"observationText": ..., "expected": "req_007"} objects.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+
+# Run against a throwaway database; the LLM client only needs placeholder settings
+os.environ['AUDIT_DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'evaluation.db')
+os.environ.setdefault('DATABRICKS_TOKEN', 'evaluation')
+os.environ.setdefault('DATABRICKS_HOST', 'http://localhost')
+
+import app
+
+K_VALUES = [3, 5, 10, 15, 20]
+
+def req(req_id, category, citation, text):
+    return {'id': req_id, 'category': category, 'citation': citation, 'risk_level': 'High',
+            'requirement_text': text}
+
+# A representative sterile-manufacturing requirement set
+REQUIREMENTS = [
+    req('req_001', 'Environmental Monitoring', 'EU GMP Annex 1 § 9.4',
+        'A risk-based environmental monitoring programme must cover viable and non-viable particles, '
+        'with sampling locations justified by a documented risk assessment.'),
+    req('req_002', 'Environmental Monitoring', 'EU GMP Annex 1 § 9.26',
+        'When alert or action limits are exceeded, an investigation must be initiated promptly, '
+        'root cause determined and CAPA implemented; excursions must be trended.'),
+    req('req_003', 'Environmental Monitoring', 'EU GMP Annex 1 § 9.19',
+        'Environmental monitoring data must be trended periodically (at least quarterly) to detect adverse trends.'),
+    req('req_004', 'Environmental Monitoring', 'ISO 14644-1',
+        'Cleanrooms must be classified for airborne particle concentration at rest and in operation, '
+        'and requalified at defined intervals.'),
+    req('req_005', 'Environmental Monitoring', 'EU GMP Annex 1 § 4.29',
+        'Differential pressure between rooms of different grades must be monitored continuously, '
+        'with alarms and documented assessment of alarm events.'),
+    req('req_006', 'Gowning', 'EU GMP Annex 1 § 7.12',
+        'Personnel entering Grade A/B areas must be gowning qualified and follow the documented gowning procedure, '
+        'including hand sanitisation and glove disinfection.'),
+    req('req_007', 'Gowning', 'EU GMP Annex 1 § 7.16',
+        'Sterile gowns, goggles and masks must be worn in Grade B; no skin may be exposed; garments must be '
+        'changed at defined intervals.'),
+    req('req_008', 'Training', '21 CFR 211.25',
+        'Personnel must have education, training and experience to perform their assigned functions, '
+        'with training in current good manufacturing practice documented.'),
+    req('req_009', 'Training', 'EU GMP Annex 1 § 7.4',
+        'Operators in aseptic processing must complete aseptic technique training and participate in '
+        'a successful media fill before working unsupervised.'),
+    req('req_010', 'Aseptic Processing', 'EU GMP Annex 1 § 9.32',
+        'Aseptic process simulation (media fill) must be performed twice a year per line, representing '
+        'worst-case conditions and all interventions.'),
+    req('req_011', 'Aseptic Processing', 'EU GMP Annex 1 § 8.16',
+        'Interventions in Grade A must be limited, described in procedures, and performed with '
+        'aseptic technique; corrective interventions must be recorded.'),
+    req('req_012', 'Aseptic Processing', '21 CFR 211.113(b)',
+        'Procedures designed to prevent microbiological contamination of sterile products must be '
+        'established, validated and followed.'),
+    req('req_013', 'Cleaning & Disinfection', 'EU GMP Annex 1 § 4.33',
+        'Cleanrooms must be cleaned and disinfected according to a validated programme with rotation of '
+        'disinfectants including a sporicidal agent; cleaning records must be contemporaneous.'),
+    req('req_014', 'Cleaning & Disinfection', '21 CFR 211.67',
+        'Equipment and utensils must be cleaned, maintained and sanitized at appropriate intervals, '
+        'with written procedures and cleaning logs.'),
+    req('req_015', 'Equipment', '21 CFR 211.68',
+        'Automatic and electronic equipment must be routinely calibrated, inspected or checked according '
+        'to a written program.'),
+    req('req_016', 'Equipment', 'EU GMP Annex 1 § 5.20',
+        'Isolator and RABS glove integrity must be tested before and after each batch, with leak testing '
+        'at defined intervals; gloves must be replaced if breached.'),
+    req('req_017', 'Equipment', '21 CFR 211.63',
+        'Equipment must be of appropriate design and size, and gaskets, seals and product-contact parts '
+        'maintained in good condition.'),
+    req('req_018', 'Sterilisation', 'EU GMP Annex 1 § 8.34',
+        'Sterilisation processes (autoclave, dry heat) must be validated, with load patterns defined and '
+        'cycle records reviewed before release.'),
+    req('req_019', 'Sterilisation', 'EU GMP Annex 1 § 8.87',
+        'Sterilising filters must be integrity tested before and after use (pre-use post-sterilisation '
+        'integrity test) and results recorded.'),
+    req('req_020', 'Documentation', '21 CFR 211.188',
+        'Batch production records must be complete, with each significant step documented, signed and '
+        'dated by the person performing and checking it.'),
+    req('req_021', 'Documentation', 'EU GMP Chapter 4 § 4.8',
+        'Records must be made at the time each action is taken; corrections must be signed, dated and '
+        'leave the original entry legible (ALCOA+).'),
+    req('req_022', 'Documentation', '21 CFR Part 11',
+        'Computerised systems must have audit trails, unique user accounts and controlled access; '
+        'audit trails must be reviewed.'),
+    req('req_023', 'Deviations & CAPA', '21 CFR 211.192',
+        'Unexplained discrepancies and failures must be thoroughly investigated, with conclusions and '
+        'follow-up documented, and extended to other batches.'),
+    req('req_024', 'Deviations & CAPA', 'ICH Q10 § 3.2.2',
+        'A CAPA system must address root causes of deviations, complaints and audit findings and verify '
+        'the effectiveness of actions taken.'),
+    req('req_025', 'Materials', 'EU GMP Annex 1 § 4.10',
+        'Materials entering Grade A/B must be transferred through pass-through hatches or airlocks with '
+        'a validated decontamination step.'),
+    req('req_026', 'Materials', '21 CFR 211.84',
+        'Components must be sampled, tested and released by the quality unit before use; quarantine '
+        'status must be controlled.'),
+    req('req_027', 'Water Systems', 'EU GMP Annex 1 § 6.10',
+        'Water for injection systems must be monitored for TOC, conductivity and endotoxin, with '
+        'microbial alert and action limits.'),
+    req('req_028', 'Utilities', 'EU GMP Annex 1 § 6.18',
+        'Compressed gases in contact with product must be filtered through sterilising filters and '
+        'monitored for particles and microbial contamination.'),
+    req('req_029', 'Change Control', 'ICH Q10 § 3.2.3',
+        'Changes to facilities, equipment and processes must be assessed, approved and documented through '
+        'change control before implementation.'),
+    req('req_030', 'Quality Oversight', '21 CFR 211.22',
+        'The quality control unit must have authority to approve or reject procedures, specifications and '
+        'batches, and review production records.'),
+]
+
+CASES = [
+    ('Investigation for EM excursion EX-24-0312 was not completed within 48 hours and no CAPA was raised.', 'req_002'),
+    ('No trending report for environmental monitoring data found for Q1 2024; last trend was Q4 2023.', 'req_003'),
+    ('Operator entered Grade B without sanitizing hands before donning gloves.', 'req_006'),
+    ('Operator in Grade B had exposed skin at the wrist between glove and gown sleeve.', 'req_007'),
+    ('Two operators on the filling line had not completed a media fill before working alone.', 'req_009'),
+    ('Last media fill for line 2 was 9 months ago; only one aseptic process simulation this year.', 'req_010'),
+    ('Unrecorded corrective intervention in Grade A to clear a stopper jam.', 'req_011'),
+    ('Cleaning log for the isolator room was filled in after the batch started; sporicidal agent not used in rotation.', 'req_013'),
+    ('Pressure gauge on the filling machine overdue for calibration by 3 months.', 'req_015'),
+    ('Glove integrity test on the isolator not performed after batch 24-118.', 'req_016'),
+    ('Gasket on the filling line nozzle manifold is cracked and discoloured.', 'req_017'),
+    ('Autoclave load pattern used was not one of the validated loads.', 'req_018'),
+    ('Sterilizing filter integrity test after filtration missing from batch record.', 'req_019'),
+    ('Batch record step 14 was not signed by the checker.', 'req_020'),
+    ('Correction fluid used on a logbook entry; original value not legible.', 'req_021'),
+    ('Shared login used on the EM software; audit trail never reviewed.', 'req_022'),
+    ('OOS result for bioburden closed without extending the investigation to other batches.', 'req_023'),
+    ('CAPA effectiveness checks not performed for recurring deviations.', 'req_024'),
+    ('Material transferred into Grade B through the airlock without wiping with disinfectant.', 'req_025'),
+    ('WFI conductivity alarm at point of use 3 with no documented assessment.', 'req_027'),
+    ('Nitrogen used for blanketing not monitored for particles at point of use.', 'req_028'),
+    ('New filling nozzle design installed without a change control record.', 'req_029'),
+    ('Differential pressure alarm between Grade B and C acknowledged without assessment.', 'req_005'),
+    ('Cleanroom classification for the filling room is overdue for requalification.', 'req_004'),
+]
+
+def load_requirements(path):
+    with open(path) as f:
+        data = json.load(f)
+    if isinstance(data, dict) and 'categories' in data:
+        return [r for category in data['categories'] for r in category.get('requirements', [])]
+    return data.get('requirements', data) if isinstance(data, dict) else data
+
+def load_cases(path):
+    with open(path) as f:
+        return [(case['observationText'], case['expected']) for case in json.load(f)]
+
+def prompt_tokens(observation_text, requirements):
+    """Estimated token count of the analysis prompt"""
+    return app.estimate_tokens(app.build_observation_analysis_prompt(observation_text, '', '', requirements))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requirements', help='JSON file with the requirement set')
+    parser.add_argument('--cases', help='JSON file with labelled observations')
+    args = parser.parse_args()
+
+    requirements = load_requirements(args.requirements) if args.requirements else REQUIREMENTS
+    cases = load_cases(args.cases) if args.cases else CASES
+
+    print(f"\n{'='*60}")
+    print("  REQUIREMENT RANKING EVALUATION")
+    print(f"{'='*60}\n")
+    print(f"Requirements: {len(requirements)}, labelled observations: {len(cases)}\n")
+
+    full_tokens = sum(prompt_tokens(text, requirements) for text, _ in cases) / len(cases)
+    print(f"  {'k':>3} {'recall@k':>9} {'MRR':>6} {'avg prompt tokens':>18} {'reduction':>10}")
+    print(f"  {'all':>3} {1.0:>9.2f} {'':>6} {full_tokens:>18,.0f} {'':>10}")
+
+    misses = {}
+    for k in K_VALUES:
+        hits, reciprocal_rank, tokens = 0, 0.0, 0
+        for text, expected in cases:
+            selected, _ = app.select_relevant_requirements(requirements, text, k)
+            ids = [r['id'] for r in selected]
+            if expected in ids:
+                hits += 1
+                reciprocal_rank += 1 / (ids.index(expected) + 1)
+            else:
+                misses.setdefault(k, []).append((text, expected, ids[:3]))
+            tokens += prompt_tokens(text, selected)
+        avg_tokens = tokens / len(cases)
+        print(f"  {k:>3} {hits / len(cases):>9.2f} {reciprocal_rank / len(cases):>6.2f} "
+              f"{avg_tokens:>18,.0f} {1 - avg_tokens / full_tokens:>10.0%}")
+
+    k = app.ANALYSIS_REQUIREMENTS_TOP_K
+    if misses.get(k):
+        print(f"\n  Misses at the configured k={k}:")
+        for text, expected, top in misses[k]:
+            print(f"    expected {expected}, top 3 {top}: {text[:70]}")
+
+if __name__ == "__main__":
+    main()
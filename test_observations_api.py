@@ -5,6 +5,7 @@ Demonstrates creating and managing fieldwork observations
 
 import requests
 import json
+import uuid
 from datetime import datetime
 
 API_BASE = "http://localhost:5000/api"
@@ -137,7 +138,8 @@ def test_get_stats():
     """Get observation statistics"""
     print_section("4. Observation Statistics")
     
-    response = requests.get(f"{API_BASE}/observations/stats")
+    # verify=true also recomputes the stats from scratch and compares with the counters
+    response = requests.get(f"{API_BASE}/observations/stats?verify=true")
     data = response.json()
     
     if data['success']:
@@ -155,6 +157,12 @@ def test_get_stats():
         print(f"  🟡 Minor:    {stats['by_severity']['minor']}")
         
         print(f"\nTotal Evidence Items: {stats['total_evidence']}")
+        
+        if data['consistency']['consistent']:
+            print("\n✓ Incremental counters match a full recount")
+        else:
+            print("\n✗ Incremental counters differ from a full recount")
+            print(f"  Recomputed: {data['consistency']['recomputed']}")
     else:
         print("✗ Failed to retrieve stats")
 
@@ -184,6 +192,58 @@ def test_get_by_requirement():
     else:
         print("✗ Failed to retrieve observations")
 
+def test_search():
+    """Full-text search across observation text and transcriptions"""
+    print_section("5b. Searching Observations (EX-24-0312 OR SOP-EM-001)")
+    
+    response = requests.get(f"{API_BASE}/observations/search",
+                            params={"q": "EX-24-0312 OR SOP-EM-001", "fields": "id,complianceStatus"})
+    data = response.json()
+    
+    if data['success']:
+        print(f"✓ Found {len(data['results'])} matches in {data['tookMs']} ms\n")
+        for result in data['results']:
+            print(f"  {result['observation']['id']} (score {result['score']})")
+            print(f"    {result['snippet']}")
+            print()
+    else:
+        print(f"✗ Search failed: {data['error']}")
+
+def test_search_ranks_all_matches():
+    """An older observation that matches better ranks above thousands of newer weak matches"""
+    print_section("5c. Search Ranking Across All Matches")
+    
+    # A fresh tag per run stands in for the search term, so earlier runs cannot change its ranking
+    tag = f"gasket{uuid.uuid4().hex[:8]}"
+    response = requests.post(f"{API_BASE}/observations", json={
+        "observationText": f"Isolator door {tag} torn; second {tag} worn; {tag} log overdue.",
+        "complianceStatus": "non-compliant",
+        "severity": "major"
+    })
+    if response.status_code != 201:
+        print(f"✗ Failed to create observation: {response.status_code} {response.text}")
+        return
+    best_id = response.json()['observation']['id']
+    
+    for batch in range(5):
+        operations = [{"op": "create", "data": {
+            "observationText": f"Filler note {batch}-{i}: gasket inspected during line walkdown {tag}.",
+            "complianceStatus": "compliant",
+            "severity": "minor"
+        }} for i in range(500)]
+        response = requests.post(f"{API_BASE}/observations/bulk", json={"operations": operations})
+        if response.status_code != 200:
+            print(f"✗ Bulk create failed: {response.status_code} {response.text}")
+            return
+    
+    data = requests.get(f"{API_BASE}/observations/search",
+                        params={"q": tag, "limit": 5, "fields": "id"}).json()
+    ids = [result['observation']['id'] for result in data.get('results', [])]
+    if ids and ids[0] == best_id:
+        print(f"✓ {best_id} ranks first above 2,500 newer matches")
+    else:
+        print(f"✗ Expected {best_id} first, got {ids}")
+
 def test_get_specific(obs_id):
     """Get specific observation"""
     print_section(f"6. Getting Specific Observation ({obs_id})")
@@ -209,6 +269,94 @@ def test_get_specific(obs_id):
     else:
         print(f"✗ Observation not found: {obs_id}")
 
+def test_string_linked_requirement():
+    """Create an observation whose linkedRequirement is a plain id string"""
+    print_section("8. Requirement Linked by Id String")
+    
+    response = requests.post(f"{API_BASE}/observations", json={
+        "linkedRequirement": "req_009",
+        "observationText": "Two operators on the filling line had not completed a media fill before working alone.",
+        "complianceStatus": "gap",
+        "severity": "major",
+        "location": "Filling Line 2"
+    })
+    if response.status_code != 201:
+        print(f"✗ Failed to create observation: {response.status_code} {response.text}")
+        return
+    obs_id = response.json()['observation']['id']
+    
+    data = requests.get(f"{API_BASE}/observations?requirement_id=req_009").json()
+    if obs_id in [obs['id'] for obs in data.get('observations', [])]:
+        print(f"✓ Created {obs_id} and found it under req_009")
+    else:
+        print(f"✗ {obs_id} not returned for requirement_id=req_009")
+
+def test_sort_by_severity():
+    """sort=severity&order=desc lists critical, then major, then minor across cursor pages"""
+    print_section("7b. Sorting by Severity (desc)")
+    
+    severities = []
+    params = {"sort": "severity", "order": "desc", "limit": 500, "fields": "id,severity"}
+    while True:
+        data = requests.get(f"{API_BASE}/observations", params=params).json()
+        if not data.get('success'):
+            print(f"✗ Listing failed: {data.get('error')}")
+            return
+        severities.extend(obs['severity'] for obs in data['observations'])
+        if not data.get('nextCursor'):
+            break
+        params['after'] = data['nextCursor']
+    
+    expected = ['critical', 'major', 'minor']
+    order = [severity for i, severity in enumerate(severities) if i == 0 or severity != severities[i - 1]]
+    known = [severity for severity in order if severity in expected]
+    if known == sorted(set(known), key=expected.index) and len(known) == len(set(known)):
+        print(f"✓ {len(severities)} observations in order: {' → '.join(order)}")
+    else:
+        print(f"✗ Unexpected severity order: {' → '.join(order)}")
+
+def test_bulk_sync(obs_id):
+    """Create and update observations in one bulk request (offline sync)"""
+    print_section("7. Bulk Sync (create + update in one request)")
+    
+    operations = [
+        {
+            "op": "create",
+            "data": {
+                "linkedRequirement": {"id": "req_002", "citation": "FDA 21 CFR 211.25"},
+                "observationText": f"Offline note {i}: gowning qualification record checked for operator {i}.",
+                "complianceStatus": "compliant",
+                "severity": "minor",
+                "location": "Gowning Room"
+            }
+        }
+        for i in range(1, 6)
+    ]
+    operations.append({"op": "update", "id": obs_id, "data": {"severity": "critical"}})
+    
+    response = requests.post(f"{API_BASE}/observations/bulk", json={"operations": operations})
+    data = response.json()
+    
+    if data['success']:
+        print(f"✓ Created: {data['created']}, Updated: {data['updated']}")
+        created = [r['id'] for r in data['results'] if r['status'] == 'created']
+        print(f"  New ids: {created[0]} .. {created[-1]}")
+    else:
+        print(f"✗ Bulk sync failed: {data['error']}")
+        return
+    
+    # A failing operation rolls back the whole batch
+    response = requests.post(f"{API_BASE}/observations/bulk", json={"operations": [
+        {"op": "create", "data": {"observationText": "Should be rolled back"}},
+        {"op": "update", "id": "OBS-DOES-NOT-EXIST", "data": {}}
+    ]})
+    data = response.json()
+    statuses = [r['status'] for r in data.get('results', [])]
+    if response.status_code == 400 and statuses == ['rolled_back', 'failed']:
+        print("✓ Failed batch was rolled back atomically")
+    else:
+        print(f"✗ Unexpected result for failing batch: {response.status_code} {statuses}")
+
 def main():
     print("\n" + "="*60)
     print("  FIELDWORK OBSERVATIONS API - TEST SUITE")
@@ -232,10 +380,24 @@ def main():
         # Get by requirement
         test_get_by_requirement()
         
+        # Full-text search
+        test_search()
+        test_search_ranks_all_matches()
+        
         # Get specific observation
         if created_ids:
             test_get_specific(created_ids[0])
         
+        # Bulk create/update
+        if created_ids:
+            test_bulk_sync(created_ids[0])
+        
+        # Severity sorts by rank, not alphabetically
+        test_sort_by_severity()
+        
+        # Legacy string form of linkedRequirement
+        test_string_linked_requirement()
+        
         print_section("✓ All Tests Completed Successfully!")
         
         print("\n📊 Summary:")
@@ -0,0 +1,9 @@
+"""
+WSGI entry point for production servers, e.g. `waitress-serve wsgi:app`
+Starts the background services that `python app.py` starts for the
+development server; importing app.py on its own does not.
+"""
+
+from app import app, init_background_services
+
+init_background_services()